@@ -0,0 +1,87 @@
+import time
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+import draft_model
+import evaluation
+import player_model
+from design import DesignMatrixBuilder
+
+def game_windows(game_dates, freq="7D", train_days=None, min_train_games=1_000):
+    """(start, train, test) of consecutive windows of length freq, in date order.
+    freq is any pandas frequency, fixed like "7D" or calendar like "W" or "MS",
+    whose windows start on the first game's day or the period holding it.
+    Each window's games are the test set, the train set is every earlier game, or
+    those of the train_days before the window. Windows with fewer than
+    min_train_games to train on, or no games, are skipped"""
+    game_dates = pd.to_datetime(pd.Series(game_dates)).to_numpy()
+    offset = to_offset(freq)
+    first = offset.rollback(pd.Timestamp(game_dates.min()).normalize())
+    windows = []
+    for start in pd.date_range(first, game_dates.max(), freq=offset):
+        end = start + offset
+        train_start = start - pd.Timedelta(days=train_days) if train_days else game_dates.min()
+        train = np.flatnonzero((game_dates < start.to_datetime64())
+                               & (game_dates >= np.datetime64(train_start)))
+        test = np.flatnonzero((game_dates >= start.to_datetime64())
+                              & (game_dates < end.to_datetime64()))
+        if len(train) >= min_train_games and len(test):
+            windows.append((start, train, test))
+    return windows
+
+def walk_forward(match_data, freq="7D", train_days=None, min_train_games=1_000, n_clusters=7,
+                 seed=0, sparse=False, warm_start=True, champion_mapping=None):
+    """Backtest retraining every freq: order the games by date and, for each window,
+    refit the six lane models, the draft clustering and both win models on the
+    games before it and score them on the games in it, see game_windows.
+
+    With warm_start every fit starts from the previous window's coefficients, and
+    KMeans from its centroids, so cluster labels stay stable across windows. The
+    post draft model is fitted dense, as in run_pipeline and evaluate_models,
+    unless sparse.
+
+    Returns a tidy frame with one row per window, model and metric, and the
+    window's train and test games and fit seconds"""
+
+    if champion_mapping is None:
+        champion_mapping = draft_model.load_champion_mapping()
+    player_model.calculate_positional_differences(match_data)
+    drafts = draft_model.reduce_team_drafts(match_data, draft_model.ChampionTable(champion_mapping))
+    pairs = evaluation.paired_games(match_data)
+    columns = evaluation.model_data_columns()
+    data = pd.DataFrame(evaluation.fill_model_data(
+        np.empty((len(match_data), len(columns)), order="F"), match_data, drafts, columns),
+        columns=columns, copy=False)
+    design = DesignMatrixBuilder(data)
+
+    game_dates = pd.to_datetime(match_data["date"]).to_numpy()[pairs[:, 0]]
+    warm = {} if warm_start else None
+    rows = []
+    for start, train, test in game_windows(game_dates, freq, train_days, min_train_games):
+        began = time.perf_counter()
+        scores = evaluation.evaluate_split(data, design, pairs, train, test, n_clusters, seed,
+                                           sparse, warm)
+        seconds = time.perf_counter() - began
+        rows += [(start, len(train), len(test), seconds, model, metric, value)
+                 for model, metrics in scores.items() for metric, value in metrics.items()]
+    return pd.DataFrame(rows, columns=["window", "train_games", "test_games", "seconds",
+                                       "model", "metric", "value"])
+
+def compare_warm_start(match_data, **kwargs):
+    """Run walk_forward cold and warm started. Returns the warm started scores
+    and a report of the total fit seconds and mean solver iterations per window
+    of each model, cold against warm, with the speedup"""
+
+    results = {mode: walk_forward(match_data.copy(), warm_start=mode == "warm", **kwargs)
+               for mode in ["cold", "warm"]}
+    report = {}
+    for mode, scores in results.items():
+        windows = scores.drop_duplicates("window")
+        iterations = scores[scores["metric"] == "iterations"].groupby("model")["value"].mean()
+        report[mode] = pd.concat([pd.Series({"seconds": windows["seconds"].sum()}),
+                                  iterations.rename(lambda model: f"{model} iterations")])
+    report = pd.DataFrame(report)
+    report["speedup"] = report["cold"] / report["warm"]
+    return results["warm"], report
@@ -0,0 +1,880 @@
+"""Performance benchmarks for the draft analysis pipeline.
+
+Run a benchmark with `python benchmark.py <name>`, or `python benchmark.py --help`
+to list them. The Oracle's Elixir data is not shipped with the repo, so the
+benchmarks generate random games from data/champion_roles.csv.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+import statsmodels.formula.api as smf
+from sklearn.model_selection import train_test_split as tts
+
+import backtest
+import draft_model
+import evaluation
+import final_model
+import incremental
+import instrument
+import model_analysis
+import model_store
+import pipeline
+import player_model
+import rollups
+import util
+import what_if
+from instrument import peak_rss_mb, reset_peak_rss
+from synthetic_data import random_games, random_match_data, write_match_csvs, write_synthetic_data
+
+
+def legacy_reduce_team_drafts(oracles_data, champ_map):
+    """The original iterrows/concat implementation, kept as a reference"""
+    draft_df = pd.DataFrame()
+    for _, row in oracles_data.iterrows():
+        blank_row = draft_model.get_blank_row()
+        for role in draft_model.ROLES:
+            draft_model.add_champ_to_blank_row(blank_row, champ_map[row[f"{role}_champion"]])
+        blank_row["id"] = row.id
+        if blank_row["ap"] == 0 or blank_row["ad"] == 0:
+            blank_row["no_damage_type"] = 1
+        draft_df = pd.concat([draft_df, pd.DataFrame.from_dict([blank_row])], ignore_index=True, axis=0, join='outer')
+    return draft_df
+
+
+def legacy_merge_team_and_draft(match_data, draft_data, n_clusters=7):
+    """The original get_dummies and per-game scan implementation, kept as a reference"""
+    combined = match_data.merge(draft_data, how='inner', on='id')
+
+    # Games are laid out as 
+    # teamname   opp
+    # team1      team2
+    # team2      team1
+    # This is a slighly hacky way to exploit this to generate a column for the 
+    # opponent composition per game 
+    combined['opp_comp_poss_1'] = combined['team_comp'].shift(1)
+    combined['opp_comp_poss_2'] = combined['team_comp'].shift(-1)
+    combined['opp_poss_1'] = combined['teamname'].shift(1)
+    combined['opp_poss_2'] = combined['teamname'].shift(-1)
+    combined['opp_comp'] = np.where(
+    combined['opp_poss_1'] == combined['opponent'],
+    combined['opp_comp_poss_1'], -1)
+    combined['opp_comp'] = np.where(
+    combined['opp_poss_2'] == combined['opponent'],
+    combined['opp_comp_poss_2'], combined['opp_comp']).astype(int)
+    
+    combined = pd.get_dummies(combined,
+                                columns=['team_comp', 'opp_comp'])
+
+    list_of_comp_diffs = []
+    for i in range(n_clusters):
+        for j in range(n_clusters):
+            list_of_comp_diffs.append(f'team_comp{i}_v_opp_comp{j}')
+            combined[f'team_comp{i}_v_opp_comp{j}'] = np.where(
+                (combined[f'team_comp_{i}'] == 1) & (
+                        combined[f'opp_comp_{j}'] == 1), 1, 0)
+            if i != j:
+                combined[f'team_comp{i}_v_opp_comp{j}'] = np.where(
+                    (combined[f'opp_comp_{i}'] == 1) & (
+                            combined[f'team_comp_{j}'] == 1), -1,
+                    combined[f'team_comp{i}_v_opp_comp{j}'])
+
+    # Cleaning some bad data in the original Oracles dataset
+
+    with warnings.catch_warnings():
+        warnings.simplefilter(action='ignore', category=FutureWarning)
+        bad_games = combined.groupby('gameid').sum()
+
+    list_of_bad_games = []
+    for i in list_of_comp_diffs:
+        for j in bad_games.index:
+            if bad_games.at[j, i] not in [0, 2]:
+                list_of_bad_games.append(j)
+    combined = combined[
+        ~combined['gameid'].isin(list_of_bad_games)]
+
+    required_columns = ["gameid", "teamname", "opponent", "date", "league", "result",
+    "bot_lead_at_15", "mid_lead_at_15", "top_lead_at_15",
+    "side", "elo_diff","draft_agnostic_bot_lead_prob", "draft_agnostic_mid_lead_prob", 
+    "draft_agnostic_top_lead_prob", "post_draft_bot_lead_prob",  "post_draft_mid_lead_prob", 
+    "post_draft_top_lead_prob"]
+    for i in range(n_clusters):
+        for j in range(n_clusters):
+            required_columns.append(f'team_comp{i}_v_opp_comp{j}')
+
+    return combined[required_columns], list_of_comp_diffs
+
+
+
+def random_merge_inputs(n_games, n_clusters=7, seed=0, broken=True):
+    """Match data and clustered drafts for merge_team_and_draft. With broken, a few
+    games have a renamed opponent, a missing side or a duplicated row. Without,
+    team names are unique per game, so adjacent games never share a team"""
+    rng = np.random.default_rng(seed)
+    champ_map = draft_model.load_champion_mapping()
+    match_data = random_games(n_games, champ_map, seed)
+    for name in ["draft_agnostic", "post_draft"]:
+        for lane in ["top", "mid", "bot"]:
+            match_data[f"{name}_{lane}_lead_prob"] = rng.random(len(match_data))
+
+    if broken:
+        rows = rng.choice(len(match_data), size=max(3, n_games // 100), replace=False)
+        match_data.loc[rows[0::3], "opponent"] = "Unknown"
+        match_data = pd.concat([match_data.drop(index=rows[1::3]),
+                                match_data.loc[rows[2::3]]]).sort_index(kind="stable")
+    else:
+        match_data["teamname"] = match_data["gameid"] + " " + match_data["teamname"]
+        match_data["opponent"] = match_data["gameid"] + " " + match_data["opponent"]
+
+    draft_data = draft_model.reduce_team_drafts(match_data.drop_duplicates("id"), champ_map)
+    draft_data["team_comp"] = rng.integers(n_clusters, size=len(draft_data))
+    return match_data.reset_index(drop=True), draft_data
+
+
+def time_call(func, *args, repeat=3, **kwargs):
+    """Best wall time of `repeat` calls, in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_reduce_team_drafts(sizes=(10_000, 100_000, 1_000_000)):
+    """Vectorised reduce_team_drafts should scale linearly with the number of rows"""
+    champ_map = draft_model.load_champion_mapping()
+
+    sample = random_match_data(2_000, champ_map)
+    pd.testing.assert_frame_equal(draft_model.reduce_team_drafts(sample, champ_map),
+                                  legacy_reduce_team_drafts(sample, champ_map).astype(np.int64))
+    legacy = time_call(legacy_reduce_team_drafts, sample, champ_map, repeat=1)
+    print(f"legacy iterrows/concat: {sample.shape[0]:>9} rows {legacy:8.3f}s")
+
+    for n_rows in sizes:
+        match_data = random_match_data(n_rows, champ_map)
+        seconds = time_call(draft_model.reduce_team_drafts, match_data, champ_map)
+        print(f"reduce_team_drafts:     {n_rows:>9} rows {seconds:8.3f}s "
+              f"{1e9 * seconds / n_rows:8.1f} ns/row")
+
+
+def bench_model_bundle_cold_start(n_games=10_000):
+    """Loading a saved bundle against refitting, and bit-for-bit equal predictions"""
+    champ_map = draft_model.load_champion_mapping()
+    match_data = random_games(n_games, champ_map)
+
+    start = time.perf_counter()
+    _, fitted = pipeline.run_pipeline(match_data, champ_map)
+    print(f"fit pipeline:            {time.perf_counter() - start:8.3f}s")
+
+    n_drafts = 1000
+    champions = match_data[[f"{role}_champion" for role in draft_model.ROLES]].to_numpy()
+    blue, red = champions[0:2 * n_drafts:2], champions[1:2 * n_drafts:2]
+    difs = {role: np.linspace(-1, 1, n_drafts) for role in draft_model.ROLES}
+
+    with tempfile.TemporaryDirectory() as path:
+        start = time.perf_counter()
+        model_store.save_bundle(path, fitted)
+        print(f"save bundle:             {time.perf_counter() - start:8.3f}s")
+
+        start = time.perf_counter()
+        bundle = model_store.load_bundle(path)
+        print(f"open bundle (manifest):  {time.perf_counter() - start:8.3f}s")
+        start = time.perf_counter()
+        bundle.clusters
+        print(f"load clusters only:      {time.perf_counter() - start:8.3f}s")
+        start = time.perf_counter()
+        reloaded = bundle.scorer()
+        reloaded.score(blue[0], red[0], {role: 0.0 for role in draft_model.ROLES})
+        print(f"load all + first score:  {time.perf_counter() - start:8.3f}s")
+        print(f"bundle size:             {sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 1e3:8.1f}kB")
+
+    expected = fitted.score_batch(blue, red, difs)
+    actual = reloaded.score_batch(blue, red, difs)
+    for key in expected:
+        assert np.array_equal(expected[key], actual[key]), key
+    print(f"reloaded predictions identical on {n_drafts} drafts")
+
+
+def bench_merge_team_and_draft(legacy_sizes=(2_000, 10_000), sizes=(10_000, 100_000, 1_000_000)):
+    """Matrix matchup construction, gameid pairing and bad game scan against the
+    original adjacency and per-game loops"""
+    for n_games in legacy_sizes:
+        match_data, draft_data = random_merge_inputs(n_games, broken=False)
+        start = time.perf_counter()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", pd.errors.PerformanceWarning)
+            expected = legacy_merge_team_and_draft(match_data, draft_data)
+        legacy = time.perf_counter() - start
+        start = time.perf_counter()
+        actual = util.merge_team_and_draft(match_data, draft_data)
+        seconds = time.perf_counter() - start
+        pd.testing.assert_frame_equal(actual[0], expected[0])
+        assert actual[1] == expected[1]
+        print(f"{n_games:>9} games: legacy {legacy:8.3f}s  matrix {seconds:8.3f}s  "
+              f"same {len(actual[0])} rows kept")
+
+    # On broken data the adjacency pairing of the legacy version keeps different
+    # games, but the games both versions keep are merged the same way
+    match_data, draft_data = random_merge_inputs(legacy_sizes[0], broken=True)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        expected = legacy_merge_team_and_draft(match_data, draft_data)[0]
+        actual = util.merge_team_and_draft(match_data, draft_data)[0]
+    both = np.intersect1d(expected["gameid"].unique(), actual["gameid"].unique())
+    pd.testing.assert_frame_equal(actual[actual["gameid"].isin(both)],
+                                  expected[expected["gameid"].isin(both)])
+    print(f"broken data: legacy keeps {expected['gameid'].nunique()} games, matrix "
+          f"{actual['gameid'].nunique()}, the {len(both)} kept by both are the same")
+
+    # Pairing by gameid gives the same games in any row order or sharding
+    match_data, draft_data = random_merge_inputs(legacy_sizes[0])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        expected, _, dropped = util.merge_team_and_draft(match_data, draft_data, return_report=True)
+        shuffled = util.merge_team_and_draft(match_data.sample(frac=1, random_state=0), draft_data)[0]
+        sharded = pd.concat([util.merge_team_and_draft(shard, draft_data)[0]
+                             for shard in util.shard_by_game(match_data, 4)])
+    def by_game(merged):
+        return merged.sort_values(["gameid", "teamname"]).reset_index(drop=True)
+    for other in [shuffled, sharded]:
+        pd.testing.assert_frame_equal(by_game(other), by_game(expected))
+    print(f"shuffled and sharded merges match, {len(dropped)} malformed games reported:")
+    print(dropped["reason"].value_counts().to_string())
+
+    for n_games in sizes:
+        match_data, draft_data = random_merge_inputs(n_games)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            seconds = time_call(util.merge_team_and_draft, match_data, draft_data, repeat=1)
+        print(f"{n_games:>9} games: matrix {seconds:8.3f}s")
+        del match_data, draft_data
+
+
+def bench_incremental_update(n_fit_games=5_000, history_sizes=(10_000, 100_000, 300_000),
+                             n_new_games=1_000):
+    """Ingesting a week of games should cost the same however long the history is"""
+    champ_map = draft_model.load_champion_mapping()
+    match_data = random_games(n_fit_games + max(history_sizes) + n_new_games, champ_map)
+    games = match_data["gameid"].astype(int)
+
+    with tempfile.TemporaryDirectory() as path:
+        store_path, bundle_path = os.path.join(path, "store"), os.path.join(path, "bundle")
+        start = time.perf_counter()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            incremental.update_match_store(match_data[games < n_fit_games], store_path,
+                                           bundle_path, refit=True)
+        print(f"full refit on {n_fit_games} games: {time.perf_counter() - start:8.3f}s")
+
+        stored = n_fit_games
+        for history in history_sizes:
+            incremental.update_match_store(match_data[(games >= stored) & (games < history)],
+                                           store_path, bundle_path)
+            stored = history
+            week = match_data[(games >= stored) & (games < stored + n_new_games)]
+            start = time.perf_counter()
+            incremental.update_match_store(week, store_path, bundle_path)
+            seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            repeated = incremental.update_match_store(week, store_path, bundle_path)
+            print(f"{n_new_games} new games on {history:>7} stored: {seconds:8.3f}s, "
+                  f"re-ingesting them {time.perf_counter() - start:6.3f}s ({len(repeated)} rows added)")
+            stored += n_new_games
+
+
+MEASURE_LOAD = """
+import time
+import timeit
+import benchmark, util
+start = time.perf_counter()
+match_data = {load}
+seconds = time.perf_counter() - start
+print(seconds, benchmark.peak_rss_mb(), match_data.memory_usage(deep=True).sum() / 1e6, len(match_data))
+"""
+
+
+
+def bench_match_store(sizes=(100_000, 400_000)):
+    """Load time and peak RSS of the two CSV merge against the columnar store, each
+    measured in a fresh process"""
+    champ_map = draft_model.load_champion_mapping()
+    baseline = subprocess.run([sys.executable, "-c", MEASURE_LOAD.format(load="util.pd.DataFrame()")],
+                              capture_output=True, text=True, check=True).stdout.split()
+    print(f"interpreter with imports: peak RSS {float(baseline[1]):8.1f}MB")
+
+    for n_games in sizes:
+        with tempfile.TemporaryDirectory() as path:
+            oracles_path, player_path = write_match_csvs(random_games(n_games, champ_map), path)
+            store_path = os.path.join(path, "store")
+            start = time.perf_counter()
+            util.ingest_match_data(store_path, oracles_path, player_path)
+            print(f"{n_games} games, ingest once: {time.perf_counter() - start:8.3f}s")
+
+            loads = {
+                "two CSVs + merge": f"util.read_match_csvs({oracles_path!r}, {player_path!r})",
+                "store, all columns": f"util.load_match_data(store_path={store_path!r})",
+                "store, LCS since 2021, 4 columns": (
+                    f"util.load_match_data(['teamname', 'date', 'league', 'result'], league='LCS', "
+                    f"start_date='2021-01-01', store_path={store_path!r})"),
+            }
+            for name, load in loads.items():
+                seconds, peak, frame, rows = subprocess.run(
+                    [sys.executable, "-c", MEASURE_LOAD.format(load=load)],
+                    capture_output=True, text=True, check=True).stdout.split()
+                print(f"  {name:<34} {float(seconds):8.3f}s  peak RSS {float(peak):8.1f}MB  "
+                      f"frame {float(frame):8.1f}MB  {rows:>8} rows")
+
+
+def bench_parallel_lane_models(n_games=50_000, max_jobs=None):
+    """Fitting all six lane models serially against a process pool of 1..N workers"""
+    match_data = random_games(n_games, draft_model.load_champion_mapping())
+    player_model.calculate_positional_differences(match_data)
+
+    start = time.perf_counter()
+    serial = {}
+    for use_draft in [False, True]:
+        _, serial[player_model.model_name(use_draft)] = player_model.fit_player_model(
+            match_data, use_draft, return_models=True)
+    serial_seconds = time.perf_counter() - start
+    print(f"serial fit_player_model x2:   {serial_seconds:8.3f}s")
+
+    max_jobs = max_jobs or os.cpu_count()
+    n_jobs = 1
+    while True:
+        start = time.perf_counter()
+        parallel = player_model.fit_player_models(match_data, n_jobs=n_jobs)
+        seconds = time.perf_counter() - start
+        for name, models in serial.items():
+            for lane, model in models.items():
+                assert np.array_equal(model.params.to_numpy(), parallel[name][lane].params)
+        print(f"fit_player_models {n_jobs:>2} workers: {seconds:8.3f}s  "
+              f"speedup {serial_seconds / seconds:5.2f}x")
+        if n_jobs >= max_jobs:
+            break
+        n_jobs = min(2 * n_jobs, max_jobs)
+
+
+def formula_of(response, names):
+    """The formula string that expands to the given design columns"""
+    return f"{response} ~ " + " + ".join(name for name in names if name != "Intercept") + \
+        ("" if "Intercept" in names else " - 1")
+
+
+def bench_design_matrices(n_games=20_000, win_games=3_000):
+    """Fitting the lane and win models on precompiled design matrices against
+    patsy formula strings, with identical coefficients. The post draft GLM falls
+    back to a dense pseudo-inverse on its rank deficient design, which holds
+    several rows x columns copies of the design, so it is fitted on fewer games"""
+    match_data = random_games(n_games, draft_model.load_champion_mapping())
+    player_model.calculate_positional_differences(match_data)
+    train_rows, _ = tts(np.arange(len(match_data)), test_size=0.3, random_state=0)
+
+    formula_seconds = design_seconds = 0.
+    design = player_model.DesignMatrixBuilder(match_data)
+    for use_draft in [False, True]:
+        for lane, pos_list in player_model.LANE_POSITIONS.items():
+            names = player_model.lane_design_columns(lane, pos_list, use_draft)
+            start = time.perf_counter()
+            formula_model = smf.logit(formula_of(f"{lane}_lead_at_15", names),
+                                      data=match_data.iloc[train_rows]).fit_regularized(alpha=3, disp=0)
+            formula_model.predict(match_data)
+            formula_seconds += time.perf_counter() - start
+
+            start = time.perf_counter()
+            design_model = player_model.fit_lane_design(
+                design, match_data[f"{lane}_lead_at_15"].to_numpy(dtype=float), names, train_rows)
+            player_model.LinearPredictor.from_results(design_model).predict(design)
+            design_seconds += time.perf_counter() - start
+            assert np.array_equal(formula_model.params.to_numpy(), design_model.params.to_numpy())
+    print(f"six lane models  formula {formula_seconds:7.3f}s  design {design_seconds:7.3f}s  "
+          f"speedup {formula_seconds / design_seconds:5.2f}x")
+
+    full_data, list_of_comp_diffs = util.merge_team_and_draft(
+        *random_merge_inputs(win_games, broken=False))
+    train, _ = tts(full_data, test_size=0.3, random_state=0)
+    comps = [i for i in list_of_comp_diffs if np.sum(abs(full_data[i])) >= 100]
+    names = final_model.post_draft_columns(train, comps)
+
+    start = time.perf_counter()
+    formula_model = smf.glm(formula_of("result", names).replace("side[Blue] + side[Red]", "side"),
+                            data=train, family=sm.families.Binomial()).fit()
+    formula_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    design_model = final_model.train_post_draft_model(train, list_of_comp_diffs, full_data)
+    design_seconds = time.perf_counter() - start
+    assert np.array_equal(formula_model.params.to_numpy(), design_model.params.to_numpy())
+    print(f"post draft GLM   formula {formula_seconds:7.3f}s  design {design_seconds:7.3f}s  "
+          f"speedup {formula_seconds / design_seconds:5.2f}x  ({len(names)} columns)")
+
+
+def fit_with_peak_memory(func, *args, **kwargs):
+    """Result, wall time and peak traced allocation in MB of one call"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def bench_sparse_post_draft(cluster_counts=(7, 10, 15, 20), n_games=100_000,
+                            dense_games=3_000, dense_max_clusters=10):
+    """Post draft GLM fit time and peak memory against n_clusters, with the dense
+    design and statsmodels against the CSR design and fit_sparse_binomial_glm.
+    The dense fit holds several rows x columns copies of its design, about
+    180MB per 1000 rows at 7 clusters, so it is compared on dense_games
+    only"""
+    for n_clusters in cluster_counts:
+        sizes = [dense_games, n_games] if n_clusters <= dense_max_clusters else [n_games]
+        for games in sizes:
+            full_data, list_of_comp_diffs = util.merge_team_and_draft(
+                *random_merge_inputs(games, n_clusters=n_clusters, broken=False), n_clusters)
+            train, _ = tts(full_data, test_size=0.3, random_state=0)
+            fits = {"sparse": True, "dense": False} if games == dense_games else {"sparse": True}
+            for name, sparse in fits.items():
+                model, seconds, peak = fit_with_peak_memory(
+                    final_model.train_post_draft_model, train, list_of_comp_diffs, full_data,
+                    sparse=sparse)
+                print(f"{n_clusters:>2} clusters {games:>7} games  {name:<6} "
+                      f"{len(model.params):>5} columns  {seconds:8.3f}s  "
+                      f"peak {peak:8.1f}MB")
+            del full_data, train
+
+
+def bench_cluster_sweep(n_games=50_000, cluster_counts=range(4, 13), seeds=(0, 1, 2)):
+    """The KMeans (n_clusters, seed) grid run serially against the process pool,
+    and the post draft Brier scoring of every candidate"""
+    match_data = random_games(n_games, draft_model.load_champion_mapping())
+    match_drafts = draft_model.reduce_team_drafts(match_data, draft_model.load_champion_mapping())
+
+    start = time.perf_counter()
+    serial, serial_candidates = draft_model.sweep_draft_clusters(
+        match_drafts, cluster_counts, seeds, n_jobs=1)
+    serial_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    parallel, parallel_candidates = draft_model.sweep_draft_clusters(match_drafts, cluster_counts, seeds)
+    parallel_seconds = time.perf_counter() - start
+    difference = max(np.abs(serial_candidates[task].centroids - candidate.centroids).max()
+                     for task, candidate in parallel_candidates.items())
+    print(f"{len(serial)} KMeans fits  serial {serial_seconds:8.3f}s  "
+          f"{os.cpu_count()} workers {parallel_seconds:8.3f}s  "
+          f"speedup {serial_seconds / parallel_seconds:5.2f}x  max centroid difference {difference:.1e}")
+
+    start = time.perf_counter()
+    sweep, best = pipeline.select_draft_clusters(match_data, cluster_counts, seeds)
+    print(f"select_draft_clusters with Brier scoring: {time.perf_counter() - start:8.3f}s, "
+          f"best {best.n_clusters} clusters")
+    print(sweep.to_string(index=False))
+
+
+def chunked_inertia(draft_chunks, clusters):
+    """Sum of squared distances of normalised drafts to their assigned centroids"""
+    inertia = 0.
+    for draft_df in draft_chunks:
+        normalised = clusters.normalise(draft_df[draft_model.CLUSTER_COLUMNS].to_numpy())
+        inertia += ((normalised - clusters.centroids[clusters.predict(draft_df)]) ** 2).sum()
+    return inertia
+
+
+def bench_streaming_clusters(n_drafts=2_000_000, chunk_rows=100_000, batch_games=500_000):
+    """Streaming mini-batch clustering over chunks of reduced drafts against full
+    batch KMeans, with peak traced memory and the inertia both reach"""
+    champ_map = draft_model.load_champion_mapping()
+
+    def read_chunks(n_rows=n_drafts):
+        match_chunks = (random_match_data(min(chunk_rows, n_rows - start), champ_map, seed=start)
+                        .assign(id=lambda chunk, start=start: chunk["id"] + start)
+                        for start in range(0, n_rows, chunk_rows))
+        return draft_model.iter_reduced_drafts(match_chunks, champ_map)
+
+    for n_rows in sorted({batch_games, n_drafts}):
+        clusters, seconds, peak = fit_with_peak_memory(
+            draft_model.fit_streaming_draft_clusters, lambda: read_chunks(n_rows), random_state=0)
+        inertia = chunked_inertia(read_chunks(n_rows), clusters)
+        print(f"{n_rows:>9} drafts  streaming   {seconds:8.3f}s  peak {peak:8.1f}MB  "
+              f"inertia per draft {inertia / n_rows:.4f}")
+        if n_rows > batch_games:
+            continue
+        draft_df = pd.concat(list(read_chunks(n_rows)), ignore_index=True)
+        clusters, seconds, peak = fit_with_peak_memory(
+            draft_model.fit_draft_clusters, draft_df, random_state=0)
+        print(f"{n_rows:>9} drafts  full batch  {seconds:8.3f}s  peak {peak:8.1f}MB  "
+              f"inertia per draft {chunked_inertia([draft_df], clusters) / n_rows:.4f}")
+        del draft_df
+
+    clusters = draft_model.fit_streaming_draft_clusters(read_chunks, random_state=0)
+    start = time.perf_counter()
+    labels = draft_model.assign_draft_chunks(read_chunks(), clusters)
+    print(f"assign_draft_chunks over {len(labels)} drafts: {time.perf_counter() - start:8.3f}s")
+
+
+def bench_draft_cache(n_lineups=1_000_000, n_distinct=20_000):
+    """Cluster ids of many lineups drawn from fewer distinct ones, reduced and
+    assigned every time against answered from a DraftCache, cold, warm and permuted"""
+    champ_map = draft_model.load_champion_mapping()
+    champion_table = draft_model.ChampionTable(champ_map)
+    draft_df = draft_model.reduce_team_drafts(random_match_data(n_distinct, champ_map), champion_table)
+    clusters = draft_model.fit_draft_clusters(draft_df, random_state=0)
+
+    rng = np.random.default_rng(0)
+    distinct = rng.integers(len(champion_table.names), size=(n_distinct, 5))
+    codes = distinct[rng.integers(n_distinct, size=n_lineups)]
+    permuted = rng.permuted(codes, axis=1)
+
+    expected = clusters.predict_totals(champion_table.reduce(codes))
+    print(f"{n_lineups} lineups, {n_distinct} distinct")
+    print(f"  reduce + assign every lineup: "
+          f"{time_call(lambda: clusters.predict_totals(champion_table.reduce(codes))):8.3f}s")
+    cache = draft_model.DraftCache(champion_table, clusters)
+    start = time.perf_counter()
+    assert np.array_equal(cache.team_comp(codes), expected)
+    print(f"  cache, cold:                  {time.perf_counter() - start:8.3f}s")
+    print(f"  cache, warm:                  {time_call(cache.team_comp, codes):8.3f}s")
+    print(f"  cache, permuted lineups:      {time_call(cache.team_comp, permuted):8.3f}s")
+    assert np.array_equal(cache.team_comp(permuted), expected)
+    print(f"  {cache.stats()}")
+
+
+def bench_what_if(n_games=5_000, top_k=10, repeat=20):
+    """Full pick recommendations with two pick lookahead at several stages of
+    champion select, against the 100 ms budget"""
+    champ_map = draft_model.load_champion_mapping()
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, scorer = pipeline.run_pipeline(random_games(n_games, champ_map))
+    engine = what_if.WhatIfEngine(scorer)
+    names = list(champ_map)
+    difs = {pos: 0.1 for pos in draft_model.ROLES}
+    stages = {
+        "first pick": ({}, {}, "blue"),
+        "red, 1 v 2 picked": ({"jng": names[0]}, {"top": names[1], "mid": names[2]}, "red"),
+        "blue, 3 v 4 picked": ({"jng": names[0], "top": names[3], "bot": names[4]},
+                               {"top": names[1], "mid": names[2], "sup": names[5],
+                                "jng": names[6]}, "blue"),
+        "last pick": (names[10:14] + [None], names[14:19], "blue"),
+    }
+    for stage, (blue, red, side) in stages.items():
+        seconds = time_call(engine.recommend, blue, red, side, difs, bans=names[20:26],
+                            top_k=top_k, repeat=repeat)
+        best = engine.recommend(blue, red, side, difs, bans=names[20:26], top_k=top_k)[0]
+        print(f"{stage:<20} {1000 * seconds:7.1f}ms  best {best['champion']} {best['role']} "
+              f"delta {best['delta']:+.4f}")
+
+
+HISTORY_PATH = "data/benchmark-history.jsonl"
+REGRESSION_RATIO = 1.25
+# Smaller changes than these are noise, whatever their ratio
+REGRESSION_MIN_CHANGE = {"seconds": 0.25, "peak_mb": 20}
+MEASURE_STAGES = """
+import json, warnings
+import benchmark
+warnings.filterwarnings("ignore")
+print(json.dumps(benchmark.time_stages({oracles_path!r}, {player_path!r}, {sparse})))
+"""
+
+
+def time_stages(oracles_path, player_path, sparse):
+    """Run the pipeline stages one at a time on the two CSVs, recording the wall
+    time, peak RSS and output rows of each"""
+    records = []
+
+    def stage(name, func, *args, **kwargs):
+        resettable = reset_peak_rss()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        frame = result[0] if isinstance(result, tuple) else result
+        records.append({"stage": name, "seconds": seconds,
+                        "peak_mb": peak_rss_mb() if resettable else None,
+                        "rows": len(frame) if hasattr(frame, "__len__") else None})
+        return result
+
+    match_data = stage("load", util.read_match_csvs, oracles_path, player_path)
+    stage("calculate_positional_differences", player_model.calculate_positional_differences,
+          match_data)
+    for use_draft_info in [False, True]:
+        stage(f"fit_player_model {player_model.model_name(use_draft_info)}",
+              player_model.fit_player_model, match_data, use_draft_info)
+
+    champion_table = draft_model.ChampionTable(draft_model.load_champion_mapping())
+    match_drafts = stage("reduce_team_drafts", draft_model.reduce_team_drafts, match_data,
+                         champion_table)
+    match_drafts, clusters = stage("cluster_drafts", draft_model.cluster_drafts, match_drafts,
+                                   return_model=True)
+    full_data, list_of_comp_diffs = stage("merge_team_and_draft", util.merge_team_and_draft,
+                                          match_data, match_drafts, clusters.n_clusters)
+
+    train, _ = tts(full_data, test_size=0.3, random_state=0)
+    draft_agnostic = stage("train_draft_agnostic_model", final_model.train_draft_agnostic_model,
+                           train)
+    post_draft = stage("train_post_draft_model" + (" sparse" if sparse else ""),
+                       final_model.train_post_draft_model, train, list_of_comp_diffs, full_data,
+                       sparse=sparse)
+
+    def predict_both():
+        final_model.predict_with_model(full_data, draft_agnostic, "draft_agnostic")
+        return final_model.predict_with_model(full_data, post_draft, "post_draft")
+    stage("predict_with_model", predict_both)
+    return records
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_history(path=HISTORY_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path) as history:
+        return [json.loads(line) for line in history if line.strip()]
+
+
+def bench_pipeline_stages(sizes=(10_000, 100_000, 1_000_000), sparse=True,
+                          history_path=HISTORY_PATH):
+    """Time and peak RSS of every pipeline stage on synthetic CSVs, each size in a
+    fresh process. Results are appended to history_path and compared with the
+    last recorded run of the same stage, size and post draft solver.
+
+    Every size uses the same post draft solver, so the sizes are comparable. The
+    dense GLM's memory is linear in rows x columns but several copies are made,
+    about 180MB per 1000 rows, so sparse=False is only practical for
+    the smaller sizes"""
+    solver = "sparse" if sparse else "dense"
+    previous = {(record["n_games"], record["stage"], record.get("solver", "sparse")): record
+                for record in read_history(history_path)}
+    run = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit(),
+           "solver": solver}
+    new_records = []
+
+    for n_games in sizes:
+        with tempfile.TemporaryDirectory() as path:
+            oracles_path, player_path = write_synthetic_data(path, n_games)
+            records = json.loads(subprocess.run(
+                [sys.executable, "-c", MEASURE_STAGES.format(
+                    oracles_path=oracles_path, player_path=player_path, sparse=sparse)],
+                capture_output=True, text=True, check=True).stdout)
+
+        print(f"{n_games} games, {solver} post draft GLM")
+        for record in records:
+            record = dict(run, n_games=n_games, **record)
+            last = previous.get((n_games, record["stage"], solver))
+            flags = []
+            if last is not None:
+                for key, unit in [("seconds", "time"), ("peak_mb", "memory")]:
+                    if record[key] is None or last.get(key) is None:
+                        continue
+                    if record[key] > REGRESSION_RATIO * last[key] and \
+                            record[key] - last[key] > REGRESSION_MIN_CHANGE[key]:
+                        flags.append(f"{unit} {record[key] / last[key]:.2f}x of {last['commit']}")
+            peak = "-" if record["peak_mb"] is None else f"{record['peak_mb']:.1f}"
+            print(f"  {record['stage']:<36} {record['seconds']:9.3f}s  peak RSS "
+                  f"{peak:>8}MB  {record['rows'] or '-':>8} rows"
+                  + (f"  REGRESSION {', '.join(flags)}" if flags else ""))
+            new_records.append(record)
+
+    os.makedirs(os.path.dirname(history_path) or ".", exist_ok=True)
+    with open(history_path, "a") as history_file:
+        for record in new_records:
+            history_file.write(json.dumps(record) + "\n")
+
+
+def bench_instrumentation(n_games=20_000, n_calls=200_000):
+    """Cost of the @instrument.stage wrapper with recording off, and of a whole
+    recorded pipeline run against an unrecorded one"""
+    def identity(value):
+        return value
+    wrapped = instrument.stage(identity)
+    plain, disabled = [time_call(lambda f=f: [f(k) for k in range(n_calls)])
+                       for f in (identity, wrapped)]
+    print(f"recording off: {1e9 * (disabled - plain) / n_calls:6.1f}ns per call over a plain call")
+
+    match_data = random_games(n_games, draft_model.load_champion_mapping())
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        pipeline.run_pipeline(match_data.copy(), sparse=True)
+        unrecorded = time.perf_counter() - start
+        with tempfile.TemporaryDirectory() as path, instrument.recording(
+                profile_dir=os.path.join(path, "profiles")) as recorder:
+            start = time.perf_counter()
+            pipeline.run_pipeline(match_data.copy(), sparse=True)
+            recorded = time.perf_counter() - start
+    print(f"run_pipeline on {n_games} games: {unrecorded:7.3f}s, recorded with cProfile "
+          f"{recorded:7.3f}s, {len(recorder.records)} records")
+    for record in recorder.records:
+        solver = (f"  {record['iterations']} iterations, converged {record['converged']}"
+                  if record.get("iterations") is not None else "")
+        arguments = " ".join(f"{name}={value}" for name, value in record["arguments"].items())
+        peak = "-" if record["peak_rss_mb"] is None else f"{record['peak_rss_mb']:.1f}"
+        print(f"  {'  ' * record['depth']}{record['stage'] + ' ' + arguments:<60} {record['wall_seconds']:8.3f}s "
+              f"cpu {record['cpu_seconds']:8.3f}s  peak RSS {peak:>7}MB{solver}")
+
+
+def bench_evaluation(n_games=20_000, n_splits=5, max_jobs=None):
+    """Grouped k-fold evaluation of every model, in process against pools of
+    increasing size"""
+    max_jobs = max_jobs or os.cpu_count()
+    match_data = random_games(n_games, draft_model.load_champion_mapping())
+    serial = None
+    for n_jobs in [1] + [n for n in (2, 4, 8, 16) if n <= max_jobs]:
+        start = time.perf_counter()
+        scores = evaluation.evaluate_models(match_data.copy(), "kfold", n_splits, n_jobs=n_jobs)
+        seconds = time.perf_counter() - start
+        serial = serial or seconds
+        print(f"{n_splits} folds of {n_games} games, {n_jobs:2d} workers: {seconds:8.3f}s  "
+              f"speedup {serial / seconds:5.2f}x")
+    summary = evaluation.summarise_scores(scores)
+    print(summary[summary["metric"] == "brier"].to_string(index=False, float_format="%.4f"))
+
+
+def bench_backtest(n_games=20_000, freq="30D", min_train_games=2_000):
+    """Walk-forward backtest with every window refit from scratch against warm
+    started from the previous window"""
+    match_data = random_games(n_games, draft_model.load_champion_mapping())
+    scores, report = backtest.compare_warm_start(match_data, freq=freq,
+                                                 min_train_games=min_train_games)
+    print(f"{scores['window'].nunique()} windows of {freq} over {n_games} games")
+    print(report.to_string(float_format="%.3f"))
+
+
+def bench_rollups(n_games=20_000, n_batches=10):
+    """Draft value reports from the materialised rollups against the pandas
+    computations over the whole scored history they replace"""
+    match_data = random_games(n_games, draft_model.load_champion_mapping())
+    with contextlib.redirect_stdout(io.StringIO()):
+        full_data, _ = pipeline.run_pipeline(match_data, sparse=True)
+    full_data = full_data.sort_values("date", kind="stable")
+    league, team = full_data["league"].iloc[0], full_data["teamname"].iloc[0]
+
+    with tempfile.TemporaryDirectory() as path:
+        draft_rollups = rollups.DraftRollups(path)
+        batches = np.array_split(np.arange(len(full_data)), n_batches)
+        start = time.perf_counter()
+        for batch in batches:
+            draft_rollups.update(full_data.iloc[batch])
+        update = (time.perf_counter() - start) / n_batches
+        print(f"{len(draft_rollups)} team games, {len(draft_rollups.keys)} keys, "
+              f"update of {len(batches[0])} rows: {update * 1e3:8.2f}ms")
+
+        def frame_cumulative():
+            games = full_data[(full_data["league"] == league) & (full_data["date"] >= "2022-01-01")]
+            games = games.assign(gamecount=games.groupby("teamname")["draft_diff"].cumcount(),
+                                 wpa=games.groupby("teamname")["draft_diff"].cumsum())
+            return games.sort_values(["teamname", "date"], kind="stable")
+
+        def frame_lane():
+            games = full_data[full_data["teamname"] == team]
+            return (games["mid_lead_at_15"] - games["post_draft_mid_lead_prob"]).cumsum()
+
+        queries = [
+            ("cumulative draft_diff", frame_cumulative,
+             lambda: draft_rollups.cumulative_draft_diff(league, start_date="2022-01-01")),
+            ("cluster histogram", lambda: model_analysis.get_teamcomps_for_lcs(
+                full_data[full_data["league"] == league]),
+             lambda: draft_rollups.cluster_histogram(league)),
+            ("team totals", lambda: full_data[full_data["league"] == league].groupby(
+                "teamname")["draft_diff"].agg(["count", "sum"]),
+             lambda: draft_rollups.totals(league)),
+            ("team mid lead", frame_lane,
+             lambda: draft_rollups.team_games("mid_lead_above_expected", teams=team)),
+        ]
+        for name, frame_query, rollup_query in queries:
+            frame_seconds = min(timeit.repeat(frame_query, number=1, repeat=5))
+            rollup_seconds = min(timeit.repeat(rollup_query, number=1, repeat=5))
+            print(f"{name:<22} frame {frame_seconds * 1e3:8.2f}ms  rollups "
+                  f"{rollup_seconds * 1e3:8.2f}ms  speedup {frame_seconds / rollup_seconds:6.1f}x")
+
+
+IMPORT_TIME = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+HEAVY_MODULES = ["pandas", "scipy", "sklearn", "statsmodels", "matplotlib"]
+
+
+def bench_startup(n_games=2_000, repeats=3):
+    """Import time of each entry module in a fresh interpreter, with the heavy
+    packages it pulls in, and the wall time of a one request cli.py score run
+    from a saved bundle"""
+    for module in ["draft_scorer", "model_store", "cli", "util", "model_analysis", "pipeline",
+                   "evaluation"]:
+        runs = [json.loads(subprocess.run(
+            [sys.executable, "-c", IMPORT_TIME.format(module=module, heavy=HEAVY_MODULES)],
+            capture_output=True, text=True, check=True).stdout) for _ in range(repeats)]
+        print(f"import {module:<16} {min(run['seconds'] for run in runs):7.3f}s  "
+              f"loads {', '.join(runs[0]['loaded']) or 'none of them'}")
+
+    champion_mapping = draft_model.load_champion_mapping()
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, scorer = pipeline.run_pipeline(random_games(n_games, champion_mapping), sparse=True)
+    names = list(champion_mapping)
+    request = json.dumps({"blue": names[:5], "red": names[5:10],
+                          "blue_difs": {role: 0.1 for role in draft_model.ROLES}}) + "\n"
+    with tempfile.TemporaryDirectory() as path:
+        model_store.save_bundle(path, scorer)
+        for name, command in [("cli.py score", ["cli.py", "score", "--bundle", path]),
+                              ("draft_scorer.py", ["draft_scorer.py", path])]:
+            seconds = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                subprocess.run([sys.executable] + command, input=request, capture_output=True,
+                               text=True, check=True)
+                seconds.append(time.perf_counter() - start)
+            print(f"{name:<23} one request from a bundle: {min(seconds):7.3f}s")
+
+
+BENCHMARKS = {
+    "reduce": bench_reduce_team_drafts,
+    "bundle": bench_model_bundle_cold_start,
+    "merge": bench_merge_team_and_draft,
+    "incremental": bench_incremental_update,
+    "store": bench_match_store,
+    "lanes": bench_parallel_lane_models,
+    "design": bench_design_matrices,
+    "sparse": bench_sparse_post_draft,
+    "clusters": bench_cluster_sweep,
+    "stream": bench_streaming_clusters,
+    "cache": bench_draft_cache,
+    "whatif": bench_what_if,
+    "pipeline": bench_pipeline_stages,
+    "instrument": bench_instrumentation,
+    "evaluation": bench_evaluation,
+    "backtest": bench_backtest,
+    "rollups": bench_rollups,
+    "startup": bench_startup,
+}
+
+if __name__ == "__main__":
+    # The random benchmark data has no real signal, so solver warnings are expected
+    warnings.filterwarnings("ignore", module="statsmodels")
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("benchmarks", nargs="*",
+                        help=f"benchmarks to run, from {', '.join(BENCHMARKS)} (default: all)")
+    names = parser.parse_args().benchmarks or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name!r}")
+    for name in names:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
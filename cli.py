@@ -0,0 +1,116 @@
+"""Headless command line entry point for batch and scheduled jobs.
+
+    python cli.py ingest
+    python cli.py fit --bundle data/model-bundle
+    python cli.py score --bundle data/model-bundle < requests.jsonl
+    python cli.py plot calibration --output calibration.png
+
+Only the standard library is imported up front, each subcommand imports what it
+needs when it runs. score answers draft_scorer.serve requests from the stored
+coefficients of a bundle with NumPy alone, ingest adds pandas, fit adds
+statsmodels, scikit-learn and scipy, and plot adds matplotlib.
+"""
+import argparse
+import os
+import sys
+
+# Plots are written to files, so never ask for a display
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+def ingest(args):
+    import util
+
+    store = util.ingest_match_data(args.store, args.oracles, args.players)
+    print(f"Replaced {args.store} with {len(store)} rows", file=sys.stderr)
+
+def fit(args):
+    import model_store
+    import pipeline
+    import util
+
+    match_data = util.load_match_data(league=args.league, start_date=args.start_date,
+                                      end_date=args.end_date, store_path=args.store)
+    _, scorer = pipeline.run_pipeline(match_data, n_clusters=args.n_clusters, n_jobs=args.jobs,
+                                      sparse=args.sparse)
+    model_store.save_bundle(args.bundle, scorer)
+    print(f"Fitted {len(match_data)} rows, saved the bundle to {args.bundle}", file=sys.stderr)
+
+def score(args):
+    import draft_scorer
+    import model_store
+
+    draft_scorer.serve(model_store.load_bundle(args.bundle).scorer(), args.input, args.output)
+
+def plot(args):
+    import matplotlib.pyplot as plt
+
+    import model_analysis
+
+    if args.plot == "calibration":
+        from match_store import MatchStore
+
+        if not os.path.exists(os.path.join(args.store, "manifest.json")):
+            sys.exit(f"No scored match store at {args.store}")
+        model_analysis.calibration_plot(
+            MatchStore(args.store).load(["post_draft_win_prob", "result"]))
+    else:
+        from rollups import DraftRollups
+
+        if args.league is None:
+            sys.exit("plot draft-value needs --league")
+        teams = {team: f"C{k}" for k, team in enumerate(args.team)}
+        model_analysis.plot_cumulative_expected_wins_added_by_draft(
+            None, args.league, teams, draft_rollups=DraftRollups(args.rollups))
+    plt.savefig(args.output, bbox_inches="tight")
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser(
+        "ingest", help="rewrite the columnar store from the match CSVs",
+        description="Merge the match CSVs and replace the columnar store with them. The store "
+                    "is rewritten on every run, not updated incrementally: new games are added "
+                    "to the scored store by incremental.update_match_store")
+    command.add_argument("--oracles", default="data/oracles-data.csv")
+    command.add_argument("--players", default="data/player-diffs.csv")
+    command.add_argument("--store", default="data/match-data")
+    command.set_defaults(run=ingest)
+
+    command = commands.add_parser("fit", help="fit every model and save a model bundle")
+    command.add_argument("--store", default="data/match-data")
+    command.add_argument("--bundle", default="data/model-bundle")
+    command.add_argument("--league", nargs="+", default=None, help="only fit these leagues")
+    command.add_argument("--start-date", default=None)
+    command.add_argument("--end-date", default=None)
+    command.add_argument("--n-clusters", type=int, default=7)
+    command.add_argument("--jobs", type=int, default=1, help="processes for the lane models")
+    command.add_argument("--sparse", action="store_true", help="fit the post draft model sparse")
+    command.set_defaults(run=fit)
+
+    command = commands.add_parser("score", help="score JSON lines draft requests from a bundle")
+    command.add_argument("--bundle", default="data/model-bundle")
+    command.add_argument("--input", type=argparse.FileType("r"), default="-")
+    command.add_argument("--output", type=argparse.FileType("w"), default="-")
+    command.set_defaults(run=score)
+
+    command = commands.add_parser("plot", help="write a report plot to a file")
+    command.add_argument("plot", choices=["calibration", "draft-value"])
+    command.add_argument("--output", required=True)
+    command.add_argument("--store", default="data/match-store",
+                         help="scored match store, for calibration")
+    command.add_argument("--rollups", default="data/draft-rollups",
+                         help="team rollups, for draft-value")
+    command.add_argument("--league", default=None)
+    command.add_argument("--team", action="append", default=[],
+                         help="team to highlight in draft-value, repeatable")
+    command.set_defaults(run=plot)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import numpy as np
+
+def parse_term(name):
+    """Split a fitted column name such as 'a:b' or 'side[T.Red]' into its factors.
+    Each factor is a (column, level) pair, where level is None for numeric columns.
+    The intercept has no factors"""
+
+    if name == "Intercept":
+        return ()
+    factors = []
+    for factor in name.split(":"):
+        if factor.endswith("]") and "[" in factor:
+            column, level = factor[:-1].split("[", 1)
+            if level.startswith("T."):
+                level = level[2:]
+            factors.append((column, level))
+        else:
+            factors.append((factor, None))
+    return tuple(factors)
+
+def factor_columns(names):
+    """The data columns referenced by a list of design column names"""
+    return list(dict.fromkeys(column for name in names for column, _ in parse_term(name)))
+
+def squared_terms(columns):
+    """Column names of the formula term (a + b + ...)**2: every column, then every
+    pairwise interaction in order"""
+    return list(columns) + [f"{a}:{b}" for k, a in enumerate(columns) for b in columns[k + 1:]]
+
+def unique_terms(names):
+    """Drop repeated terms, keeping the first, as the formula parser does"""
+    return list(dict.fromkeys(names))
+
+def categorical_columns(data, column):
+    """Full rank indicator column names of a categorical column, e.g. side[Blue], side[Red].
+    Numeric columns are used as they are"""
+    values = data[column]
+    if hasattr(values, "cat"):
+        levels = list(values.cat.categories)
+    elif np.asarray(values).dtype.kind in "biuf":
+        return [column]
+    else:
+        levels = sorted(set(np.asarray(values).tolist()))
+    return [f"{column}[{level}]" for level in levels]
+
+def n_rows_of(data):
+    """Number of rows in a DataFrame or a dictionary of equal length arrays"""
+    if hasattr(data, "shape"):
+        return data.shape[0]
+    return len(next(iter(data.values())))
+
+def evaluate_factor(data, factor):
+    values = np.asarray(data[factor[0]])
+    if factor[1] is None:
+        return values.astype(float)
+    return (values.astype(str) == factor[1]).astype(float)
+
+def evaluate_factors(data, terms, factor_cache=None):
+    """Distinct factors of the terms, in order, each evaluated once into factor_cache"""
+    if factor_cache is None:
+        factor_cache = {}
+    factors = list(dict.fromkeys(factor for term in terms for factor in term))
+    for factor in factors:
+        if factor not in factor_cache:
+            factor_cache[factor] = evaluate_factor(data, factor)
+    return factors, factor_cache
+
+def build_design(data, names, terms=None, factor_cache=None, rows=None):
+    """Evaluate the columns of a fitted design matrix without parsing a formula.
+    `data` is a DataFrame or a dictionary of arrays holding the factor columns.
+    `terms` are the parsed names, if already available. `rows` is an optional
+    slice selecting the rows to build.
+
+    Every factor is evaluated once into a factor matrix, and the interaction
+    columns are formed with one vectorised product per interaction order."""
+
+    if terms is None:
+        terms = [parse_term(name) for name in names]
+    factors, factor_cache = evaluate_factors(data, terms, factor_cache)
+    if rows is None:
+        rows = slice(None)
+    n_rows = len(range(n_rows_of(data))[rows])
+
+    factor_index = {factor: k for k, factor in enumerate(factors)}
+    factor_matrix = np.column_stack([factor_cache[factor][rows] for factor in factors]) \
+        if factors else np.empty((n_rows, 0))
+
+    # Column major, as patsy builds it, so the solvers see the same memory layout
+    design = np.ones((n_rows, len(terms)), order="F")
+    for order in range(max((len(term) for term in terms), default=0)):
+        columns = [k for k, term in enumerate(terms) if len(term) > order]
+        design[:, columns] *= factor_matrix[:, [factor_index[terms[k][order]] for k in columns]]
+    return design
+
+def build_sparse_design(data, names, terms=None):
+    """The design matrix as a scipy.sparse CSR matrix, for designs dominated by
+    indicator columns such as the matchup interactions of the post draft model.
+
+    Factors that are mostly zero are kept as their non-zero entries only, and
+    each column is evaluated on the rows where its sparsest factor is non-zero,
+    so memory grows with the non-zero entries rather than with rows * columns."""
+    import scipy.sparse
+
+    if terms is None:
+        terms = [parse_term(name) for name in names]
+    n_rows = n_rows_of(data)
+
+    # factor: (rows, values) of its non-zero entries, rows is None when kept dense
+    factors = {}
+    for factor in dict.fromkeys(factor for term in terms for factor in term):
+        values = evaluate_factor(data, factor)
+        rows = np.flatnonzero(values)
+        factors[factor] = (rows, values[rows]) if 2 * len(rows) < n_rows else (None, values)
+
+    def values_at(factor, rows):
+        factor_rows, values = factors[factor]
+        if factor_rows is None:
+            return values[rows]
+        position = np.minimum(np.searchsorted(factor_rows, rows), len(factor_rows) - 1)
+        return np.where(factor_rows[position] == rows, values[position], 0.)
+
+    indices, values, counts = [], [], []
+    for term in terms:
+        if not term:
+            rows, column = np.arange(n_rows), np.ones(n_rows)
+        else:
+            sparsest = min(term, key=lambda factor: n_rows if factors[factor][0] is None
+                           else len(factors[factor][0]))
+            rows = factors[sparsest][0]
+            if rows is None:
+                rows = np.arange(n_rows)
+            column = np.ones(len(rows))
+            for factor in term:
+                column *= values_at(factor, rows)
+            keep = column != 0
+            rows, column = rows[keep], column[keep]
+        indices.append(rows)
+        values.append(column)
+        counts.append(len(rows))
+
+    indptr = np.concatenate([[0], np.cumsum(counts)])
+    design = scipy.sparse.csc_matrix(
+        (np.concatenate(values), np.concatenate(indices), indptr), shape=(n_rows, len(terms)))
+    return design.tocsr()
+
+class DesignMatrixBuilder:
+    """Design matrices over one dataset, built from column names instead of formula
+    strings. Evaluated factors and whole matrices are cached, keyed on the columns,
+    so fitting several models and predicting with them reuses the same arrays"""
+
+    def __init__(self, data):
+        self.data = data
+        self.factor_cache = {}
+        self.matrix_cache = {}
+
+    def matrix(self, names):
+        key = tuple(names)
+        if key not in self.matrix_cache:
+            self.matrix_cache[key] = build_design(self.data, names, factor_cache=self.factor_cache)
+        return self.matrix_cache[key]
+
+    def sparse_matrix(self, names):
+        key = ("sparse",) + tuple(names)
+        if key not in self.matrix_cache:
+            self.matrix_cache[key] = build_sparse_design(self.data, names)
+        return self.matrix_cache[key]
+
+    def frame(self, names, rows=None):
+        """The design matrix as a DataFrame, so statsmodels names the parameters,
+        optionally only the given row positions"""
+        # Only needed for fitting, the scoring path stays NumPy only
+        import pandas as pd
+
+        matrix = self.matrix(names)
+        if rows is not None:
+            matrix = np.asfortranarray(matrix[rows])
+        return pd.DataFrame(matrix, columns=list(names), copy=False)
+
+# Design matrix cells built at once when predicting, 32MB of float64
+PREDICT_CHUNK_CELLS = 1 << 22
+
+class LinearPredictor:
+    """A fitted logistic model reduced to its column names and coefficients, so it
+    can predict from plain arrays without statsmodels or patsy"""
+
+    def __init__(self, names, params):
+        self.names = list(names)
+        self.params = np.asarray(params, dtype=float)
+        self.terms = [parse_term(name) for name in self.names]
+
+    @classmethod
+    def from_results(cls, results):
+        """Build from fitted statsmodels Logit or Binomial GLM results"""
+        return cls(results.params.index, results.params.to_numpy())
+
+    def __repr__(self):
+        return f"LinearPredictor({len(self.names)} columns)"
+
+    def linear_predictor(self, data):
+        if isinstance(data, DesignMatrixBuilder):
+            return data.matrix(self.names) @ self.params
+        n_rows = n_rows_of(data)
+        chunk_rows = max(1, PREDICT_CHUNK_CELLS // max(1, len(self.names)))
+        if n_rows <= chunk_rows:
+            return build_design(data, self.names, self.terms) @ self.params
+
+        # Wide designs are built a block of rows at a time, never all at once
+        factor_cache = {}
+        return np.concatenate([
+            build_design(data, self.names, self.terms, factor_cache,
+                         slice(start, start + chunk_rows)) @ self.params
+            for start in range(0, n_rows, chunk_rows)])
+
+    def predict(self, data):
+        """Probability of the positive outcome for every row of `data`"""
+        return 1. / (1. + np.exp(-self.linear_predictor(data)))
+
+class DesignResults:
+    """Fitted statsmodels results on precompiled design columns. predict takes the
+    match data, or a DesignMatrixBuilder, as the results of a formula fit did, and
+    builds the design columns from it by name, so a frame whose columns are in
+    another order can't be misaligned. Every other attribute is the results'"""
+
+    def __init__(self, results):
+        self.results = results
+        self.predictor = LinearPredictor.from_results(results)
+
+    def __getattr__(self, name):
+        # Only reached for attributes not set in __init__, e.g. while unpickling
+        if name in ("results", "predictor"):
+            raise AttributeError(name)
+        return getattr(self.results, name)
+
+    def __repr__(self):
+        return f"DesignResults({type(self.results).__name__}, {len(self.predictor.names)} columns)"
+
+    def predict(self, data):
+        """Probability of the positive outcome for every row of `data`"""
+        return self.predictor.predict(data)
+
+def align_params(params, names):
+    """Coefficients of a previous fit as start values for a fit on the columns
+    names, zero for columns the previous fit didn't have. None stays None"""
+    if params is None:
+        return None
+    return params.reindex(list(names), fill_value=0.0).to_numpy(dtype=float)
+
+def matchup_column_names(n_clusters):
+    return [f'team_comp{i}_v_opp_comp{j}' for i in range(n_clusters) for j in range(n_clusters)]
+
+def one_hot(labels, n_clusters):
+    """(n_rows, n_clusters) int8 indicators, all zero for labels outside the clusters"""
+    return (np.asarray(labels)[:, None] == np.arange(n_clusters)).astype(np.int8)
+
+def matchup_matrix(team_comp, opp_comp, n_clusters):
+    """Signed matchup indicators, column i * n_clusters + j being team_comp{i}_v_opp_comp{j}.
+
+    A team of comp i facing comp j scores +1 in (i, j) and, for i != j, -1 in (j, i),
+    so the two rows of a well formed game sum to 0, or to 2 for a mirror matchup.
+    """
+    team, opp = one_hot(team_comp, n_clusters), one_hot(opp_comp, n_clusters)
+    wins = team[:, :, None] * opp[:, None, :]
+    matchups = wins - wins.transpose(0, 2, 1)
+    diagonal = np.arange(n_clusters)
+    matchups[:, diagonal, diagonal] = wins[:, diagonal, diagonal]
+    return matchups.reshape(len(team), n_clusters * n_clusters)
@@ -1,7 +1,13 @@
 import csv
-import pandas as pd
-from scipy.stats import zscore
-from sklearn.cluster import KMeans
+import itertools
+
+import numpy as np
+
+import instrument
+import shared_pool
+
+# pandas, scikit-learn and threadpoolctl are imported by the functions that use
+# them, so scoring from a saved bundle only needs NumPy
 
 class MappedChampion:
     """Representation a champion to their feature reduced mapped form, as defined
@@ -21,12 +27,14 @@ class MappedChampion:
         damage_type = "AD" if self.ad else "AP" if self.ap else "None"
         return f"{self.name} - Role: {self.role}, Powerspike: {powerspike}, DamageType {damage_type}"
 
-def load_champion_mapping():
+CHAMPION_HEADER = ["Champion", "Role", "early_game", "mid_game", "late_game", "Magic Dmg", "Physical Dmg"]
+
+def load_champion_mapping(path="data/champion_roles.csv"):
     """Returns a dictionary mapping each champion to their reduced form"""
 
     champ_reduction_dict = {}
 
-    with open("data/champion_roles.csv") as champ_file:
+    with open(path) as champ_file:
         champions = csv.reader(champ_file)
     
         for i, champion in enumerate(champions):
@@ -36,6 +44,15 @@ def load_champion_mapping():
 
     return champ_reduction_dict
 
+def save_champion_mapping(champ_map, path):
+    """Write a champion mapping back out in the data/champion_roles.csv format"""
+    with open(path, "w", newline="") as champ_file:
+        writer = csv.writer(champ_file)
+        writer.writerow(CHAMPION_HEADER)
+        for champ in champ_map.values():
+            writer.writerow([champ.name, champ.role, champ.early_game, champ.mid_game,
+                             champ.late_game, champ.ap, champ.ad])
+
 def get_blank_row():
     return {   
         "team_Dives" :     0, 
@@ -65,43 +82,382 @@ def add_champ_to_blank_row(row, champ):
     row["ad"]         += champ.ad
 
 
-def reduce_team_drafts(oracles_data, champ_map):
-    """Create team draft representation by summing all comprising champion feature vectors"""
+DRAFT_COLUMNS = list(get_blank_row())
+ROLES = ["top", "jng", "mid", "bot", "sup"]
+
+class NameIndex:
+    """Position of each of a list of names, covering the get_indexer of pd.Index
+    that champion encoding needs with a dictionary, so without pandas"""
+    def __init__(self, names):
+        self.positions = {name: position for position, name in enumerate(names)}
 
-    draft_df = pd.DataFrame()
+    def __len__(self):
+        return len(self.positions)
 
-    # There are more efficient ways to do this...
-    for _, row in oracles_data.iterrows():
-        blank_row = get_blank_row()
-        for role in ["top", "jng", "mid", "bot", "sup"]:
-            add_champ_to_blank_row(blank_row, champ_map[row[f"{role}_champion"]])
+    def get_indexer(self, values):
+        """Position of each value, -1 for values not in the index"""
+        values = np.asarray(values, dtype=object)
+        return np.fromiter(map(self.positions.get, values.ravel(), itertools.repeat(-1)),
+                           dtype=np.int64, count=values.size).reshape(values.shape)
+
+class ChampionTable:
+    """Dense feature matrix of the champion mapping, indexed by champion code.
+    Row i holds the blank row contribution of champion names[i]. With open_slot
+    there is one more code, open_code, named "" with an all zero row, for a role
+    not picked yet. The real champions keep their codes
+    """
+    def __init__(self, champ_map, open_slot=False):
+        self.champions = dict(champ_map)
+        self.names = list(champ_map) + ([""] if open_slot else [])
+        self.open_code = len(self.names) - 1 if open_slot else None
+        self.index = NameIndex(self.names)
+        self.features = np.zeros((len(self.names), len(DRAFT_COLUMNS)), dtype=np.int64)
+
+        for code, name in enumerate(self.champions):
+            row = get_blank_row()
+            add_champ_to_blank_row(row, champ_map[name])
+            self.features[code] = list(row.values())
+
+    def encode(self, champions):
+        """Map an array of champion names to their integer codes"""
+        codes = self.index.get_indexer(np.asarray(champions, dtype=object))
+        if (codes < 0).any():
+            missing = sorted({str(c) for c in np.asarray(champions, dtype=object)[codes < 0]})
+            raise KeyError(f"Champions not in mapping: {missing}")
+        return codes
+
+    def reduce(self, codes):
+        """Sum the feature rows of each lineup in a (n_teams, 5) array of codes"""
+        totals = self.features[codes[:, 0]].copy()
+        for slot in range(1, codes.shape[1]):
+            totals += self.features[codes[:, slot]]
 
-        blank_row["id"] = row.id
         # A single damage type is easily drafted against so deserves 
         # it's own column for significance
-        if blank_row["ap"] == 0 or blank_row["ad"] == 0:
-            blank_row["no_damage_type"] = 1
-        
-        draft_df = pd.concat([draft_df, pd.DataFrame.from_dict([blank_row])], ignore_index=True, axis=0, join='outer')
+        no_damage = DRAFT_COLUMNS.index("no_damage_type")
+        totals[:, no_damage] = (totals[:, DRAFT_COLUMNS.index("ap")] == 0) | \
+                               (totals[:, DRAFT_COLUMNS.index("ad")] == 0)
+        return totals
+
+
+def encode_team_drafts(oracles_data, champ_table):
+    """Returns a (n_teams, 5) array of champion codes in top, jng, mid, bot, sup order"""
+    return np.column_stack([champ_table.encode(oracles_data[f"{role}_champion"])
+                            for role in ROLES])
 
+@instrument.stage
+def reduce_team_drafts(oracles_data, champ_map):
+    """Create team draft representation by summing all comprising champion feature vectors"""
+    import pandas as pd
+
+    champ_table = champ_map if isinstance(champ_map, ChampionTable) else ChampionTable(champ_map)
+    totals = champ_table.reduce(encode_team_drafts(oracles_data, champ_table))
+
+    draft_df = pd.DataFrame(totals, columns=DRAFT_COLUMNS)
+    draft_df["id"] = oracles_data["id"].to_numpy()
     return draft_df
 
-def cluster_drafts(draft_df, n_clusters=7):
+def iter_reduced_drafts(match_chunks, champ_map):
+    """Reduce drafts one chunk of match rows at a time, e.g. from
+    pd.read_csv(path, chunksize=...), yielding reduced draft frames"""
+    champ_table = champ_map if isinstance(champ_map, ChampionTable) else ChampionTable(champ_map)
+    for match_chunk in match_chunks:
+        yield reduce_team_drafts(match_chunk, champ_table)
+
+CLUSTER_COLUMNS = ["team_Dives", "team_Tanks",
+                   "team_Damages",
+                   "team_Enchanters",
+                   "team_Picks",
+                   "team_Pokes", "team_Engages",
+                   "team_Splitpushs", "early_game",
+                   "late_game",
+                   "mid_game", 'no_damage_type']
+
+class DraftClusters:
+    """Fitted draft clustering: the zscore normalisation of the cluster columns and
+    the KMeans centroids, so new drafts can be assigned without refitting
+    """
+    def __init__(self, means, stds, centroids):
+        self.means =     np.asarray(means, dtype=float)
+        self.stds =      np.asarray(stds, dtype=float)
+        self.centroids = np.asarray(centroids, dtype=float)
+
+    @property
+    def n_clusters(self):
+        return self.centroids.shape[0]
+
+    def __repr__(self):
+        return f"DraftClusters({self.n_clusters} clusters)"
+
+    def normalise(self, features):
+        """Zscore an array of CLUSTER_COLUMNS features with the fitted mean and std"""
+        return (np.asarray(features, dtype=float) - self.means) / self.stds
+
+    def predict_features(self, features):
+        """Index of the nearest centroid for each row of CLUSTER_COLUMNS features"""
+        normalised = self.normalise(features)
+        distances = (normalised ** 2).sum(axis=1)[:, None] \
+            - 2 * normalised @ self.centroids.T + (self.centroids ** 2).sum(axis=1)
+        return distances.argmin(axis=1)
+
+    def predict_totals(self, totals):
+        """Assign clusters to reduced drafts laid out in DRAFT_COLUMNS order"""
+        return self.predict_features(np.asarray(totals)[:, CLUSTER_INDICES])
+
+    def predict(self, draft_df):
+        return self.predict_features(draft_df[CLUSTER_COLUMNS].to_numpy())
+
+CLUSTER_INDICES = [DRAFT_COLUMNS.index(column) for column in CLUSTER_COLUMNS]
+
+@instrument.stage
+def fit_draft_clusters(draft_df, n_clusters=7, random_state=None, init_clusters=None):
+    """Fit KMeans on the zscored cluster columns and return the DraftClusters.
+    Given the DraftClusters of a previous fit, KMeans starts from their centroids,
+    so cluster i keeps meaning the same kind of draft"""
+    from sklearn.cluster import KMeans
+
+    features = draft_df[CLUSTER_COLUMNS].to_numpy(dtype=float)
+
     # Normalise features for a consistent distance or some roles are over represented
-    cluster_columns = zscore(draft_df[
-               ["team_Dives", "team_Tanks",
-                "team_Damages",
-                "team_Enchanters",
-                "team_Picks",
-                "team_Pokes", "team_Engages",
-                "team_Splitpushs", "early_game",
-                "late_game",
-                "mid_game", 'no_damage_type']])
-
-    cluster_model = KMeans(n_clusters=n_clusters).fit(cluster_columns)
-    draft_df['team_comp'] = cluster_model.fit_predict(cluster_columns).astype(int)
+    clusters = DraftClusters(features.mean(axis=0), features.std(axis=0),
+                             np.zeros((n_clusters, len(CLUSTER_COLUMNS))))
+    if init_clusters is None:
+        cluster_model = KMeans(n_clusters=n_clusters, random_state=random_state)
+    else:
+        # The previous centroids, renormalised with this fit's means and stds
+        init = clusters.normalise(init_clusters.centroids * init_clusters.stds + init_clusters.means)
+        cluster_model = KMeans(n_clusters=init_clusters.n_clusters, init=init, n_init=1,
+                               random_state=random_state)
+    cluster_model.fit(clusters.normalise(features))
+    clusters.centroids = cluster_model.cluster_centers_
+    instrument.note(iterations=int(cluster_model.n_iter_),
+                    converged=bool(cluster_model.n_iter_ < cluster_model.max_iter),
+                    inertia=float(cluster_model.inertia_))
+    return clusters
+
+@instrument.stage
+def cluster_drafts(draft_df, n_clusters=7, random_state=None, return_model=False, clusters=None,
+                   init_clusters=None):
+    """Add the team_comp column. Given fitted clusters, drafts are assigned to
+    their stored centroids instead of fitting KMeans again. Given init_clusters,
+    KMeans is refit starting from their centroids"""
+    if clusters is None:
+        clusters = fit_draft_clusters(draft_df, n_clusters, random_state, init_clusters)
+    draft_df['team_comp'] = clusters.predict(draft_df).astype(int)
+    if return_model:
+        return draft_df, clusters
     return draft_df
 
+class DraftCache:
+    """Reduced drafts, zscored features and cluster ids of every lineup scored so far.
+
+    Lineups are keyed on their sorted champion codes, as the reduced draft is a
+    sum and so doesn't depend on the role order, and each lineup points at its
+    composition, the distinct reduced draft vector. Repeated and permuted
+    lineups are answered without reducing or clustering; only new ones are
+    reduced, and only new compositions are normalised and assigned, all in one
+    vectorised pass per call. The hit and miss counts are in stats().
+    """
+    def __init__(self, champion_table, clusters):
+        self.champion_table = champion_table
+        self.clusters = clusters
+        self.lineups = {}
+        self.compositions = {}
+        self.totals = np.zeros((0, len(DRAFT_COLUMNS)), dtype=np.int64)
+        self.features = np.zeros((0, len(CLUSTER_COLUMNS)))
+        self.team_comps = np.zeros(0, dtype=int)
+        self.lineup_hits = self.lineup_misses = 0
+        self.composition_hits = self.composition_misses = 0
+
+    def __len__(self):
+        return len(self.lineups)
+
+    def __repr__(self):
+        return f"DraftCache({len(self.lineups)} lineups, {len(self.compositions)} compositions)"
+
+    def lineup_keys(self, codes):
+        """One integer per lineup, the same for any order of the same champions"""
+        codes = np.sort(np.atleast_2d(codes), axis=1).astype(np.int64)
+        base = len(self.champion_table.names)
+        keys = np.zeros(len(codes), dtype=np.int64)
+        for slot in range(codes.shape[1]):
+            keys = keys * base + codes[:, slot]
+        return keys
+
+    def lookup(self, codes):
+        """Composition index of every lineup in a (n_teams, 5) array of codes"""
+        codes = np.atleast_2d(codes)
+        keys, first, inverse = np.unique(self.lineup_keys(codes), return_index=True,
+                                         return_inverse=True)
+        found = np.array([self.lineups.get(key, -1) for key in keys.tolist()], dtype=int)
+        # A miss is a lineup that had to be reduced, repeats of it in the same call hit
+        missing = np.flatnonzero(found < 0)
+        self.lineup_misses += len(missing)
+        self.lineup_hits += len(codes) - len(missing)
+        if len(missing):
+            found[missing] = self._add(codes[first[missing]])
+            self.lineups.update(zip(keys[missing].tolist(), found[missing].tolist()))
+        return found[inverse.ravel()]
+
+    def _add(self, codes):
+        """Reduce new lineups and assign any new compositions"""
+        totals = self.champion_table.reduce(codes)
+        indices = np.array([self.compositions.get(row.tobytes(), -1) for row in totals], dtype=int)
+        new = np.flatnonzero(indices < 0)
+        if len(new) == 0:
+            self.composition_hits += len(totals)
+            return indices
+
+        new_totals, inverse = np.unique(totals[new], axis=0, return_inverse=True)
+        self.composition_hits += len(totals) - len(new_totals)
+        self.composition_misses += len(new_totals)
+        start = len(self.team_comps)
+        self.totals = np.vstack([self.totals, new_totals])
+        self.features = np.vstack([self.features,
+                                   self.clusters.normalise(new_totals[:, CLUSTER_INDICES])])
+        self.team_comps = np.concatenate([self.team_comps,
+                                          self.clusters.predict_totals(new_totals)])
+        for offset, row in enumerate(new_totals):
+            self.compositions[row.tobytes()] = start + offset
+        indices[new] = start + inverse.ravel()
+        return indices
+
+    def team_comp(self, codes):
+        """Cluster id of every lineup"""
+        indices = self.lookup(codes)
+        return self.team_comps[indices]
+
+    def reduce(self, codes):
+        """Reduced draft of every lineup, as ChampionTable.reduce"""
+        indices = self.lookup(codes)
+        return self.totals[indices]
+
+    def stats(self):
+        lookups = self.lineup_hits + self.lineup_misses
+        return {"lineup_hits": int(self.lineup_hits), "lineup_misses": int(self.lineup_misses),
+                "composition_hits": int(self.composition_hits),
+                "composition_misses": int(self.composition_misses),
+                "lineups": len(self.lineups), "compositions": len(self.compositions),
+                "hit_rate": float(self.lineup_hits / lookups) if lookups else 0.}
+
+class RunningMoments:
+    """Count, mean and variance of the feature rows seen so far. Chunks are merged
+    with the pairwise update of Chan et al., so the result matches the mean and
+    std of all rows at once without holding them"""
+    def __init__(self, n_features):
+        self.count = 0
+        self.mean = np.zeros(n_features)
+        self.m2 = np.zeros(n_features)
+
+    def update(self, features):
+        features = np.asarray(features, dtype=float)
+        if len(features) == 0:
+            return
+        mean = features.mean(axis=0)
+        m2 = ((features - mean) ** 2).sum(axis=0)
+        delta, total = mean - self.mean, self.count + len(features)
+        self.mean = self.mean + delta * len(features) / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * len(features) / total
+        self.count = total
+
+    @property
+    def std(self):
+        # Population std, as zscore and fit_draft_clusters use
+        return np.sqrt(self.m2 / self.count)
+
+def fit_streaming_draft_clusters(read_chunks, n_clusters=7, random_state=None, batch_size=4096):
+    """Fit the draft clustering over reduced drafts that don't fit in memory.
+
+    read_chunks is called twice and each call should return an iterable of
+    reduced draft frames, such as iter_reduced_drafts over a chunked CSV
+    reader. The first pass keeps running means and variances of the cluster
+    columns, the second normalises each chunk with them and updates the
+    centroids with MiniBatchKMeans.partial_fit on batches of batch_size rows.
+    Memory is bounded by one chunk. Returns DraftClusters."""
+    from sklearn.cluster import MiniBatchKMeans
+
+    moments = RunningMoments(len(CLUSTER_COLUMNS))
+    for draft_df in read_chunks():
+        moments.update(draft_df[CLUSTER_COLUMNS].to_numpy(dtype=float))
+    if moments.count < n_clusters:
+        raise ValueError(f"{moments.count} drafts is fewer than {n_clusters} clusters")
+
+    clusters = DraftClusters(moments.mean, moments.std, np.zeros((n_clusters, len(CLUSTER_COLUMNS))))
+    cluster_model = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state,
+                                    batch_size=batch_size)
+    # Rows left over from a chunk start the next batch, so every batch but the
+    # last is full and the first holds enough drafts to initialise the centroids
+    pending = np.empty((0, len(CLUSTER_COLUMNS)))
+    for draft_df in read_chunks():
+        pending = np.vstack([pending, clusters.normalise(draft_df[CLUSTER_COLUMNS].to_numpy())])
+        n_full = len(pending) - len(pending) % batch_size
+        for start in range(0, n_full, batch_size):
+            cluster_model.partial_fit(pending[start:start + batch_size])
+        pending = pending[n_full:]
+    if len(pending):
+        cluster_model.partial_fit(pending)
+
+    clusters.centroids = cluster_model.cluster_centers_
+    return clusters
+
+def assign_draft_chunks(draft_chunks, clusters):
+    """team_comp of reduced drafts given in chunks, assigned to the fitted
+    centroids one chunk at a time. Returns the id and team_comp frame that
+    util.merge_team_and_draft joins on"""
+    import pandas as pd
+    assigned = [pd.DataFrame({"id": draft_df["id"].to_numpy(),
+                              "team_comp": clusters.predict(draft_df).astype(int)})
+                for draft_df in draft_chunks]
+    if not assigned:
+        return pd.DataFrame({"id": np.array([], dtype=np.int64), "team_comp": np.array([], dtype=int)})
+    return pd.concat(assigned, ignore_index=True)
+
+def fit_cluster_candidate(normalised, n_clusters, seed, silhouette_sample):
+    """KMeans centroids, inertia and sampled silhouette of one (n_clusters, seed)"""
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+    cluster_model = KMeans(n_clusters=n_clusters, random_state=seed).fit(normalised)
+    silhouette = silhouette_score(normalised, cluster_model.labels_,
+                                  sample_size=min(silhouette_sample, len(normalised)),
+                                  random_state=seed)
+    return cluster_model.cluster_centers_, cluster_model.inertia_, silhouette
+
+def _fit_shared_cluster_candidate(n_clusters, seed, silhouette_sample):
+    return fit_cluster_candidate(shared_pool.worker_state(), n_clusters, seed, silhouette_sample)
+
+def sweep_draft_clusters(draft_df, cluster_counts=range(4, 13), seeds=(0, 1, 2), n_jobs=None,
+                         silhouette_sample=10_000):
+    """Fit KMeans for every (n_clusters, seed) pair on a pool of n_jobs processes
+    (default: one per core). The features are zscored once and copied into shared
+    memory that every worker maps.
+
+    Returns a frame with the inertia and silhouette, computed on a sample of
+    silhouette_sample drafts, of each pair, and {(n_clusters, seed): DraftClusters}"""
+    import pandas as pd
+
+    features = draft_df[CLUSTER_COLUMNS].to_numpy(dtype=float)
+    means, stds = features.mean(axis=0), features.std(axis=0)
+    normalised = (features - means) / stds
+    tasks = [(n_clusters, seed) for n_clusters in cluster_counts for seed in seeds]
+
+    if n_jobs == 1:
+        results = [fit_cluster_candidate(normalised, n_clusters, seed, silhouette_sample)
+                   for n_clusters, seed in tasks]
+    else:
+        with shared_pool.SharedArray(normalised.shape) as shared:
+            shared.values[:] = normalised
+            with shared.pool(n_jobs) as pool:
+                futures = [pool.submit(_fit_shared_cluster_candidate, n_clusters, seed,
+                                       silhouette_sample) for n_clusters, seed in tasks]
+                results = [future.result() for future in futures]
+
+    candidates = {task: DraftClusters(means, stds, centroids)
+                  for task, (centroids, _, _) in zip(tasks, results)}
+    sweep = pd.DataFrame([(n_clusters, seed, inertia, silhouette)
+                          for (n_clusters, seed), (_, inertia, silhouette) in zip(tasks, results)],
+                         columns=["n_clusters", "seed", "inertia", "silhouette"])
+    return sweep, candidates
+
 def print_centroids(draft_df):
     # Calculating the centroids manually gives a nice pandas output 
     return draft_df.groupby(['team_comp']).mean()[
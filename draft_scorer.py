@@ -0,0 +1,140 @@
+import json
+import sys
+
+import numpy as np
+
+from design import LinearPredictor, matchup_column_names, matchup_matrix
+from draft_model import DRAFT_COLUMNS, ROLES, DraftCache
+
+MODEL_NAMES = ["draft_agnostic", "post_draft"]
+LANES = ["top", "mid", "bot"]
+CHAMPION_FEATURES = ['early_game', "mid_game", "late_game", "ap", "ad"]
+
+class DraftScorer:
+    """Scores champion select states with models fitted once up front.
+
+    Every request is evaluated from stored coefficients with NumPy, so no formula
+    is parsed and no DataFrame is built per draft. Lineups are given as champion
+    names (or ChampionTable codes) in top, jng, mid, bot, sup order. Cluster ids
+    come from a DraftCache, shared with batch scoring, so lineups seen before
+    are not reduced or clustered again.
+    """
+    def __init__(self, champion_table, lane_models, clusters, win_models, cache=None):
+        self.champion_table = champion_table
+        self.lane_models = {name: {lane: as_predictor(model) for lane, model in models.items()}
+                            for name, models in lane_models.items()}
+        self.clusters = clusters
+        self.win_models = {name: as_predictor(model) for name, model in win_models.items()}
+        self.cache = cache if cache is not None else DraftCache(champion_table, clusters)
+
+    def encode(self, lineups):
+        """Champion codes for a (n_drafts, 5) array of names or codes"""
+        lineups = np.atleast_2d(np.asarray(lineups))
+        if lineups.dtype.kind in "iu":
+            return lineups
+        return self.champion_table.encode(lineups.ravel()).reshape(lineups.shape)
+
+    def team_rows(self, team, opp, difs, sides):
+        """The columns the fitted models reference, one row per team"""
+        features = self.champion_table.features
+        rows = {"side": sides}
+
+        for p, pos in enumerate(ROLES):
+            rows[f"{pos}_dif"] = difs[pos]
+            for col in CHAMPION_FEATURES:
+                c = DRAFT_COLUMNS.index(col)
+                rows[f"{pos}_{col}_diff"] = features[team[:, p], c] - features[opp[:, p], c]
+
+        for name in MODEL_NAMES:
+            for lane, model in self.lane_models[name].items():
+                rows[f"{name}_{lane}_lead_prob"] = model.predict(rows)
+        return rows
+
+    def score_batch(self, blue, red, blue_difs, red_difs=None):
+        """Score many drafts at once.
+
+        blue_difs/red_difs map each role to the player `*_dif` values of that side.
+        When red_difs is omitted they are taken as the negation of blue_difs.
+        Returns a dictionary of (n_drafts, 2) arrays, with blue in column 0.
+        """
+        blue, red = self.encode(blue), self.encode(red)
+        n_drafts = blue.shape[0]
+        blue_difs = {pos: np.broadcast_to(np.asarray(blue_difs[pos], dtype=float), n_drafts)
+                     for pos in ROLES}
+        if red_difs is None:
+            red_difs = {pos: -blue_difs[pos] for pos in ROLES}
+
+        # Blue teams fill the first n_drafts rows and red teams the rest
+        team, opp = np.vstack([blue, red]), np.vstack([red, blue])
+        difs = {pos: np.concatenate([blue_difs[pos], np.broadcast_to(
+            np.asarray(red_difs[pos], dtype=float), n_drafts)]) for pos in ROLES}
+        sides = np.repeat(np.array(["Blue", "Red"], dtype=object), n_drafts)
+        rows = self.team_rows(team, opp, difs, sides)
+
+        team_comp = self.cache.team_comp(team)
+        opp_comp = np.concatenate([team_comp[n_drafts:], team_comp[:n_drafts]])
+        rows.update(matchup_columns(team_comp, opp_comp, self.clusters.n_clusters))
+        rows["team_comp"] = team_comp
+
+        def by_side(values):
+            return values.reshape(2, n_drafts).T
+
+        scores = {}
+        for name in MODEL_NAMES:
+            raw = by_side(self.win_models[name].predict(rows))
+            # Normalise the probabilities predicting both sides of the matchup
+            scores[f"{name}_win_prob"] = raw / raw.sum(axis=1, keepdims=True)
+            for lane in LANES:
+                column = f"{name}_{lane}_lead_prob"
+                scores[column] = by_side(rows[column])
+
+        scores["draft_diff"] = scores["post_draft_win_prob"] - scores["draft_agnostic_win_prob"]
+        scores["team_comp"] = by_side(team_comp)
+        return scores
+
+    def score(self, blue, red, blue_difs, red_difs=None):
+        """Score a single draft, returning plain floats for each side"""
+        scores = self.score_batch([blue], [red], blue_difs, red_difs)
+        return {side: {key: values[0, s].item() for key, values in scores.items()}
+                for s, side in enumerate(["blue", "red"])}
+
+def as_predictor(model):
+    if isinstance(model, LinearPredictor):
+        return model
+    return LinearPredictor.from_results(model)
+
+def matchup_columns(team_comp, opp_comp, n_clusters):
+    """The signed team_comp{i}_v_opp_comp{j} columns built in util.merge_team_and_draft"""
+    matchups = matchup_matrix(team_comp, opp_comp, n_clusters)
+    return dict(zip(matchup_column_names(n_clusters), matchups.T))
+
+def serve(scorer, requests=sys.stdin, responses=sys.stdout):
+    """Answer JSON-lines scoring requests until the input is closed.
+
+    Each request looks like {"blue": [...5 champions], "red": [...], "blue_difs":
+    {"top": 0.1, ...}} with an optional "red_difs", and is answered with one line of
+    scores per side, or {"error": ...} if the request could not be scored.
+    """
+    for line in requests:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            response = scorer.score(request["blue"], request["red"],
+                                    request["blue_difs"], request.get("red_difs"))
+        except (KeyError, ValueError, TypeError) as error:
+            response = {"error": f"{type(error).__name__}: {error}"}
+        responses.write(json.dumps(response) + "\n")
+        responses.flush()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        import model_store
+        fitted_scorer = model_store.load_bundle(sys.argv[1]).scorer()
+    else:
+        import pipeline
+        import util
+
+        # Fit every model once, then keep serving from memory
+        _, fitted_scorer = pipeline.run_pipeline(util.load_match_data())
+    serve(fitted_scorer)
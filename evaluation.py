@@ -0,0 +1,243 @@
+import contextlib
+import io
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import draft_model
+import final_model
+import instrument
+import player_model
+import shared_pool
+import util
+from design import DesignMatrixBuilder, matchup_column_names, matchup_matrix
+
+# Only models scored on the same games are differenced. The bookie odds have no
+# gameid to match them to the model's games, so the bookie is never a baseline here
+COMPARISONS = [("post_draft_win", "draft_agnostic_win"),
+               ("post_draft_lane_lead", "draft_agnostic_lane_lead")]
+
+def paired_games(match_data):
+    """Row positions of the two sides of every game that pairs up, as a
+    (n_games, 2) array. Games util.pair_opponents can't pair are left out"""
+    games = match_data[["gameid", "teamname", "opponent"]].assign(team_comp=np.arange(len(match_data)))
+    opponent_rows, malformed = util.pair_opponents(games)
+    rows = np.arange(len(match_data))
+    first = (opponent_rows > rows) & ~match_data["gameid"].isin(malformed["gameid"]).to_numpy()
+    return np.column_stack([rows[first], opponent_rows[first]])
+
+def game_splits(n_games, method="kfold", n_splits=5, seed=0):
+    """(train, test) arrays of game indices.
+
+    kfold:     the games shuffled into n_splits folds, each fold the test set once
+    bootstrap: n_splits resamples of the games with replacement, tested on the
+               games each resample left out"""
+    rng = np.random.default_rng(seed)
+    if method == "kfold":
+        folds = rng.permutation(n_games) % n_splits
+        return [(np.flatnonzero(folds != k), np.flatnonzero(folds == k)) for k in range(n_splits)]
+    if method == "bootstrap":
+        splits = []
+        for _ in range(n_splits):
+            train = rng.integers(0, n_games, n_games)
+            splits.append((train, np.setdiff1d(np.arange(n_games), train)))
+        return splits
+    raise ValueError(f"method must be 'kfold' or 'bootstrap', not {method!r}")
+
+def brier_and_accuracy(target, prob):
+    """Brier score and accuracy of rounded probabilities, over rows with a target"""
+    target, prob = np.asarray(target, dtype=float), np.asarray(prob, dtype=float)
+    known = ~np.isnan(target)
+    target, prob = target[known], prob[known]
+    return {"brier": np.mean((prob - target) ** 2), "accuracy": np.mean(np.round(prob) == target)}
+
+def win_frame(data, lead_probs, team_comp, pairs, games, n_clusters):
+    """Frame with the win model columns, both sides of each of the games"""
+    rows, opponents = pairs[games].ravel(), pairs[games][:, ::-1].ravel()
+    frame = pd.DataFrame({
+        "gameid": np.repeat(np.arange(len(games)), 2),
+        "result": data["result"].to_numpy()[rows],
+        "side": pd.Categorical(np.where(data["blue_side"].to_numpy()[rows] == 1, "Blue", "Red"),
+                               categories=["Blue", "Red"])})
+    for column, values in lead_probs.items():
+        frame[column] = values[rows]
+    matchups = matchup_matrix(team_comp[rows], team_comp[opponents], n_clusters)
+    return pd.concat([frame, pd.DataFrame(matchups.astype(np.int64),
+                                          columns=matchup_column_names(n_clusters))], axis=1)
+
+def warm_fit(fit, *args, start_params=None, **kwargs):
+    """fit(*args, start_params=start_params, **kwargs), fitting again from the
+    default start when the warm started solver fails, e.g. the L1 solver stopping
+    where the Hessian of the unpenalised params is singular"""
+    if start_params is not None:
+        try:
+            return fit(*args, start_params=start_params, **kwargs)
+        except np.linalg.LinAlgError:
+            pass
+    return fit(*args, **kwargs)
+
+def evaluate_split(data, design, pairs, train_games, test_games, n_clusters=7, seed=0, sparse=False,
+                   warm_start=None):
+    """Fit the six lane models, the draft clustering and both win models on the
+    train games and score them on the test games, the way run_pipeline fits them.
+
+    data holds the model_data_columns of every match row, design is a
+    DesignMatrixBuilder over it. Given a warm_start dictionary, every fit starts
+    from the params and centroids it holds, and they are replaced with this
+    split's. Returns {model: {"brier": ..., "accuracy": ..., "iterations": ...}}"""
+
+    warm = warm_start if warm_start is not None else {}
+    train_rows, test_rows = pairs[train_games].ravel(), pairs[test_games].ravel()
+    scores, lead_probs = {}, {}
+    for use_draft in [False, True]:
+        name = player_model.model_name(use_draft)
+        for lane, pos_list in player_model.LANE_POSITIONS.items():
+            lead = data[f"{lane}_lead_at_15"].to_numpy()
+            names = player_model.lane_design_columns(lane, pos_list, use_draft)
+            model = warm_fit(player_model.fit_lane_design, design, lead, names, train_rows,
+                             start_params=warm.get(f"{name}_{lane}_lead"))
+            lead_probs[f"{name}_{lane}_lead_prob"] = model.predict(design)
+            scores[f"{name}_{lane}_lead"] = brier_and_accuracy(
+                lead[test_rows], lead_probs[f"{name}_{lane}_lead_prob"][test_rows])
+            scores[f"{name}_{lane}_lead"]["iterations"] = instrument.solver_stats(model)["iterations"]
+            warm[f"{name}_{lane}_lead"] = model.params
+        lanes = [scores[f"{name}_{lane}_lead"] for lane in player_model.LANE_POSITIONS]
+        scores[f"{name}_lane_lead"] = {metric: np.mean([lane[metric] for lane in lanes])
+                                       for metric in ["brier", "accuracy"]}
+
+    clusters = draft_model.fit_draft_clusters(data.iloc[train_rows], n_clusters, random_state=seed,
+                                              init_clusters=warm.get("clusters"))
+    warm["clusters"] = clusters
+    team_comp = clusters.predict(data)
+    train = win_frame(data, lead_probs, team_comp, pairs, train_games, n_clusters)
+    test = win_frame(data, lead_probs, team_comp, pairs, test_games, n_clusters)
+    with contextlib.redirect_stdout(io.StringIO()):
+        win_models = {
+            "draft_agnostic": warm_fit(final_model.train_draft_agnostic_model, train,
+                                       start_params=warm.get("draft_agnostic_win")),
+            "post_draft": warm_fit(final_model.train_post_draft_model, train,
+                                   matchup_column_names(n_clusters), train, sparse=sparse,
+                                   start_params=warm.get("post_draft_win")),
+        }
+    for name, model in win_models.items():
+        final_model.predict_with_model(test, model, name)
+        scores[f"{name}_win"] = brier_and_accuracy(test["result"], test[f"{name}_win_prob"])
+        scores[f"{name}_win"]["iterations"] = instrument.solver_stats(model)["iterations"]
+        warm[f"{name}_win"] = model.params
+    return scores
+
+def _shared_model_data(values, columns, pairs):
+    # The lane design matrices built by one split are reused by the next split the
+    # worker runs, only their train rows change
+    data = pd.DataFrame(values, columns=columns, copy=False)
+    return data, DesignMatrixBuilder(data), pairs
+
+def _evaluate_shared_split(train_games, test_games, n_clusters, seed, sparse):
+    data, design, pairs = shared_pool.worker_state()
+    return evaluate_split(data, design, pairs, train_games, test_games, n_clusters, seed, sparse)
+
+def model_data_columns():
+    """Columns evaluate_split reads: every lane model column, CLUSTER_COLUMNS of
+    the reduced draft, result and blue_side"""
+    columns = sorted({column for use_draft in [False, True]
+                      for lane, pos_list in player_model.LANE_POSITIONS.items()
+                      for column in player_model.lane_data_columns(lane, pos_list, use_draft)})
+    return columns + draft_model.CLUSTER_COLUMNS + ["result", "blue_side"]
+
+def fill_model_data(values, match_data, drafts, columns):
+    """Write the model_data_columns of match_data and its reduced drafts into a
+    (rows, columns) float array"""
+    n_match = len(columns) - len(draft_model.CLUSTER_COLUMNS) - 2
+    values[:, :n_match] = match_data[columns[:n_match]].to_numpy(dtype=np.float64)
+    values[:, n_match:-2] = drafts[draft_model.CLUSTER_COLUMNS].to_numpy(dtype=np.float64)
+    values[:, -2] = match_data["result"].to_numpy(dtype=np.float64)
+    values[:, -1] = (match_data["side"] == "Blue").to_numpy(dtype=np.float64)
+    return values
+
+def load_bookie_odds(path="data/b365_odds.tsv"):
+    """Result and hold adjusted implied win probability of the home side, as in
+    model_analysis.print_bookie_stats"""
+    bookie_odds = pd.read_csv(path, sep='\t')
+    bookie_odds["implied_win_prob"] = bookie_odds['implied_h_prob'] / (
+        bookie_odds['implied_h_prob'] + bookie_odds['implied_a_prob'])
+    return bookie_odds
+
+def evaluate_models(match_data, method="kfold", n_splits=5, n_clusters=7, seed=0, sparse=False,
+                    n_jobs=None, champion_mapping=None, bookie_path="data/b365_odds.tsv"):
+    """Brier score and accuracy of every lane and win model on each of n_splits
+    k-fold or bootstrap splits of the games, see game_splits. Both sides of a game
+    are always on the same side of a split.
+
+    The splits run on a pool of n_jobs processes (default: one per core). The
+    model columns are copied once into shared memory that every worker maps. The
+    bookie odds, which need no fitting, are split the same way on their own rows,
+    which are not the model's games. The post draft model is fitted dense, as
+    run_pipeline fits it, unless sparse.
+
+    Returns a tidy frame with one row per split, model and metric"""
+
+    if champion_mapping is None:
+        champion_mapping = draft_model.load_champion_mapping()
+    player_model.calculate_positional_differences(match_data)
+    drafts = draft_model.reduce_team_drafts(match_data, draft_model.ChampionTable(champion_mapping))
+    pairs = paired_games(match_data)
+
+    columns = model_data_columns()
+    shape = (len(match_data), len(columns))
+    splits = game_splits(len(pairs), method, n_splits, seed)
+
+    with shared_pool.SharedArray(shape, order="F") as shared:
+        fill_model_data(shared.values, match_data, drafts, columns)
+        if n_jobs == 1:
+            data = pd.DataFrame(shared.values, columns=columns, copy=False)
+            design = DesignMatrixBuilder(data)
+            results = [evaluate_split(data, design, pairs, train, test, n_clusters, seed + split, sparse)
+                       for split, (train, test) in enumerate(splits)]
+            del data, design
+        else:
+            with shared.pool(n_jobs, _shared_model_data, columns, pairs) as pool:
+                futures = [pool.submit(_evaluate_shared_split, train, test, n_clusters,
+                                       seed + split, sparse)
+                           for split, (train, test) in enumerate(splits)]
+                results = [future.result() for future in futures]
+
+    if bookie_path is not None:
+        bookie_odds = load_bookie_odds(bookie_path)
+        for scores, (_, test) in zip(results, game_splits(len(bookie_odds), method, n_splits, seed)):
+            scores["bookie"] = brier_and_accuracy(bookie_odds["result"].to_numpy()[test],
+                                                  bookie_odds["implied_win_prob"].to_numpy()[test])
+
+    return pd.DataFrame([(split, model, metric, value)
+                         for split, scores in enumerate(results)
+                         for model, metrics in scores.items()
+                         for metric, value in metrics.items()],
+                        columns=["split", "model", "metric", "value"])
+
+def summarise_scores(scores, method="kfold", level=0.95, comparisons=COMPARISONS):
+    """Estimate and confidence interval of every model and metric in the scores of
+    evaluate_models, and of the differences between the model pairs in
+    comparisons, taken split by split.
+
+    kfold intervals are t intervals on the mean over folds, bootstrap intervals
+    are percentiles of the resampled scores"""
+
+    # pivot, not pivot_table, so a model whose score is missing on every split
+    # is summarised as NaN instead of dropped
+    table = scores.pivot(index="split", columns=["model", "metric"], values="value")
+    for model, baseline in comparisons:
+        if model in table.columns.get_level_values(0) and baseline in table.columns.get_level_values(0):
+            for metric in ["brier", "accuracy"]:
+                table[(f"{model} - {baseline}", metric)] = table[(model, metric)] - table[(baseline, metric)]
+
+    rows = []
+    for (model, metric), values in table.items():
+        values = values.to_numpy()
+        estimate = np.mean(values)
+        if method == "kfold":
+            half_width = stats.t.ppf(0.5 + level / 2, len(values) - 1) * \
+                np.std(values, ddof=1) / np.sqrt(len(values))
+            low, high = estimate - half_width, estimate + half_width
+        else:
+            low, high = np.percentile(values, [50 - 50 * level, 50 + 50 * level])
+        rows.append((model, metric, estimate, low, high, len(values)))
+    return pd.DataFrame(rows, columns=["model", "metric", "estimate", "ci_low", "ci_high", "n_splits"])
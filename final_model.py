@@ -1,36 +1,175 @@
-import statsmodels.formula.api as smf
 import statsmodels.api as sm
 import numpy as np
+import pandas as pd
+import scipy.linalg
+import scipy.sparse
 
-def train_draft_agnostic_model(train_data):
-    """Train the draft agnostic model"""
+import instrument
 
-    draft_agnostic_lead_prob_model = smf.logit(
-        formula="result ~ side + (draft_agnostic_bot_lead_prob + draft_agnostic_mid_lead_prob + draft_agnostic_top_lead_prob)**2 - 1",
-        data=train_data
-    ).fit_regularized(alpha=3)
-    return draft_agnostic_lead_prob_model
+from design import (DesignMatrixBuilder, DesignResults, LinearPredictor, align_params,
+                    categorical_columns, squared_terms, unique_terms)
 
-def train_post_draft_model(train, list_of_comps, match_data):
-    """Train the post draft model"""
+LEAD_PROBS = ["bot", "mid", "top"]
+
+def draft_agnostic_columns(train_data):
+    """Design columns of `result ~ side + (bot + mid + top lead probs)**2 - 1`"""
+    return categorical_columns(train_data, "side") + \
+        squared_terms([f"draft_agnostic_{lane}_lead_prob" for lane in LEAD_PROBS])
+
+def post_draft_columns(train_data, comps):
+    """Design columns of `result ~ side + (bot + mid + top lead probs + comp)**2 + ... - 1`"""
+    lead_probs = [f"post_draft_{lane}_lead_prob" for lane in LEAD_PROBS]
+    columns = categorical_columns(train_data, "side")
+    for comp in comps:
+        columns += squared_terms(lead_probs + [comp])
+    return unique_terms(columns)
+
+@instrument.stage
+def train_draft_agnostic_model(train_data, design=None, start_params=None):
+    """Train the draft agnostic model, optionally starting from the params of a
+    previous fit. The results predict from match data like a formula fit's"""
+
+    if design is None:
+        design = DesignMatrixBuilder(train_data)
+    names = draft_agnostic_columns(train_data)
+    draft_agnostic_lead_prob_model = sm.Logit(
+        train_data["result"].to_numpy(dtype=float),
+        design.frame(names)
+    ).fit_regularized(start_params=align_params(start_params, names), alpha=3)
+    return DesignResults(draft_agnostic_lead_prob_model)
+
+@instrument.stage
+def train_post_draft_model(train, list_of_comps, match_data, design=None, sparse=False,
+                           start_params=None):
+    """Train the post draft model. With sparse the design is held as a CSR matrix
+    and fitted with fit_sparse_binomial_glm, which keeps memory and fit time
+    practical for 15-20 clusters. start_params, the params of a previous fit,
+    warm start the IRLS iterations"""
 
     # If there aren't more than 100 games of a matchup ignore
-    string_list = ''
-    for i in list_of_comps:
-        if np.sum(abs(match_data[i])) >= 100:
-            string_list += f' + (post_draft_bot_lead_prob + post_draft_mid_lead_prob + post_draft_top_lead_prob + {i})**2'
-    formula = f"result ~ side {string_list} - 1"
-
-    # The logit function from smf doesn't handle the large data well. This is equivilant
-    post_draft_lead_prob_model = smf.glm(
-            formula=formula,
-            data=train, family=sm.families.Binomial()
-           ).fit()    
-           
-    return post_draft_lead_prob_model
+    comps = [i for i in list_of_comps if np.sum(abs(match_data[i])) >= 100]
+
+    if design is None:
+        design = DesignMatrixBuilder(train)
+    names = post_draft_columns(train, comps)
+    if sparse:
+        return fit_sparse_binomial_glm(train["result"].to_numpy(dtype=float),
+                                       design.sparse_matrix(names), names,
+                                       start_params=align_params(start_params, names))
+
+    # The Logit model doesn't handle the large data well. This is equivilant
+    post_draft_lead_prob_model = sm.GLM(
+            train["result"].to_numpy(dtype=float),
+            design.frame(names), family=sm.families.Binomial()
+           ).fit(start_params=align_params(start_params, names))
+
+    return DesignResults(post_draft_lead_prob_model)
+
+class SparseGLMResults:
+    """Coefficients and convergence of fit_sparse_binomial_glm"""
+
+    def __init__(self, params, iterations, converged, deviance, rank):
+        self.params = params
+        self.iterations = iterations
+        self.converged = converged
+        self.deviance = deviance
+        self.rank = rank
+
+    def __repr__(self):
+        return (f"SparseGLMResults({len(self.params)} params, rank {self.rank}, "
+                f"{self.iterations} iterations, converged={self.converged})")
+
+    def predict(self, match_data):
+        return LinearPredictor.from_results(self).predict(match_data)
 
+def logistic(linear_predictor):
+    """Inverse logit link, clipped away from 0 and 1 like statsmodels' Logit link
+    so the IRLS weights mu * (1 - mu) never vanish"""
+    eps = np.finfo(float).eps
+    return np.clip(1 / (1 + np.exp(-linear_predictor)), eps, 1 - eps)
+
+def binomial_deviance(endog, mu):
+    mu = np.clip(mu, np.finfo(float).eps, 1 - np.finfo(float).eps)
+    return -2 * np.sum(endog * np.log(mu) + (1 - endog) * np.log(1 - mu))
+
+def fit_sparse_binomial_glm(endog, exog, names, maxiter=100, tol=1e-8, start_params=None):
+    """Logistic regression on a scipy.sparse design by iteratively reweighted least
+    squares, following GLM(family=Binomial()).fit(): the same starting values,
+    and iterating until the deviance changes by less than tol.
+
+    Each step solves the weighted normal equations X'WX b = X'Wz, a dense
+    (columns x columns) system built from sparse products, so no dense
+    rows x columns matrix is formed. The matchup design is rank deficient
+    (team_comp{i}_v_opp_comp{j} is the negation of team_comp{j}_v_opp_comp{i})
+    so, like the pseudo-inverse statsmodels falls back on, the minimum norm
+    solution is returned. The null space does not depend on the weights, so a
+    full rank subset of columns and the null space are found once, each step is
+    solved on the subset by Cholesky and projected off the null space.
+    start_params replace the starting values, as in GLM.fit(start_params=...),
+    when their deviance is lower than that of the default start, which is built
+    from the responses themselves."""
+
+    endog = np.asarray(endog, dtype=float)
+    exog = scipy.sparse.csr_matrix(exog)
+
+    gram = (exog.T @ exog).toarray()
+    eigenvalues, eigenvectors = np.linalg.eigh(gram)
+    null = eigenvalues <= eigenvalues.max() * len(gram) * np.finfo(float).eps
+    null_space = eigenvectors[:, null]
+    rank = len(gram) - null.sum()
+    pivots = scipy.linalg.qr(gram, pivoting=True, mode="r")[1]
+    independent = np.sort(pivots[:rank])
+
+    mu = (endog + 0.5) / 2
+    linear_predictor = np.log(mu / (1 - mu))
+    deviance = binomial_deviance(endog, mu)
+    params = None
+    if start_params is not None:
+        # Only start from start_params when they fit better than the default start
+        start_predictor = exog @ np.asarray(start_params, dtype=float)
+        start_deviance = binomial_deviance(endog, logistic(start_predictor))
+        if start_deviance < deviance:
+            params = np.asarray(start_params, dtype=float)
+            linear_predictor, mu, deviance = start_predictor, logistic(start_predictor), start_deviance
+    converged = False
+    for iteration in range(1, maxiter + 1):
+        weights = mu * (1 - mu)
+        working_endog = linear_predictor + (endog - mu) / weights
+
+        weighted_gram = (exog.T @ scipy.sparse.diags(weights) @ exog).toarray()
+        moments = exog.T @ (weights * working_endog)
+        new_params = np.zeros(exog.shape[1])
+        new_params[independent] = scipy.linalg.cho_solve(
+            scipy.linalg.cho_factor(weighted_gram[np.ix_(independent, independent)]),
+            moments[independent])
+        new_params -= null_space @ (null_space.T @ new_params)
+
+        linear_predictor = exog @ new_params
+        mu = logistic(linear_predictor)
+        new_deviance = binomial_deviance(endog, mu)
+        # Halve the step while the deviance goes up, as R's glm2 does, so a poor
+        # start_params can't make the iterations diverge
+        for _ in range(30):
+            if params is None or new_deviance <= deviance:
+                break
+            new_params = (new_params + params) / 2
+            linear_predictor = exog @ new_params
+            mu = logistic(linear_predictor)
+            new_deviance = binomial_deviance(endog, mu)
+        params = new_params
+        deviance, previous = new_deviance, deviance
+        if abs(deviance - previous) <= tol:
+            converged = True
+            break
+
+    return SparseGLMResults(pd.Series(params, index=list(names)), iteration, converged,
+                            deviance, rank)
+
+@instrument.stage
 def predict_with_model(match_data, model, model_name):
-    
+
+    if not isinstance(model, LinearPredictor):
+        model = LinearPredictor.from_results(model)
     match_data[f'{model_name}_win_prob'] = model.predict(
         match_data)
 
@@ -40,4 +179,4 @@ def predict_with_model(match_data, model, model_name):
                                                 match_data.groupby(
                                                     'gameid')[
                                                     f'{model_name}_win_prob'].transform(
-                                                    'sum')
\ No newline at end of file
+                                                    'sum')
@@ -0,0 +1,96 @@
+import os
+
+import pandas as pd
+
+import draft_model
+import final_model
+import model_store
+import pipeline
+import player_model
+import util
+from match_store import MatchStore
+from rollups import DraftRollups
+
+SCORED_COLUMNS = [f"{name}_{lane}_lead_prob"
+                  for name in ["draft_agnostic", "post_draft"]
+                  for lane in ["top", "mid", "bot"]] + \
+                 ["team_comp", "draft_agnostic_win_prob", "post_draft_win_prob", "draft_diff"]
+
+def score_matches(match_data, scorer):
+    """Add the lane lead probabilities, team_comp, win probabilities and draft_diff
+    to match_data with already fitted models. Nothing is refit: clusters are
+    assigned from the frozen centroids.
+
+    Both sides of a game must be in match_data. Games that can't be paired keep
+    their lane lead probabilities but get NaN win probabilities."""
+
+    player_model.calculate_positional_differences(match_data)
+    for name, models in scorer.lane_models.items():
+        for lane, model in models.items():
+            match_data[f"{name}_{lane}_lead_prob"] = model.predict(match_data)
+
+    # Lineups already in the scorer's cache skip reduction and clustering
+    codes = draft_model.encode_team_drafts(match_data, scorer.champion_table)
+    match_drafts = pd.DataFrame({"id": match_data["id"].to_numpy(),
+                                 "team_comp": scorer.cache.team_comp(codes)})
+
+    full_data, _ = util.merge_team_and_draft(match_data.drop(columns="team_comp", errors="ignore"),
+                                             match_drafts, scorer.clusters.n_clusters)
+    match_data["team_comp"] = match_drafts["team_comp"].to_numpy()
+    for name, model in scorer.win_models.items():
+        final_model.predict_with_model(full_data, model, name)
+    full_data["draft_diff"] = full_data["post_draft_win_prob"] - full_data["draft_agnostic_win_prob"]
+
+    win_columns = ["draft_agnostic_win_prob", "post_draft_win_prob", "draft_diff"]
+    scored = match_data[["gameid", "teamname"]].merge(
+        full_data[["gameid", "teamname"] + win_columns], how="left", on=["gameid", "teamname"])
+    for column in win_columns:
+        match_data[column] = scored[column].to_numpy()
+    return match_data
+
+def update_match_store(new_match_data, store_path="data/match-store",
+                       bundle_path="data/model-bundle", refit=False, n_clusters=7,
+                       rollups_path=None):
+    """Score match rows whose id is not stored yet and append them to the store.
+
+    By default the models in the bundle are reused, so the run time grows with
+    the number of new games only. With refit=True every model is refit on the
+    stored history plus the new rows, the bundle is overwritten and the whole
+    store is rescored. n_clusters is only used by a refit, otherwise the
+    bundle's are. With a rollups_path the DraftRollups there are updated with
+    the new rows, or rebuilt after a refit. Returns the newly stored rows."""
+
+    store = MatchStore(store_path)
+    new_rows = new_match_data[~new_match_data["id"].isin(store.ids())].copy()
+
+    if refit:
+        history = store.load()
+        history = history.drop(columns=[c for c in SCORED_COLUMNS if c in history.columns])
+        history = pipeline_input(history, new_rows)
+        _, scorer = pipeline.run_pipeline(history.copy(), n_clusters=n_clusters)
+        model_store.save_bundle(bundle_path, scorer)
+        store.replace(score_matches(history, scorer))
+        if rollups_path is not None:
+            DraftRollups(rollups_path).replace(history, scorer.clusters.n_clusters)
+        return history[history["id"].isin(new_rows["id"])]
+
+    if not os.path.exists(os.path.join(bundle_path, "manifest.json")):
+        raise FileNotFoundError(f"No fitted model bundle at {bundle_path}, "
+                                f"run a full refit first with refit=True")
+    if len(new_rows) == 0:
+        return new_rows
+
+    bundle = model_store.load_bundle(bundle_path)
+    # Raises before anything is stored if the rollups were built with other clusters
+    rollups = None if rollups_path is None else DraftRollups(rollups_path, bundle.n_clusters)
+    scored = score_matches(new_rows, bundle.scorer())
+    store.append(scored)
+    if rollups is not None:
+        rollups.update(scored)
+    return scored
+
+def pipeline_input(history, new_rows):
+    """Stored and new rows as one frame, in the order they were ingested"""
+    if len(history) == 0:
+        return new_rows.reset_index(drop=True)
+    return pd.concat([history, new_rows], ignore_index=True)
@@ -0,0 +1,224 @@
+"""Opt-in timing, memory and solver records for the pipeline functions.
+
+Functions decorated with @stage run untouched until recording is switched on
+with enable() or the recording() context manager. While recording, every call
+emits one JSON record with its wall and CPU time, peak RSS, the rows it was
+given and returned, and the iterations and convergence of any fitted model it
+returns. The peak RSS is None where the kernel's high-water mark can't be
+reset, as it would only be the peak of the whole process. With a profile_dir
+each outermost stage also writes a cProfile dump, which snakeviz or flameprof
+turn into a flame graph.
+"""
+import contextlib
+import cProfile
+import functools
+import inspect
+import json
+import os
+import sys
+import time
+import warnings
+
+_recorder = None
+# Whether reset_peak_rss works here, None until it is first tried
+_peak_resettable = None
+
+def memory_status():
+    """The VmHWM (peak) and VmRSS (current) resident memory in MB, empty off Linux"""
+    memory = {}
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith(("VmHWM:", "VmRSS:")):
+                    memory[line[:5]] = int(line.split()[1]) / 1e3
+    except OSError:
+        pass
+    return memory
+
+def peak_rss_mb():
+    """Peak resident memory of this process. ru_maxrss can carry over the parent's
+    peak through fork and exec on Linux, so prefer the kernel's VmHWM"""
+    memory = memory_status()
+    if "VmHWM" in memory:
+        return memory["VmHWM"]
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+def reset_peak_rss():
+    """Start a new VmHWM high-water mark, so peak_rss_mb measures from here on.
+
+    Returns False where that isn't possible, e.g. off Linux or in a container
+    whose /proc/self/clear_refs isn't writable or is ignored, and warns the first
+    time. peak_rss_mb is then the peak of the whole process, not of what follows"""
+    global _peak_resettable
+    if _peak_resettable is False:
+        return False
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        # A reset high-water mark starts at the current RSS
+        memory = memory_status()
+        resettable = memory["VmHWM"] - memory["VmRSS"] < 1.0
+    except (OSError, KeyError):
+        resettable = False
+    if not resettable:
+        warnings.warn("The peak RSS can't be reset here, so per stage peaks are not "
+                      "available and are reported as None", RuntimeWarning, stacklevel=2)
+    _peak_resettable = resettable
+    return resettable
+
+def n_rows(value):
+    """Rows of a frame or array, or of the first element of a returned tuple"""
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    shape = getattr(value, "shape", None)
+    return shape[0] if shape else None
+
+def scalar_arguments(signature, args, kwargs):
+    """The bool, number and string arguments of a call by name, e.g. use_draft_info,
+    so calls of the same stage can be told apart"""
+    try:
+        bound = signature.bind(*args, **kwargs)
+    except TypeError:
+        return {}
+    return {name: value for name, value in bound.arguments.items()
+            if isinstance(value, (bool, int, float, str))}
+
+def solver_stats(result):
+    """Iterations and convergence of a fitted statsmodels or sparse GLM result"""
+    if hasattr(result, "fit_history"):
+        return {"iterations": result.fit_history.get("iteration"),
+                "converged": bool(result.converged)}
+    retvals = getattr(result, "mle_retvals", None)
+    if retvals is not None:
+        return {"iterations": retvals.get("iterations"), "converged": retvals.get("converged")}
+    if hasattr(result, "iterations") and hasattr(result, "converged"):
+        return {"iterations": result.iterations, "converged": bool(result.converged)}
+    return {}
+
+class Recorder:
+    """Collects stage records, writing each as a JSON line to path when given
+    (a file name, or an open file such as sys.stderr)"""
+    def __init__(self, path=None, profile_dir=None):
+        self.records = []
+        self.profile_dir = profile_dir
+        if profile_dir is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+        self.owns_file = isinstance(path, (str, os.PathLike))
+        self.file = open(path, "a") if self.owns_file else path
+        self.stack = []
+        self.profiling = False
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+
+    def emit(self, record):
+        self.records.append(record)
+        if self.file is not None:
+            self.file.write(json.dumps(record, default=str) + "\n")
+            self.file.flush()
+
+    def fold_peak(self, peak):
+        """Raise the enclosing stage's peak to peak. A peak of None, as once the
+        high-water mark can't be reset, leaves the enclosing stage's unknown too"""
+        if not self.stack or self.stack[-1]["peak_rss_mb"] is None:
+            return
+        self.stack[-1]["peak_rss_mb"] = None if peak is None else \
+            max(self.stack[-1]["peak_rss_mb"], peak)
+
+    def run(self, name, func, signature, args, kwargs):
+        record = {"stage": name, "depth": len(self.stack),
+                  "parent": self.stack[-1]["stage"] if self.stack else None,
+                  "arguments": scalar_arguments(signature, args, kwargs),
+                  "rows_in": n_rows(args[0]) if args else None}
+        # The enclosing stage keeps the peak reached before this one resets it
+        self.fold_peak(peak_rss_mb())
+        self.stack.append(record)
+
+        profiler = None
+        if self.profile_dir is not None and not self.profiling:
+            profiler, self.profiling = cProfile.Profile(), True
+        record["peak_rss_mb"] = 0.0 if reset_peak_rss() else None
+        start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            result = func(*args, **kwargs)
+        except BaseException as error:
+            record["error"] = type(error).__name__
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record["wall_seconds"] = time.perf_counter() - start
+            record["cpu_seconds"] = time.process_time() - cpu_start
+            if record["peak_rss_mb"] is not None:
+                record["peak_rss_mb"] = max(record["peak_rss_mb"], peak_rss_mb())
+            self.stack.pop()
+            self.fold_peak(record["peak_rss_mb"])
+            if profiler is not None:
+                self.profiling = False
+                record["profile"] = os.path.join(self.profile_dir,
+                                                 f"{len(self.records):04d}-{name}.prof")
+                profiler.dump_stats(record["profile"])
+            if "error" in record:
+                self.emit(record)
+
+        record["rows_out"] = n_rows(result)
+        record.update(solver_stats(result))
+        self.emit(record)
+        return result
+
+def stage(func):
+    """Record every call of func while recording is enabled"""
+    name = f"{func.__module__}.{func.__qualname__}"
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _recorder is None:
+            return func(*args, **kwargs)
+        return _recorder.run(name, func, signature, args, kwargs)
+    return wrapper
+
+def note(**fields):
+    """Add fields to the record of the stage running now, e.g. solver stats the
+    stage's return value doesn't carry. Does nothing when not recording"""
+    if _recorder is not None and _recorder.stack:
+        _recorder.stack[-1].update(fields)
+
+def enable(path=None, profile_dir=None):
+    """Start recording stages, returning the Recorder"""
+    global _recorder
+    disable()
+    _recorder = Recorder(path, profile_dir)
+    return _recorder
+
+def disable():
+    """Stop recording"""
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+    _recorder = None
+
+@contextlib.contextmanager
+def recording(path=None, profile_dir=None):
+    """Record the stages run inside the with block. Yields the Recorder, whose
+    records list holds every record once the block exits"""
+    recorder = enable(path, profile_dir)
+    try:
+        yield recorder
+    finally:
+        disable()
+
+if __name__ == "__main__":
+    # Summarise a JSON lines file, slowest stages first
+    with open(sys.argv[1]) as records_file:
+        records = [json.loads(line) for line in records_file if line.strip()]
+    for record in sorted(records, key=lambda record: -record["wall_seconds"]):
+        peak = "-" if record["peak_rss_mb"] is None else f"{record['peak_rss_mb']:.1f}"
+        print(f"{record['stage']:<50} {record['wall_seconds']:9.3f}s "
+              f"cpu {record['cpu_seconds']:9.3f}s  peak {peak:>8}MB"
+              + (f"  {record['iterations']} iterations, converged {record['converged']}"
+                 if record.get("iterations") is not None else ""))
@@ -0,0 +1,257 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# Stored as datetime64 however they are given, so range filters compare dates
+DATE_COLUMNS = ["date"]
+
+class MatchStore:
+    """Append-only columnar store of match rows on disk.
+
+    Every append writes a new partition directory holding one .npy file per
+    column, so adding a batch of games costs time proportional to the batch
+    rather than to the stored history. Columns are typed when written: strings
+    are dictionary encoded to small integer codes and come back as pandas
+    categoricals, integers are narrowed to the smallest type that holds them,
+    and dates are stored as datetime64. store_types gives a frame the same types
+    without writing it.
+
+    Loads read only the requested columns. Equality and range
+    filters skip whole partitions from their categories and min/max statistics,
+    and select rows, memory mapped, before any other column is read.
+
+    Every stored id is also kept in one ids side file, rewritten with each
+    append and named in the manifest, so ids() reads a single array instead of
+    the id column of every partition.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.manifest_path = os.path.join(path, "manifest.json")
+        self.partitions, self.next_partition, self.ids_file = [], 0, None
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+            self.partitions, self.next_partition = manifest["partitions"], manifest["next_partition"]
+            self.ids_file = manifest.get("ids")
+
+    def __len__(self):
+        return sum(partition["rows"] for partition in self.partitions)
+
+    def __repr__(self):
+        return f"MatchStore({self.path!r}, {len(self.partitions)} partitions, {len(self)} rows)"
+
+    @property
+    def columns(self):
+        columns = {}
+        for partition in self.partitions:
+            columns.update(dict.fromkeys(partition["columns"]))
+        return list(columns)
+
+    def _file(self, partition, column, suffix=".npy"):
+        return os.path.join(self.path, partition["name"],
+                            partition["columns"][column]["file"] + suffix)
+
+    def _write_manifest(self):
+        # Written after the partition files, so a failed append leaves the store as it was
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.manifest_path + ".tmp", "w") as manifest_file:
+            json.dump({"partitions": self.partitions, "next_partition": self.next_partition,
+                       "ids": self.ids_file}, manifest_file, indent=2)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def _remove_ids_file(self, ids_file):
+        if ids_file is not None and ids_file != self.ids_file:
+            os.remove(os.path.join(self.path, ids_file))
+
+    def ids(self):
+        """Every stored id"""
+        if self.ids_file is not None:
+            return np.load(os.path.join(self.path, self.ids_file), allow_pickle=False)
+        # Stores written without the side file
+        return concat_column([np.asarray(self._read(partition, "id")) for partition in self.partitions
+                              if "id" in partition["columns"]])
+
+    def append(self, match_data):
+        """Write the rows of match_data as a new partition"""
+        if len(match_data) == 0:
+            return
+        partition = {"name": f"part-{self.next_partition:05d}", "rows": len(match_data),
+                     "columns": {}}
+        self.next_partition += 1
+        os.makedirs(os.path.join(self.path, partition["name"]))
+
+        for k, column in enumerate(match_data.columns):
+            partition["columns"][column] = write_column(
+                os.path.join(self.path, partition["name"], f"c{k:04d}"), match_data[column])
+
+        # A new ids file per append, so the manifest still names a complete one
+        # if the append fails before the manifest is replaced
+        old_ids_file = self.ids_file
+        if "id" in match_data:
+            ids = store_type(match_data["id"])
+            ids = ids.astype(str).to_numpy(dtype=str) if isinstance(ids.dtype, pd.CategoricalDtype) \
+                else ids.to_numpy()
+            stored = self.ids()
+            ids_file = f"ids-{partition['name'][5:]}.npy"
+            np.save(os.path.join(self.path, ids_file),
+                    np.concatenate([stored, ids]) if len(stored) else ids, allow_pickle=False)
+            self.ids_file = ids_file
+
+        self.partitions.append(partition)
+        self._write_manifest()
+        self._remove_ids_file(old_ids_file)
+
+    def replace(self, match_data):
+        """Swap the whole contents of the store for match_data"""
+        old_partitions, self.partitions = self.partitions, []
+        old_ids_file, self.ids_file = self.ids_file, None
+        self.append(match_data)
+        self._write_manifest()
+        self._remove_ids_file(old_ids_file)
+        for partition in old_partitions:
+            shutil.rmtree(os.path.join(self.path, partition["name"]))
+
+    def _read(self, partition, column, rows=None):
+        """One column of a partition, decoded, optionally only the selected rows"""
+        if rows is None:
+            values = np.load(self._file(partition, column), allow_pickle=False)
+        else:
+            # Memory map so only the pages holding the selected rows are read
+            values = np.load(self._file(partition, column), mmap_mode="r", allow_pickle=False)[rows]
+        if partition["columns"][column]["kind"] == "category":
+            categories = np.load(self._file(partition, column, ".categories.npy"), allow_pickle=False)
+            return pd.Categorical.from_codes(values, categories)
+        return values
+
+    def _may_match(self, partition, equals, between):
+        """False when the partition statistics rule out every row"""
+        for column, values in equals.items():
+            schema = partition["columns"].get(column)
+            if schema is None:
+                return False
+            if schema["kind"] == "category":
+                categories = np.load(self._file(partition, column, ".categories.npy"),
+                                     allow_pickle=False)
+                if not np.isin(categories, values).any():
+                    return False
+        for column, (low, high) in between.items():
+            schema = partition["columns"].get(column)
+            if schema is None:
+                return False
+            if "min" not in schema:
+                continue
+            convert = np.datetime64 if schema["kind"] == "datetime" else float
+            if low is not None and convert(schema["max"]) < convert(low):
+                return False
+            if high is not None and convert(schema["min"]) >= convert(high):
+                return False
+        return True
+
+    def _row_mask(self, partition, equals, between):
+        mask = np.ones(partition["rows"], dtype=bool)
+        for column, values in equals.items():
+            mask &= np.asarray(pd.Series(self._read(partition, column)).isin(values))
+        for column, (low, high) in between.items():
+            values = self._read(partition, column)
+            if isinstance(values, pd.Categorical):
+                # Strings compare by value, missing values match no range
+                values, convert = pd.Series(np.asarray(values, dtype=object)), str
+            else:
+                convert = np.datetime64 if values.dtype.kind == "M" else float
+            if low is not None:
+                mask &= values >= convert(low)
+            if high is not None:
+                mask &= values < convert(high)
+        return mask
+
+    def load(self, columns=None, equals=None, between=None):
+        """Stored rows as a DataFrame.
+
+        columns:  only read these columns
+        equals:   {column: value or list of values} rows must match
+        between:  {column: (low, high)} with low <= value < high, either bound may be None
+        """
+        equals = {column: np.atleast_1d(values).tolist() for column, values in (equals or {}).items()}
+        between = between or {}
+        columns = self.columns if columns is None else list(columns)
+
+        pieces = {column: [] for column in columns}
+        for partition in self.partitions:
+            if not self._may_match(partition, equals, between):
+                continue
+            rows = None
+            if equals or between:
+                rows = np.flatnonzero(self._row_mask(partition, equals, between))
+                if len(rows) == 0:
+                    continue
+            n_rows = partition["rows"] if rows is None else len(rows)
+            for column in columns:
+                if column in partition["columns"]:
+                    pieces[column].append(self._read(partition, column, rows))
+                else:
+                    pieces[column].append(np.full(n_rows, np.nan))
+
+        return pd.DataFrame({column: concat_column(values) for column, values in pieces.items()},
+                            columns=columns)
+
+def store_type(series):
+    """A column with the type it is stored and loaded with: dates as datetime64,
+    integers narrowed, other non numeric columns as categoricals of strings"""
+    if series.name in DATE_COLUMNS or pd.api.types.is_datetime64_any_dtype(series):
+        return pd.to_datetime(series).astype("datetime64[ns]")
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_float_dtype(series):
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        return pd.to_numeric(series, downcast="integer")
+    if isinstance(series.dtype, pd.CategoricalDtype) and \
+            series.cat.categories.inferred_type in ("string", "empty"):
+        return series
+    return series.astype(str).where(series.notna()).astype("category")
+
+def store_types(match_data):
+    """match_data with the column types MatchStore.load returns"""
+    return pd.DataFrame({column: store_type(match_data[column]) for column in match_data.columns},
+                        columns=match_data.columns)
+
+def write_column(path, series):
+    """Save one column with a narrow type, returning its schema entry"""
+    schema = {"file": os.path.basename(path)}
+    series = store_type(series)
+
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.to_numpy(dtype="datetime64[ns]")
+        schema["kind"] = "datetime"
+    elif isinstance(series.dtype, pd.CategoricalDtype):
+        values = series.cat.codes.to_numpy()
+        np.save(path + ".categories.npy", np.asarray(series.cat.categories, dtype=str))
+        schema["kind"] = "category"
+    else:
+        values = series.to_numpy()
+        schema["kind"] = "numeric"
+
+    np.save(path + ".npy", values, allow_pickle=False)
+    if schema["kind"] != "category" and len(values):
+        low, high = np.nanmin(values), np.nanmax(values)
+        if not pd.isna(low):
+            schema["min"], schema["max"] = [str(value) if values.dtype.kind == "M" else value.item()
+                                            for value in (low, high)]
+    return schema
+
+def concat_column(values):
+    """Concatenate the pieces of one column read from several partitions"""
+    if not values:
+        return np.array([])
+    if len(values) == 1:
+        return values[0]
+    if not all(isinstance(piece, pd.Categorical) for piece in values):
+        return np.concatenate([np.asarray(piece) for piece in values])
+
+    # Re-code every partition against the union of their categories
+    categories = pd.Index(np.unique(np.concatenate([np.asarray(piece.categories, dtype=str)
+                                                    for piece in values])))
+    codes = [np.append(categories.get_indexer(piece.categories), -1)[piece.codes]
+             for piece in values]
+    return pd.Categorical.from_codes(np.concatenate(codes), categories)
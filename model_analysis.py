@@ -1,11 +1,13 @@
-from sklearn.metrics import brier_score_loss as brier_score
-from sklearn.metrics import accuracy_score as acc_score
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from sklearn import linear_model
+
+import rollups
+
+# matplotlib, scikit-learn and the model fitting modules are imported by the
+# functions that use them, so the data only helpers load without them
 
 def calibration_plot(match_data):
+    import matplotlib.pyplot as plt
     match_data['q'] = pd.cut(match_data['post_draft_win_prob'], 20)
 
     fig, ax = plt.subplots()
@@ -22,11 +24,16 @@ def calibration_plot(match_data):
     ax.set_ylabel("True Win Probability in each bin")
     ax.grid()
 
-def plot_cumulative_expected_wins_added_by_draft(match_data, league, teams):
-    lec = match_data[match_data['league'] == f'{league}']
-    lec = lec[lec['date'] >= '2022-01-01'] # Most reason whole season
-    lec['gamecount'] = lec.groupby('teamname')['draft_diff'].transform('cumcount')
-    lec['wpa'] = lec.groupby('teamname')['draft_diff'].transform('cumsum')
+def plot_cumulative_expected_wins_added_by_draft(match_data, league, teams, draft_rollups=None):
+    import matplotlib.pyplot as plt
+    if draft_rollups is not None:
+        # Read the league's team games from the rollups instead of the full frame
+        lec = draft_rollups.cumulative_draft_diff(league, start_date='2022-01-01')
+    else:
+        lec = match_data[match_data['league'] == f'{league}']
+        lec = lec[lec['date'] >= '2022-01-01'] # Most reason whole season
+        lec['gamecount'] = lec.groupby('teamname')['draft_diff'].transform('cumcount')
+        lec['wpa'] = lec.groupby('teamname')['draft_diff'].transform('cumsum')
     fig, ax = plt.subplots()
     colour_dict = teams
     for team in np.unique(lec['teamname']):
@@ -44,6 +51,8 @@ def plot_cumulative_expected_wins_added_by_draft(match_data, league, teams):
     return ax
 
 def print_model_results(test_data):
+    from sklearn.metrics import brier_score_loss as brier_score
+    from sklearn.metrics import accuracy_score as acc_score
 
     def win_predictor_stats(model_name):
         brier = brier_score(test_data['result'], test_data[f'{model_name}_win_prob'])
@@ -85,7 +94,21 @@ def print_model_results(test_data):
     Win prob accuracy: \t\t\t{win_accuracy}
     """)
 
+def print_evaluation_results(match_data, method="kfold", n_splits=5, level=0.95, **kwargs):
+    """Brier score and accuracy of every lane and win model and of the bookie
+    baseline with confidence intervals, from k-fold or bootstrap splits by gameid.
+    See evaluation.evaluate_models for the other arguments"""
+    import evaluation
+
+    scores = evaluation.evaluate_models(match_data, method, n_splits, **kwargs)
+    summary = evaluation.summarise_scores(scores, method, level)
+    print(summary.to_string(index=False, float_format="%.4f"))
+    return summary
+
 def print_bookie_stats():
+    from sklearn.metrics import brier_score_loss as brier_score
+    from sklearn.metrics import accuracy_score as acc_score
+
     bookie_odds = pd.read_csv("data/b365_odds.tsv", sep='\t')
     bookie_odds["implied_win_prob"] = bookie_odds['implied_h_prob'] / (bookie_odds['implied_h_prob'] + bookie_odds['implied_a_prob'])
     print("After adjusting for hold:")
@@ -98,15 +121,14 @@ def print_bookie_stats():
     )
 
 def get_teamcomps_for_lcs(match_data):
-    new = match_data.iloc[:, 17:66].idxmax(axis=1)
-    comp = new.str.split("_v_").to_list()
-    comp = [int(x[0].replace("team_comp", "")) for x in comp]
-    match_data['teamcomp'] = comp
-    tc_games = match_data.groupby("teamname", as_index=True)["teamcomp"].value_counts().to_frame("tc_count").reset_index()   #["teamcomp"].value_counts()
+    n_clusters = int(np.sqrt(sum("_v_opp_comp" in column for column in match_data.columns)))
+    match_data['teamcomp'] = rollups.team_comps_from_matchups(match_data, n_clusters)
+    tc_games = match_data.groupby("teamname", as_index=True, observed=True)["teamcomp"].value_counts().to_frame("tc_count").reset_index()   #["teamcomp"].value_counts()
     team_games = tc_games.pivot(index="teamname", columns="teamcomp", values="tc_count").fillna(0)
     return team_games
 
 def show_team_comp_frequencies(LCS_teamcomps):
+    import matplotlib.pyplot as plt
     tl_games = LCS_teamcomps.query("teamname=='Team Liquid'").values[0]
     all_LCS_games = LCS_teamcomps.sum(axis=0)
 
@@ -145,6 +167,8 @@ def show_team_comp_frequencies(LCS_teamcomps):
     fig.suptitle("Relative Frequency of Team Draft Clusters in the LCS")
 
 def lane_lead_correlations(games):
+    import matplotlib.pyplot as plt
+    from sklearn import linear_model
 
     reg_b = linear_model.LinearRegression().fit(games[['draft_agnostic_bot_lead_prob']], games[['post_draft_bot_lead_prob']])
     reg_m = linear_model.LinearRegression().fit(games[['draft_agnostic_mid_lead_prob']], games[['post_draft_mid_lead_prob']])
@@ -182,6 +206,7 @@ def lane_lead_correlations(games):
     return r2_b, r2_m, r2_t
 
 def plot_jojopyun_lane_lead_above_expected(match_data):
+    import matplotlib.pyplot as plt
     fig, ax = plt.subplots()
     match_data["mid_wins"] = match_data["mid_lead_at_15"] - match_data["post_draft_mid_lead_prob"]
     wins_above = match_data[["mid_wins"]].cumsum()
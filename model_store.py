@@ -0,0 +1,129 @@
+import json
+import os
+import time
+
+import numpy as np
+
+import draft_model
+from design import LinearPredictor
+from draft_scorer import DraftScorer
+
+BUNDLE_FORMAT = "lol-draft-model-bundle"
+BUNDLE_VERSION = 1
+
+COMPONENT_FILES = {
+    "champions":   "champions.csv",
+    "clusters":    "clusters.npz",
+    "lane_models": "lane_models.npz",
+    "win_models":  "win_models.npz",
+}
+
+def save_predictors(path, predictors):
+    """Store named LinearPredictors as their column order and coefficients"""
+    arrays = {}
+    for key, predictor in predictors.items():
+        arrays[f"{key}/names"] = np.array(predictor.names, dtype=str)
+        arrays[f"{key}/params"] = predictor.params
+    np.savez(path, **arrays)
+
+def load_predictors(path):
+    with np.load(path, allow_pickle=False) as arrays:
+        keys = sorted({name.rsplit("/", 1)[0] for name in arrays.files})
+        return {key: LinearPredictor(arrays[f"{key}/names"].tolist(), arrays[f"{key}/params"])
+                for key in keys}
+
+def save_bundle(path, scorer):
+    """Write every fitted component of a DraftScorer to the directory `path`.
+
+    The bundle holds the champion mapping, the zscore means/stds and KMeans
+    centroids, and the design-matrix column names and coefficients of the lane
+    lead and win probability models. Coefficients are stored as float64 so a
+    reloaded bundle predicts exactly what the fitted models did."""
+
+    os.makedirs(path, exist_ok=True)
+
+    draft_model.save_champion_mapping(scorer.champion_table.champions,
+                                      os.path.join(path, COMPONENT_FILES["champions"]))
+    np.savez(os.path.join(path, COMPONENT_FILES["clusters"]),
+             means=scorer.clusters.means, stds=scorer.clusters.stds,
+             centroids=scorer.clusters.centroids)
+    save_predictors(os.path.join(path, COMPONENT_FILES["lane_models"]),
+                    {f"{name}/{lane}": model
+                     for name, models in scorer.lane_models.items()
+                     for lane, model in models.items()})
+    save_predictors(os.path.join(path, COMPONENT_FILES["win_models"]), scorer.win_models)
+
+    # Written last so a partially written bundle is never loadable
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "version": BUNDLE_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "n_clusters": scorer.clusters.n_clusters,
+        "components": COMPONENT_FILES,
+    }
+    with open(os.path.join(path, "manifest.json"), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+class ModelBundle:
+    """A saved model bundle. Only the manifest is read when the bundle is opened,
+    each component is loaded the first time it is used."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as manifest_file:
+            self.manifest = json.load(manifest_file)
+
+        if self.manifest.get("format") != BUNDLE_FORMAT:
+            raise ValueError(f"{path} is not a draft model bundle")
+        if self.manifest.get("version") != BUNDLE_VERSION:
+            raise ValueError(f"Unsupported bundle version {self.manifest.get('version')}, "
+                             f"expected {BUNDLE_VERSION}")
+        self._components = {}
+
+    def __repr__(self):
+        return f"ModelBundle({self.path!r}, loaded={sorted(self._components)})"
+
+    def _component_path(self, component):
+        return os.path.join(self.path, self.manifest["components"][component])
+
+    def _load(self, component, loader):
+        if component not in self._components:
+            self._components[component] = loader(self._component_path(component))
+        return self._components[component]
+
+    @property
+    def n_clusters(self):
+        return self.manifest["n_clusters"]
+
+    @property
+    def champion_table(self):
+        return self._load("champions", lambda path: draft_model.ChampionTable(
+            draft_model.load_champion_mapping(path)))
+
+    @property
+    def clusters(self):
+        def load_clusters(path):
+            with np.load(path, allow_pickle=False) as arrays:
+                return draft_model.DraftClusters(arrays["means"], arrays["stds"], arrays["centroids"])
+        return self._load("clusters", load_clusters)
+
+    @property
+    def lane_models(self):
+        def load_lane_models(path):
+            lane_models = {}
+            for key, predictor in load_predictors(path).items():
+                name, lane = key.split("/")
+                lane_models.setdefault(name, {})[lane] = predictor
+            return lane_models
+        return self._load("lane_models", load_lane_models)
+
+    @property
+    def win_models(self):
+        return self._load("win_models", load_predictors)
+
+    def scorer(self):
+        """A DraftScorer over every component of the bundle"""
+        return DraftScorer(self.champion_table, self.lane_models, self.clusters, self.win_models)
+
+def load_bundle(path):
+    return ModelBundle(path)
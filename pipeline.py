@@ -0,0 +1,97 @@
+import numpy as np
+from sklearn.model_selection import train_test_split as tts
+
+import draft_model
+import final_model
+import player_model
+import util
+from draft_scorer import DraftScorer
+
+def run_pipeline(match_data, champion_mapping=None, n_clusters=7, n_jobs=1, sparse=False,
+                 clusters=None):
+    """Run the steps of draft_analysis.ipynb on the match data.
+
+    Returns the merged frame with win probabilities and draft_diff, and a
+    DraftScorer holding every fitted model. With n_jobs other than 1 the six
+    lane models are fitted on a process pool. With sparse the post draft model
+    is fitted on a sparse design, which is what makes n_clusters above 10 usable.
+    Given fitted DraftClusters, e.g. from select_draft_clusters, drafts are
+    assigned to their centroids instead of fitting KMeans."""
+
+    if champion_mapping is None:
+        champion_mapping = draft_model.load_champion_mapping()
+    champion_table = draft_model.ChampionTable(champion_mapping)
+
+    player_model.calculate_positional_differences(match_data)
+    if n_jobs != 1:
+        lane_models = player_model.fit_player_models(match_data, n_jobs=n_jobs)
+    else:
+        lane_models = {}
+        for name, use_draft_info in [("draft_agnostic", False), ("post_draft", True)]:
+            _, lane_models[name] = player_model.fit_player_model(
+                match_data, use_draft_info=use_draft_info, return_models=True)
+
+    match_drafts = draft_model.reduce_team_drafts(match_data, champion_table)
+    match_drafts, clusters = draft_model.cluster_drafts(
+        match_drafts, n_clusters=n_clusters, return_model=True, clusters=clusters)
+
+    full_data, list_of_comp_diffs = util.merge_team_and_draft(match_data, match_drafts,
+                                                              clusters.n_clusters)
+
+    train, test = tts(full_data, test_size=0.3, random_state=0)
+    win_models = {
+        "draft_agnostic": final_model.train_draft_agnostic_model(train),
+        "post_draft": final_model.train_post_draft_model(train, list_of_comp_diffs, full_data,
+                                                         sparse=sparse),
+    }
+    for name, model in win_models.items():
+        final_model.predict_with_model(full_data, model, name)
+
+    # How much did a team improve their win probability through draft
+    full_data["draft_diff"] = full_data["post_draft_win_prob"] - full_data["draft_agnostic_win_prob"]
+
+    scorer = DraftScorer(champion_table, lane_models, clusters, win_models)
+    # Fill the draft cache with every lineup seen so far, in one pass
+    scorer.cache.lookup(draft_model.encode_team_drafts(match_data, champion_table))
+    return full_data, scorer
+
+def post_draft_brier(match_data, match_drafts, clusters, sparse=True):
+    """Brier score on the test split of a post draft model fitted with the given
+    draft clusters. match_data needs the post_draft_*_lead_prob columns"""
+
+    match_drafts = draft_model.cluster_drafts(match_drafts.copy(), clusters=clusters)
+    full_data, list_of_comp_diffs = util.merge_team_and_draft(match_data, match_drafts,
+                                                              clusters.n_clusters)
+    train, test = tts(full_data, test_size=0.3, random_state=0)
+    model = final_model.train_post_draft_model(train, list_of_comp_diffs, full_data, sparse=sparse)
+    final_model.predict_with_model(full_data, model, "post_draft")
+    test = full_data.loc[test.index]
+    return np.mean((test["post_draft_win_prob"] - test["result"]) ** 2)
+
+def select_draft_clusters(match_data, cluster_counts=range(4, 13), seeds=(0, 1, 2),
+                          champion_mapping=None, n_jobs=None, sparse=True):
+    """Sweep the draft clustering over cluster_counts x seeds and pick a model.
+
+    KMeans runs on a process pool over features zscored once, see
+    draft_model.sweep_draft_clusters. Every candidate is then scored by the
+    Brier score of the post draft model fitted on it. Returns the sweep, one row
+    per (n_clusters, seed) with inertia, silhouette and post_draft_brier, and the
+    DraftClusters with the lowest Brier score, to pass to run_pipeline."""
+
+    if champion_mapping is None:
+        champion_mapping = draft_model.load_champion_mapping()
+    # The sweep only changes the clustering, the lane models are fitted once
+    if not all(f"{player_model.model_name(use_draft)}_{lane}_lead_prob" in match_data
+               for use_draft in [False, True] for lane in player_model.LANE_POSITIONS):
+        player_model.calculate_positional_differences(match_data)
+        for use_draft_info in [False, True]:
+            player_model.fit_player_model(match_data, use_draft_info=use_draft_info)
+
+    match_drafts = draft_model.reduce_team_drafts(match_data, draft_model.ChampionTable(champion_mapping))
+    sweep, candidates = draft_model.sweep_draft_clusters(match_drafts, cluster_counts, seeds, n_jobs)
+    sweep["post_draft_brier"] = [
+        post_draft_brier(match_data, match_drafts, candidates[(n_clusters, seed)], sparse)
+        for n_clusters, seed in zip(sweep["n_clusters"], sweep["seed"])]
+
+    best = sweep.loc[sweep["post_draft_brier"].idxmin()]
+    return sweep, candidates[(best["n_clusters"], best["seed"])]
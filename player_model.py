@@ -1,6 +1,13 @@
-import statsmodels.formula.api as smf
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
 from sklearn.model_selection import train_test_split as tts
 
+import instrument
+import shared_pool
+from design import (DesignMatrixBuilder, DesignResults, LinearPredictor, align_params,
+                    factor_columns, squared_terms)
+
 
 def calculate_diffs(match_data, pos, column):
     """ Regression works on the difference of a player to the opponent"""
@@ -8,6 +15,7 @@ def calculate_diffs(match_data, pos, column):
                                                 match_data[f"opp_{pos}{column}"]
     return match_data
 
+@instrument.stage
 def calculate_positional_differences(match_data):
     """Calculate the differences in the game for each role, at different stages of
     the game. """
@@ -20,44 +28,119 @@ def calculate_positional_differences(match_data):
             match_data = calculate_diffs(match_data, pos, col)
 
 
-def fit_win_lane_model(match_data, lane, pos_list, use_draft):
-    """Fits a lane win model given the lanes to interact with. If draft information is
-    used, interactions with champion early/mid/late are included"""
+def lane_design_columns(lane, pos_list, use_draft):
+    """The design matrix columns of a lane model, in the order the logit formula
+    `lead ~ dif + ... + col_diff + ... + i:j + ...` would produce them"""
 
-    logit_formula = f"{lane}_lead_at_15 ~ "
     cols = ['early_game', "mid_game", "late_game"]
+    columns = ["Intercept"]
     pos_col_list = []
     for pos in pos_list:
-        logit_formula += f" + {pos}_dif"
-    
+        columns.append(f"{pos}_dif")
+
         if use_draft:
             for col in cols:
-                logit_formula += f" + {pos}_{col}_diff"
+                columns.append(f"{pos}_{col}_diff")
                 pos_col_list.append(f"{pos}_{col}_diff")
 
-    if use_draft:
-        # Positional interactions
-        for i in pos_col_list:
-            for j in pos_col_list:
-                if i != j:
-                    logit_formula += f" + {i}:{j}"
+    # Positional interactions, i:j and j:i are the same column
+    return columns + squared_terms(pos_col_list)[len(pos_col_list):]
+
+def lane_data_columns(lane, pos_list, use_draft):
+    """The match data columns a lane model is fitted on"""
+    return [f"{lane}_lead_at_15"] + factor_columns(lane_design_columns(lane, pos_list, use_draft))
+
+def fit_lane_design(design, lead, names, train_rows, start_params=None):
+    """Fit a lane logit on precompiled design matrix columns, optionally starting
+    from the params of a previous fit. The results predict from match data like
+    a formula fit's"""
+    return DesignResults(sm.Logit(lead[train_rows], design.frame(names, train_rows),
+                                  missing="drop").fit_regularized(
+        start_params=align_params(start_params, names), alpha=3, disp=0))
+
+@instrument.stage
+def fit_win_lane_model(match_data, lane, pos_list, use_draft, design=None):
+    """Fits a lane win model given the lanes to interact with. If draft information is
+    used, interactions with champion early/mid/late are included"""
 
-    train, test = tts(match_data, test_size=0.3, random_state=0)
+    if design is None:
+        design = DesignMatrixBuilder(match_data)
+    names = lane_design_columns(lane, pos_list, use_draft)
+    train_rows, _ = tts(np.arange(len(match_data)), test_size=0.3, random_state=0)
 
-    lane_lead_prob_model = smf.logit(
-        formula=logit_formula, data=train
-    ).fit_regularized(alpha=3, disp=0)
+    lane_lead_prob_model = fit_lane_design(
+        design, match_data[f"{lane}_lead_at_15"].to_numpy(dtype=float), names, train_rows)
 
     name = "post_draft" if use_draft else "draft_agnostic"
 
-    match_data[f'{name}_{lane}_lead_prob'] = lane_lead_prob_model.predict(
-        match_data)
+    match_data[f'{name}_{lane}_lead_prob'] = lane_lead_prob_model.predict(design)
+    return lane_lead_prob_model
 
 
-def fit_player_model(match_data, use_draft_info):
+LANE_POSITIONS = {
+    'top': ['top', 'jng'],
+    'mid': ['mid', 'jng'],
+    'bot': ['bot', 'jng', 'sup'],
+}
+
+@instrument.stage
+def fit_player_model(match_data, use_draft_info, return_models=False, n_jobs=1):
 
     """Fits the player model for all three lanes"""
-    fit_win_lane_model(match_data, 'top', ['top', "jng"], use_draft=use_draft_info)
-    fit_win_lane_model(match_data, 'mid', ['mid', 'jng'], use_draft=use_draft_info)
-    fit_win_lane_model(match_data, 'bot', ['bot', 'jng', 'sup'], use_draft=use_draft_info)
-    return match_data
\ No newline at end of file
+    if n_jobs != 1:
+        models = fit_player_models(match_data, [use_draft_info], n_jobs)[model_name(use_draft_info)]
+    else:
+        models = {}
+        design = DesignMatrixBuilder(match_data)
+        for lane, pos_list in LANE_POSITIONS.items():
+            models[lane] = fit_win_lane_model(match_data, lane, pos_list, use_draft=use_draft_info,
+                                              design=design)
+    if return_models:
+        return match_data, models
+    return match_data
+
+def model_name(use_draft):
+    return "post_draft" if use_draft else "draft_agnostic"
+
+def _shared_match_data(values, columns):
+    # Design matrices built by one task are reused by the next task the worker runs
+    match_data = pd.DataFrame(values, columns=columns, copy=False)
+    return match_data, DesignMatrixBuilder(match_data)
+
+def _fit_shared_lane_model(lane, use_draft, train_rows):
+    """Fit one lane model in a worker, on a view of the shared match data"""
+    match_data, design = shared_pool.worker_state()
+    names = lane_design_columns(lane, LANE_POSITIONS[lane], use_draft)
+    lane_lead_prob_model = fit_lane_design(
+        design, match_data[f"{lane}_lead_at_15"].to_numpy(), names, train_rows)
+    return (lane_lead_prob_model.params,
+            lane_lead_prob_model.predict(design))
+
+@instrument.stage
+def fit_player_models(match_data, draft_modes=(False, True), n_jobs=None):
+    """Fit the lane models of every draft mode on a pool of n_jobs processes
+    (default: one per core), filling in the same *_lead_prob columns as
+    fit_player_model. The model columns are copied once into shared memory that
+    every worker maps, rather than being pickled to each task.
+
+    Returns {model name: {lane: LinearPredictor}}"""
+
+    columns = sorted({column for use_draft in draft_modes for lane, pos_list in LANE_POSITIONS.items()
+                      for column in lane_data_columns(lane, pos_list, use_draft)})
+    shape = (len(match_data), len(columns))
+    train_rows, _ = tts(np.arange(len(match_data)), test_size=0.3, random_state=0)
+
+    with shared_pool.SharedArray(shape, order="F") as shared:
+        shared.values[:] = match_data[columns].to_numpy(dtype=np.float64)
+        tasks = [(lane, use_draft) for use_draft in draft_modes for lane in LANE_POSITIONS]
+        with shared.pool(n_jobs, _shared_match_data, columns) as pool:
+            futures = [pool.submit(_fit_shared_lane_model, lane, use_draft, train_rows)
+                       for lane, use_draft in tasks]
+            results = [future.result() for future in futures]
+
+    models = {}
+    for (lane, use_draft), (params, predictions) in zip(tasks, results):
+        name = model_name(use_draft)
+        match_data[f'{name}_{lane}_lead_prob'] = predictions
+        models.setdefault(name, {})[lane] = LinearPredictor(params.index, params.to_numpy())
+    return models
@@ -0,0 +1,227 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from design import matchup_column_names
+
+KEY_COLUMNS = ["league", "teamname", "split"]
+LANES = ["top", "mid", "bot"]
+LOG_COLUMNS = ["key", "date", "draft_diff"] + [f"{lane}_lead_above_expected" for lane in LANES] + \
+              ["team_comp", "row_hash"]
+
+def season_split(dates):
+    """Split of each date, e.g. "2022 Spring" up to May and "2022 Summer" after"""
+    dates = pd.to_datetime(pd.Series(dates))
+    return (dates.dt.year.astype(str) + np.where(dates.dt.month <= 5, " Spring", " Summer")).to_numpy()
+
+def team_comps_from_matchups(match_data, n_clusters):
+    """team_comp of each row of merged match data, read off its signed
+    team_comp{i}_v_opp_comp{j} columns: the row's own comp i is the one scoring +1"""
+    matchups = match_data[matchup_column_names(n_clusters)].to_numpy()
+    return matchups.reshape(len(match_data), n_clusters, n_clusters).max(axis=2).argmax(axis=1)
+
+class DraftRollups:
+    """Materialised per (league, team, split) rollups of scored match rows.
+
+    For each key it holds the games played, the cumulative draft_diff, the lane
+    leads above expected (lead_at_15 - post_draft lead prob) and a histogram of
+    the team_comp clusters played. Behind them is a small per-team game log,
+    sorted by key and date, with only those values, so cumulative series for a
+    team come from a slice of its own games instead of a scan of the match history.
+
+    update() folds new scored rows in: the key totals grow by the sums of the new
+    rows only, rows already seen are skipped. The rollups are written to path
+    after each update and loaded from it when it exists. n_clusters defaults to
+    that of the loaded rollups, or 7, and must match the loaded rollups if given.
+    """
+    def __init__(self, path="data/draft-rollups", n_clusters=None):
+        self.path = path
+        self._clear(n_clusters or 7)
+        if path is not None and os.path.exists(os.path.join(path, "manifest.json")):
+            self._load()
+            if n_clusters is not None and n_clusters != self.n_clusters:
+                raise ValueError(f"The rollups at {path} have {self.n_clusters} clusters, "
+                                 f"not {n_clusters}, rebuild them with replace()")
+
+    def _clear(self, n_clusters):
+        self.n_clusters = n_clusters
+        self.keys = pd.DataFrame({column: pd.Series(dtype=object) for column in KEY_COLUMNS})
+        self.totals_columns = ["games", "draft_diff"] + \
+            [f"{lane}_lead_above_expected" for lane in LANES] + \
+            [f"cluster_{i}" for i in range(n_clusters)]
+        self.totals_values = np.zeros((0, len(self.totals_columns)))
+        self.log = {column: np.array([], dtype=dtype) for column, dtype in zip(
+            LOG_COLUMNS, [np.int64, "datetime64[ns]", float, float, float, float, np.int64, np.uint64])}
+        self._index()
+
+    def __len__(self):
+        return len(self.log["key"])
+
+    def __repr__(self):
+        return f"DraftRollups({self.path!r}, {len(self.keys)} keys, {len(self)} team games)"
+
+    def _index(self):
+        """Key codes by (league, team, split) and the start of each key's games in the log"""
+        self.codes = {key: code for code, key in enumerate(self.keys.itertuples(index=False, name=None))}
+        self.offsets = np.searchsorted(self.log["key"], np.arange(len(self.keys) + 1))
+
+    def _load(self):
+        with open(os.path.join(self.path, "manifest.json")) as manifest_file:
+            manifest = json.load(manifest_file)
+        self.n_clusters = manifest["n_clusters"]
+        self.keys = pd.DataFrame(manifest["keys"], columns=KEY_COLUMNS)
+        self.totals_columns = manifest["totals_columns"]
+        self.totals_values = np.load(os.path.join(self.path, "totals.npy"), allow_pickle=False)
+        self.log = {column: np.load(os.path.join(self.path, f"{column}.npy"), allow_pickle=False)
+                    for column in LOG_COLUMNS}
+        self._index()
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        np.save(os.path.join(self.path, "totals.npy"), self.totals_values, allow_pickle=False)
+        for column in LOG_COLUMNS:
+            np.save(os.path.join(self.path, f"{column}.npy"), self.log[column], allow_pickle=False)
+        # Written after the arrays, so a failed save leaves the previous manifest
+        manifest_path = os.path.join(self.path, "manifest.json")
+        with open(manifest_path + ".tmp", "w") as manifest_file:
+            json.dump({"n_clusters": self.n_clusters, "totals_columns": self.totals_columns,
+                       "keys": self.keys.to_numpy().tolist()}, manifest_file)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def rows_of(self, match_data):
+        """The log columns of scored match rows. Needs league, teamname, date,
+        gameid, draft_diff, the lane leads and post_draft lead probs, and team_comp
+        or the matchup columns; split is derived from date when missing"""
+        split = match_data["split"].to_numpy() if "split" in match_data else \
+            season_split(match_data["date"])
+        team_comp = match_data["team_comp"].to_numpy() if "team_comp" in match_data else \
+            team_comps_from_matchups(match_data, self.n_clusters)
+        rows = {
+            "league": match_data["league"].astype(str).to_numpy(),
+            "teamname": match_data["teamname"].astype(str).to_numpy(),
+            "split": split.astype(str),
+            "date": pd.to_datetime(match_data["date"]).to_numpy(dtype="datetime64[ns]"),
+            "draft_diff": match_data["draft_diff"].to_numpy(dtype=float),
+            "team_comp": np.asarray(team_comp, dtype=np.int64),
+            "row_hash": pd.util.hash_pandas_object(
+                match_data[["gameid", "teamname"]].astype(str), index=False).to_numpy(),
+        }
+        for lane in LANES:
+            rows[f"{lane}_lead_above_expected"] = (
+                match_data[f"{lane}_lead_at_15"].to_numpy(dtype=float)
+                - match_data[f"post_draft_{lane}_lead_prob"].to_numpy(dtype=float))
+        return rows
+
+    def update(self, match_data):
+        """Fold scored match rows into the rollups, skipping (gameid, teamname)
+        rows already in them, and save. Returns the number of rows added"""
+        rows = self.rows_of(match_data)
+        if (rows["team_comp"] >= self.n_clusters).any():
+            raise ValueError(f"team_comp {rows['team_comp'].max()} is outside the "
+                             f"{self.n_clusters} clusters of the rollups")
+        new = ~np.isin(rows["row_hash"], self.log["row_hash"])
+        new &= ~pd.Index(rows["row_hash"]).duplicated()
+        rows = {column: values[new] for column, values in rows.items()}
+        if not new.any():
+            return 0
+
+        # Codes for the keys seen for the first time
+        keys = list(zip(rows["league"], rows["teamname"], rows["split"]))
+        unseen = list(dict.fromkeys(key for key in keys if key not in self.codes))
+        if unseen:
+            self.keys = pd.concat([self.keys, pd.DataFrame(unseen, columns=KEY_COLUMNS)],
+                                  ignore_index=True)
+            self.totals_values = np.vstack([self.totals_values,
+                                            np.zeros((len(unseen), len(self.totals_columns)))])
+            self.codes.update({key: len(self.codes) + k for k, key in enumerate(unseen)})
+        rows["key"] = np.array([self.codes[key] for key in keys], dtype=np.int64)
+
+        # Only the new rows are summed into the totals
+        values = np.column_stack([np.ones(len(rows["key"])), np.nan_to_num(rows["draft_diff"])]
+                                 + [np.nan_to_num(rows[f"{lane}_lead_above_expected"]) for lane in LANES]
+                                 + [rows["team_comp"] == i for i in range(self.n_clusters)])
+        np.add.at(self.totals_values, rows["key"], values)
+
+        # Merge into the log, sorted by key then date. lexsort is stable, so games
+        # on the same date keep the order they were added in
+        log = {column: np.concatenate([self.log[column], rows[column]]) for column in LOG_COLUMNS}
+        order = np.lexsort((log["date"], log["key"]))
+        self.log = {column: values[order] for column, values in log.items()}
+        self._index()
+        if self.path is not None:
+            self.save()
+        return len(rows["key"])
+
+    def replace(self, match_data, n_clusters=None):
+        """Rebuild the rollups from scratch from match_data, e.g. after every game
+        was rescored by a refit, optionally with a new number of clusters"""
+        self._clear(n_clusters or self.n_clusters)
+        # update() saves when it adds rows, an empty rebuild still clears the files
+        if not self.update(match_data) and self.path is not None:
+            self.save()
+
+    def _codes(self, league=None, teams=None, split=None):
+        """Key codes matching the filters, each a value, list of values or None"""
+        mask = np.ones(len(self.keys), dtype=bool)
+        for column, values in zip(KEY_COLUMNS, [league, teams, split]):
+            if values is not None:
+                mask &= self.keys[column].isin(np.atleast_1d(values)).to_numpy()
+        return np.flatnonzero(mask)
+
+    def totals(self, league=None, teams=None, split=None):
+        """One row per (league, team, split) with the games, cumulative draft_diff,
+        lane leads above expected and cluster counts"""
+        codes = self._codes(league, teams, split)
+        return pd.concat([self.keys.iloc[codes].reset_index(drop=True),
+                          pd.DataFrame(self.totals_values[codes], columns=self.totals_columns)],
+                         axis=1)
+
+    def cluster_histogram(self, league=None, teams=None, split=None):
+        """Games played with each team_comp cluster, one row per team over the
+        selected splits, like model_analysis.get_teamcomps_for_lcs"""
+        totals = self.totals(league, teams, split)
+        return totals.groupby("teamname")[[f"cluster_{i}" for i in range(self.n_clusters)]].sum()
+
+    def team_games(self, column, league=None, teams=None, split=None, start_date=None, end_date=None):
+        """Date ordered games of each selected team with column and its cumulative
+        sum, e.g. draft_diff or mid_lead_above_expected. Reads only the selected
+        keys' slices of the log"""
+        positions, codes = [], []
+        for code in self._codes(league, teams, split):
+            low, high = self.offsets[code], self.offsets[code + 1]
+            # Each key's games are sorted by date, so the date range is a sub slice
+            dates = self.log["date"][low:high]
+            if start_date is not None:
+                low += np.searchsorted(dates, np.datetime64(start_date))
+            if end_date is not None:
+                high = self.offsets[code] + np.searchsorted(dates, np.datetime64(end_date))
+            positions.append(np.arange(low, high))
+            codes.append(np.full(max(high - low, 0), code))
+        positions = np.concatenate(positions) if positions else np.array([], dtype=np.int64)
+        teamnames = self.keys["teamname"].to_numpy()[np.concatenate(codes).astype(np.int64)] \
+            if codes else np.array([], dtype=object)
+
+        # A team's games across several splits, in date order
+        order = np.lexsort((self.log["date"][positions], teamnames))
+        positions, teamnames = positions[order], teamnames[order]
+        values = self.log[column][positions]
+        starts = np.flatnonzero(np.r_[True, teamnames[1:] != teamnames[:-1]]) if len(order) else \
+            np.array([], dtype=np.int64)
+        group_start = np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        # Cumulative sums within each team, skipping missing values like groupby cumsum
+        filled = np.nan_to_num(values)
+        cumulative = np.cumsum(filled)
+        cumulative -= np.r_[0.0, cumulative][group_start]
+        cumulative[np.isnan(values)] = np.nan
+        return pd.DataFrame({"teamname": teamnames, "date": self.log["date"][positions],
+                             column: values, "gamecount": np.arange(len(order)) - group_start,
+                             "cumulative": cumulative})
+
+    def cumulative_draft_diff(self, league=None, teams=None, split=None, start_date=None,
+                              end_date=None):
+        """Expected wins added by draft, game by game, as in
+        model_analysis.plot_cumulative_expected_wins_added_by_draft"""
+        games = self.team_games("draft_diff", league, teams, split, start_date, end_date)
+        return games.rename(columns={"cumulative": "wpa"})
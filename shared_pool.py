@@ -0,0 +1,60 @@
+"""Process pools whose workers map one float64 array in shared memory instead of
+receiving a pickled copy with every task.
+
+Only NumPy and the standard library are imported here. threadpoolctl is imported
+in the workers, so modules on the NumPy only scoring path can use the pool.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+class SharedArray:
+    """A float64 array of the given shape in a new shared memory block. Used as a
+    context manager, the block is unlinked on exit. Fill values, then start a
+    pool of workers over it with pool()"""
+
+    def __init__(self, shape, order="C"):
+        self.shape, self.order = tuple(shape), order
+        self.memory = shared_memory.SharedMemory(create=True,
+                                                 size=max(1, 8 * int(np.prod(self.shape))))
+        self.values = np.ndarray(self.shape, dtype=np.float64, buffer=self.memory.buf, order=order)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.values = None
+        try:
+            self.memory.close()
+        except BufferError:
+            # A caller still holds a view, the mapping goes with the last of them
+            pass
+        self.memory.unlink()
+
+    def pool(self, n_jobs=None, setup=None, *setup_args):
+        """A ProcessPoolExecutor of n_jobs workers (default: one per core), each
+        mapping the array once. setup(values, *setup_args), a module level
+        function, runs once in each worker, and worker_state() returns what it
+        built, or the array itself without setup"""
+        return ProcessPoolExecutor(max_workers=n_jobs, initializer=_attach,
+                                   initargs=(self.memory.name, self.shape, self.order,
+                                             setup, setup_args))
+
+# The shared block and what setup built on it, attached once per worker
+_worker_state = None
+
+def _attach(name, shape, order, setup, setup_args):
+    global _worker_state
+    from threadpoolctl import threadpool_limits
+
+    # One BLAS thread per worker, the pool already uses every core
+    threadpool_limits(1)
+    memory = shared_memory.SharedMemory(name=name)
+    values = np.ndarray(shape, dtype=np.float64, buffer=memory.buf, order=order)
+    # The block stays mapped for as long as the worker lives
+    _worker_state = memory, values if setup is None else setup(values, *setup_args)
+
+def worker_state():
+    """In a pool worker, what setup built on the shared array"""
+    return _worker_state[1]
@@ -0,0 +1,124 @@
+"""Synthetic Oracle's Elixir style match data.
+
+The real data/oracles-data.csv and data/player-diffs.csv are not shipped with
+the repo. This writes files with the same columns, built from the champions in
+data/champion_roles.csv, with both sides of every game on adjacent rows sharing
+a gameid. `python synthetic_data.py 100000 data` writes 100k games to data/.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import draft_model
+
+# Dates are spread over this many days from 2020-01-01
+N_DAYS = 1000
+SIZES = {"10k": 10_000, "100k": 100_000, "1M": 1_000_000}
+
+
+def random_match_data(n_rows, champ_map, seed=0):
+    """Random team rows with an id and a champion for each role"""
+    rng = np.random.default_rng(seed)
+    names = np.array(list(champ_map), dtype=object)
+    match_data = pd.DataFrame({"id": np.arange(n_rows)})
+    for role in draft_model.ROLES:
+        match_data[f"{role}_champion"] = names[rng.integers(len(names), size=n_rows)]
+    return match_data
+
+
+def random_games(n_games, champ_map, seed=0, first_game=0, total_games=None):
+    """Random games in the layout returned by util.load_match_data: one row per
+    team, the two sides of each game adjacent, with player and champion diffs.
+
+    first_game and total_games place the games in a larger set generated in
+    chunks: ids and gameids continue from first_game, and dates keep increasing
+    across the chunks"""
+    rng = np.random.default_rng(seed)
+    n_rows = 2 * n_games
+    total_games = total_games or first_game + n_games
+    names = np.array(list(champ_map), dtype=object)
+    teams = np.array([f"Team {i}" for i in range(40)], dtype=object)
+    leagues = np.array(["LCS", "LEC", "LCK", "LPL"], dtype=object)
+
+    def mirrored(values):
+        """Per-game values for the first side and their negation for the second"""
+        return np.column_stack([values, -values]).ravel()
+
+    team = rng.integers(len(teams), size=n_games)
+    opponent = (team + rng.integers(1, len(teams), size=n_games)) % len(teams)
+    first_day = N_DAYS * first_game // total_games
+    last_day = max(first_day + 1, N_DAYS * (first_game + n_games) // total_games)
+    days = np.sort(rng.integers(first_day, last_day, size=n_games))
+    match_data = pd.DataFrame({
+        "id": 2 * first_game + np.arange(n_rows),
+        "gameid": np.repeat(first_game + np.arange(n_games), 2).astype(str),
+        "date": np.repeat((np.datetime64("2020-01-01") + days).astype(str), 2),
+        "league": np.repeat(leagues[rng.integers(len(leagues), size=n_games)], 2),
+        "side": np.tile(np.array(["Blue", "Red"], dtype=object), n_games),
+        "teamname": teams[np.column_stack([team, opponent]).ravel()],
+        "opponent": teams[np.column_stack([opponent, team]).ravel()],
+        "elo_diff": mirrored(rng.normal(size=n_games)),
+    })
+    for role in draft_model.ROLES:
+        match_data[f"{role}_dif"] = mirrored(rng.normal(size=n_games))
+
+    win_logit = 0.5 * match_data["elo_diff"] + 0.3 * match_data["mid_dif"]
+    first_wins = (rng.random(n_games) < 1 / (1 + np.exp(-win_logit[::2].to_numpy()))).astype(int)
+    match_data["result"] = np.column_stack([first_wins, 1 - first_wins]).ravel()
+    for lane in ["top", "mid", "bot"]:
+        first_leads = (rng.random(n_games) < 1 / (1 + np.exp(
+            -match_data[f"{lane}_dif"][::2].to_numpy()))).astype(int)
+        match_data[f"{lane}_lead_at_15"] = np.column_stack([first_leads, 1 - first_leads]).ravel()
+
+    champion_table = draft_model.ChampionTable(champ_map)
+    for role in draft_model.ROLES:
+        codes = rng.integers(len(names), size=n_rows)
+        opp_codes = codes.reshape(-1, 2)[:, ::-1].ravel()
+        match_data[f"{role}_champion"] = names[codes]
+        for col in ["early_game", "mid_game", "late_game", "ap", "ad"]:
+            c = draft_model.DRAFT_COLUMNS.index(col)
+            match_data[f"{role}_{col}"] = champion_table.features[codes, c]
+            match_data[f"opp_{role}_{col}"] = champion_table.features[opp_codes, c]
+    return match_data
+
+
+def write_match_csvs(match_data, directory, append=False):
+    """Split random games into the oracles-data.csv and player-diffs.csv layout,
+    or with append add them to the end of existing files"""
+    player_columns = ["id"] + [column for column in match_data.columns
+                               if column.endswith("_dif") or column.startswith("opp_") or
+                               column.rsplit("_", 1)[-1] in ("game", "ap", "ad")]
+    oracles_columns = [column for column in match_data.columns
+                       if column == "id" or column not in player_columns]
+    paths = os.path.join(directory, "oracles-data.csv"), os.path.join(directory, "player-diffs.csv")
+    mode = "a" if append else "w"
+    match_data[oracles_columns].to_csv(paths[0], index=False, mode=mode, header=not append)
+    match_data[player_columns].to_csv(paths[1], index=False, mode=mode, header=not append)
+    return paths
+
+
+def write_synthetic_data(directory, n_games, champ_map=None, seed=0, chunk_games=100_000):
+    """Write n_games random games as oracles-data.csv and player-diffs.csv in
+    directory, generated chunk_games at a time so memory stays flat whatever the
+    size. Returns the two paths"""
+    if champ_map is None:
+        champ_map = draft_model.load_champion_mapping()
+    os.makedirs(directory, exist_ok=True)
+    for first_game in range(0, n_games, chunk_games):
+        chunk = random_games(min(chunk_games, n_games - first_game), champ_map,
+                             seed=seed + first_game, first_game=first_game, total_games=n_games)
+        paths = write_match_csvs(chunk, directory, append=first_game > 0)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("games", help=f"number of games, or one of {', '.join(SIZES)}")
+    parser.add_argument("directory", nargs="?", default="data")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    n_games = SIZES.get(args.games) or int(args.games)
+    for path in write_synthetic_data(args.directory, n_games, seed=args.seed):
+        print(path)
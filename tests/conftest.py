@@ -0,0 +1,40 @@
+import contextlib
+import io
+import os
+import sys
+import warnings
+
+import pytest
+
+# The modules live at the top of the repo and read data/ relative to it
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import draft_model
+import pipeline
+from synthetic_data import random_games
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    monkeypatch.chdir(ROOT)
+
+@pytest.fixture(scope="session")
+def champion_mapping():
+    return draft_model.load_champion_mapping(os.path.join(ROOT, "data", "champion_roles.csv"))
+
+@pytest.fixture
+def match_data(champion_mapping):
+    """Synthetic match rows, both sides of every game"""
+    return random_games(1_500, champion_mapping, seed=1)
+
+@pytest.fixture(scope="session")
+def fitted_pipeline(champion_mapping):
+    """run_pipeline on synthetic games: the scored frame, the DraftScorer and the
+    match rows it was given. The post draft model is fitted sparse, the dense GLM
+    diverges on the collinear matchup columns of random games"""
+    match_data = random_games(1_500, champion_mapping, seed=2)
+    with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+        warnings.simplefilter("ignore")
+        full_data, scorer = pipeline.run_pipeline(match_data.copy(), champion_mapping,
+                                                  n_clusters=4, sparse=True)
+    return full_data, scorer, match_data
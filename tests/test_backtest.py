@@ -0,0 +1,61 @@
+import contextlib
+import io
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest
+from synthetic_data import random_games
+
+# Two games a day, from a Wednesday
+DATES = pd.Series(np.repeat(pd.date_range("2022-01-05 12:00", periods=100, freq="D"), 2))
+
+@pytest.mark.parametrize("freq", ["7D", "W", "MS", "QS"])
+def test_windows_cover_every_game_after_the_first_once(freq):
+    windows = backtest.game_windows(DATES, freq, min_train_games=0)
+    offset = pd.tseries.frequencies.to_offset(freq)
+    tested = np.concatenate([test for _, _, test in windows])
+    assert sorted(tested) == list(range(len(DATES)))
+    for start, train, test in windows:
+        assert offset.is_on_offset(start)
+        assert (DATES[test] >= start).all() and (DATES[test] < start + offset).all()
+        assert sorted(train) == list(np.flatnonzero(DATES < start))
+
+def test_calendar_windows_start_on_their_period():
+    starts = [start for start, _, _ in backtest.game_windows(DATES, "MS", min_train_games=0)]
+    assert starts == list(pd.to_datetime(["2022-01-01", "2022-02-01", "2022-03-01", "2022-04-01"]))
+    starts = [start for start, _, _ in backtest.game_windows(DATES, "W", min_train_games=0)]
+    # Weeks end on Sunday, the first one holds the first game
+    assert starts[0] == pd.Timestamp("2022-01-02") and len(starts) == 15
+
+def test_windows_without_enough_training_games_are_skipped():
+    windows = backtest.game_windows(DATES, "7D", min_train_games=50)
+    # 14 games a week, so the first window with 50 earlier games is the fifth
+    assert windows[0][0] == pd.Timestamp("2022-02-02")
+    assert all(len(train) >= 50 for _, train, _ in windows)
+    assert len(backtest.game_windows(DATES, "7D", min_train_games=len(DATES))) == 0
+
+def test_train_days_keep_a_rolling_train_window():
+    windows = backtest.game_windows(DATES, "7D", train_days=14, min_train_games=1)
+    for start, train, _ in windows:
+        assert (DATES[train] >= start - pd.Timedelta(days=14)).all()
+        assert (DATES[train] < start).all()
+        assert len(train) == min(28, (DATES < start).sum())
+
+def test_walk_forward_scores_every_window(champion_mapping):
+    match_data = random_games(600, champion_mapping, seed=5)
+    with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+        warnings.simplefilter("ignore")
+        scores = backtest.walk_forward(match_data, freq="QS", min_train_games=300, n_clusters=3,
+                                       champion_mapping=champion_mapping)
+    windows = scores.drop_duplicates("window")
+    assert windows["train_games"].is_monotonic_increasing and windows["train_games"].min() >= 300
+    assert windows["train_games"].iloc[-1] + windows["test_games"].iloc[-1] == 600
+    assert (windows["train_games"].iloc[1:].to_numpy()
+            == (windows["train_games"] + windows["test_games"]).iloc[:-1].to_numpy()).all()
+    models = set(scores["model"])
+    assert {"post_draft_win", "draft_agnostic_win", "post_draft_mid_lead"} <= models
+    brier = scores[(scores["model"] == "draft_agnostic_win") & (scores["metric"] == "brier")]
+    assert len(brier) == len(windows) and brier["value"].between(0, 1).all()
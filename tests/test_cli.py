@@ -0,0 +1,10 @@
+import pytest
+
+import cli
+
+def test_league_needs_a_value():
+    with pytest.raises(SystemExit):
+        cli.build_parser().parse_args(["fit", "--league"])
+    args = cli.build_parser().parse_args(["fit", "--league", "LCS", "LEC"])
+    assert args.league == ["LCS", "LEC"]
+    assert cli.build_parser().parse_args(["fit"]).league is None
@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+import draft_model
+from draft_model import ChampionTable, DraftCache
+
+@pytest.fixture(scope="module")
+def champion_table(champion_mapping):
+    return ChampionTable(champion_mapping)
+
+@pytest.fixture(scope="module")
+def clusters(champion_table, champion_mapping):
+    from synthetic_data import random_games
+
+    drafts = draft_model.reduce_team_drafts(random_games(500, champion_mapping, seed=6),
+                                            champion_table)
+    return draft_model.fit_draft_clusters(drafts, n_clusters=5, random_state=0)
+
+def test_cache_matches_reducing_and_clustering(match_data, champion_table, clusters):
+    cache = DraftCache(champion_table, clusters)
+    codes = draft_model.encode_team_drafts(match_data, champion_table)
+    drafts = draft_model.reduce_team_drafts(match_data, champion_table)
+    assert np.array_equal(cache.team_comp(codes), clusters.predict(drafts))
+    assert np.array_equal(cache.reduce(codes), drafts[draft_model.DRAFT_COLUMNS].to_numpy())
+    # Answered from the cache the second time
+    assert np.array_equal(cache.team_comp(codes[::-1]), clusters.predict(drafts)[::-1])
+
+def test_pick_order_does_not_change_the_result(match_data, champion_table, clusters):
+    cache = DraftCache(champion_table, clusters)
+    codes = draft_model.encode_team_drafts(match_data, champion_table)
+    expected = cache.team_comp(codes)
+    permuted = np.random.default_rng(0).permuted(codes, axis=1)
+    assert np.array_equal(DraftCache(champion_table, clusters).team_comp(permuted), expected)
+    assert np.array_equal(cache.lineup_keys(permuted), cache.lineup_keys(codes))
+    misses = cache.stats()["lineup_misses"]
+    assert np.array_equal(cache.team_comp(permuted), expected)
+    assert cache.stats()["lineup_misses"] == misses
+
+def test_hit_and_miss_counts_add_up(match_data, champion_table, clusters):
+    cache = DraftCache(champion_table, clusters)
+    codes = draft_model.encode_team_drafts(match_data, champion_table)
+    cache.team_comp(codes)
+    cache.team_comp(codes[:100])
+    stats = cache.stats()
+    distinct = len(np.unique(cache.lineup_keys(codes)))
+    assert stats["lineup_misses"] == stats["lineups"] == distinct == len(cache)
+    assert stats["lineup_hits"] + stats["lineup_misses"] == len(codes) + 100
+    assert stats["composition_hits"] + stats["composition_misses"] == distinct
+    assert stats["composition_misses"] == stats["compositions"]
+    assert stats["compositions"] == len(np.unique(cache.reduce(codes), axis=0))
+    assert np.isclose(stats["hit_rate"], stats["lineup_hits"] / (len(codes) + 100))
+
+def reduced_chunks(match_data, champion_table, chunk_rows=333):
+    return list(draft_model.iter_reduced_drafts(
+        (match_data.iloc[start:start + chunk_rows] for start in range(0, len(match_data), chunk_rows)),
+        champion_table))
+
+def test_running_moments_match_the_full_batch(match_data, champion_table):
+    features = draft_model.reduce_team_drafts(match_data, champion_table)[
+        draft_model.CLUSTER_COLUMNS].to_numpy(dtype=float)
+    moments = draft_model.RunningMoments(features.shape[1])
+    for start in range(0, len(features), 701):
+        moments.update(features[start:start + 701])
+    moments.update(features[:0])
+    assert moments.count == len(features)
+    assert np.allclose(moments.mean, features.mean(axis=0), rtol=0, atol=1e-14)
+    assert np.allclose(moments.std, features.std(axis=0), rtol=0, atol=1e-14)
+
+def test_streaming_clusters_assign_chunks_like_the_whole_frame(match_data, champion_table):
+    import pandas as pd
+
+    chunks = reduced_chunks(match_data, champion_table)
+    clusters = draft_model.fit_streaming_draft_clusters(lambda: iter(chunks), n_clusters=4,
+                                                        random_state=0, batch_size=256)
+    drafts = pd.concat(chunks, ignore_index=True)
+    features = drafts[draft_model.CLUSTER_COLUMNS].to_numpy(dtype=float)
+    assert np.allclose(clusters.means, features.mean(axis=0), rtol=0, atol=1e-14)
+    assert clusters.centroids.shape == (4, len(draft_model.CLUSTER_COLUMNS))
+
+    assigned = draft_model.assign_draft_chunks(chunks, clusters)
+    assert np.array_equal(assigned["id"], drafts["id"])
+    assert np.array_equal(assigned["team_comp"], clusters.predict(drafts))
+    assert set(assigned["team_comp"]) == set(range(4))
+
+    with pytest.raises(ValueError):
+        draft_model.fit_streaming_draft_clusters(lambda: iter(chunks[:1]), n_clusters=1_000)
+
+def test_assigning_no_chunks_keeps_the_column_types(clusters):
+    assigned = draft_model.assign_draft_chunks([], clusters)
+    assert len(assigned) == 0
+    assert assigned["id"].dtype == np.int64 and assigned["team_comp"].dtype == int
+
+def reference_reduce(match_data, champ_map):
+    """Per row sum of the mapped champions, as the original iterrows loop built it"""
+    rows = []
+    for _, match in match_data.iterrows():
+        row = draft_model.get_blank_row()
+        for role in draft_model.ROLES:
+            draft_model.add_champ_to_blank_row(row, champ_map[match[f"{role}_champion"]])
+        row["no_damage_type"] = int(row["ap"] == 0 or row["ad"] == 0)
+        rows.append([row[column] for column in draft_model.DRAFT_COLUMNS] + [match["id"]])
+    return rows
+
+def test_reduce_team_drafts_matches_the_per_row_sum(match_data, champion_mapping):
+    sample = match_data.iloc[:300].copy()
+    # Single damage type drafts, which set no_damage_type
+    ap_only = [name for name, champion in champion_mapping.items() if not champion.ad][:5]
+    sample.loc[sample.index[0], [f"{role}_champion" for role in draft_model.ROLES]] = ap_only
+    drafts = draft_model.reduce_team_drafts(sample, champion_mapping)
+    assert list(drafts.columns) == draft_model.DRAFT_COLUMNS + ["id"]
+    assert drafts.to_numpy().tolist() == reference_reduce(sample, champion_mapping)
+    assert drafts["no_damage_type"].iloc[0] == 1
+
+@pytest.mark.parametrize("champion", ["Not A Champion", None, np.nan])
+def test_unknown_and_missing_champions_are_named(match_data, champion_mapping, champion):
+    sample = match_data.iloc[:4].copy()
+    sample["mid_champion"] = sample["mid_champion"].astype(object)
+    sample.loc[sample.index[2], "mid_champion"] = champion
+    with pytest.raises(KeyError):
+        reference_reduce(sample, champion_mapping)
+    with pytest.raises(KeyError, match=f"Champions not in mapping: \\['{champion}'\\]"):
+        draft_model.reduce_team_drafts(sample, champion_mapping)
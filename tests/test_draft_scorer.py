@@ -0,0 +1,35 @@
+import numpy as np
+
+from draft_model import ROLES
+
+def game_sides(match_data, gameids):
+    """The blue and red rows of each of the games, in the same game order"""
+    games = match_data[match_data["gameid"].isin(gameids)].sort_values(["gameid", "side"])
+    return games[games["side"] == "Blue"], games[games["side"] == "Red"]
+
+def test_scorer_matches_the_batch_pipeline(fitted_pipeline):
+    full_data, scorer, match_data = fitted_pipeline
+    blue, red = game_sides(match_data, full_data["gameid"].unique()[:200])
+    champions = [f"{role}_champion" for role in ROLES]
+    scores = scorer.score_batch(blue[champions].to_numpy(), red[champions].to_numpy(),
+                                {role: blue[f"{role}_dif"].to_numpy() for role in ROLES},
+                                {role: red[f"{role}_dif"].to_numpy() for role in ROLES})
+
+    expected = full_data.set_index(["gameid", "side"])
+    for s, (side, rows) in enumerate([("Blue", blue), ("Red", red)]):
+        pipeline_rows = expected.loc[list(zip(rows["gameid"], [side] * len(rows)))]
+        for column in ["draft_agnostic_win_prob", "post_draft_win_prob", "draft_diff",
+                       "post_draft_mid_lead_prob", "draft_agnostic_top_lead_prob"]:
+            assert np.allclose(scores[column][:, s], pipeline_rows[column].to_numpy()), column
+        assert not np.isnan(scores["post_draft_win_prob"][:, s]).any()
+
+def test_single_score_matches_the_batch(fitted_pipeline):
+    _, scorer, match_data = fitted_pipeline
+    blue, red = game_sides(match_data, match_data["gameid"].iloc[:2])
+    champions = [f"{role}_champion" for role in ROLES]
+    difs = {role: 0.5 for role in ROLES}
+    batch = scorer.score_batch(blue[champions].to_numpy(), red[champions].to_numpy(), difs)
+    single = scorer.score(blue[champions].to_numpy()[0], red[champions].to_numpy()[0], difs)
+    assert np.isclose(single["blue"]["post_draft_win_prob"], batch["post_draft_win_prob"][0, 0])
+    assert np.isclose(single["red"]["draft_diff"], batch["draft_diff"][0, 1])
+    assert np.isclose(single["blue"]["post_draft_win_prob"] + single["red"]["post_draft_win_prob"], 1)
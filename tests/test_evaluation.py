@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+import evaluation
+
+def test_bookie_is_not_differenced_with_the_models():
+    rng = np.random.default_rng(0)
+    scores = pd.DataFrame([(split, model, metric, rng.random())
+                           for split in range(5)
+                           for model in ["post_draft_win", "draft_agnostic_win", "bookie"]
+                           for metric in ["brier", "accuracy"]],
+                          columns=["split", "model", "metric", "value"])
+    summary = evaluation.summarise_scores(scores)
+    assert set(summary["model"]) == {"post_draft_win", "draft_agnostic_win", "bookie",
+                                     "post_draft_win - draft_agnostic_win"}
+
+def test_missing_scores_are_summarised_as_nan():
+    scores = pd.DataFrame([(split, model, metric, np.nan if model == "post_draft_win" else 0.25)
+                           for split in range(3)
+                           for model in ["post_draft_win", "draft_agnostic_win"]
+                           for metric in ["brier", "accuracy"]],
+                          columns=["split", "model", "metric", "value"])
+    summary = evaluation.summarise_scores(scores).set_index(["model", "metric"])
+    assert np.isnan(summary.loc[("post_draft_win", "brier"), "estimate"])
+    assert np.isnan(summary.loc[("post_draft_win - draft_agnostic_win", "brier"), "estimate"])
@@ -0,0 +1,57 @@
+import contextlib
+import io
+import warnings
+
+import numpy as np
+
+import final_model
+from design import DesignMatrixBuilder
+
+def fit_quietly(fit, *args, **kwargs):
+    with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+        warnings.simplefilter("ignore")
+        return fit(*args, **kwargs)
+
+def matchup_columns(full_data):
+    return [column for column in full_data.columns if "_v_opp_comp" in column]
+
+def test_trained_models_predict_from_match_data(fitted_pipeline):
+    full_data, _, _ = fitted_pipeline
+    models = {
+        "draft_agnostic": (fit_quietly(final_model.train_draft_agnostic_model, full_data),
+                           final_model.draft_agnostic_columns(full_data)),
+        "post_draft": (fit_quietly(final_model.train_post_draft_model, full_data,
+                                   matchup_columns(full_data), full_data),
+                       None),
+    }
+    shuffled = full_data[full_data.columns[::-1]]
+    for name, (model, names) in models.items():
+        names = names or list(model.params.index)
+        expected = model.results.predict(DesignMatrixBuilder(full_data).frame(names))
+        assert np.allclose(model.predict(full_data), expected), name
+        # Columns are selected by name, not position
+        assert np.allclose(model.predict(shuffled), expected), name
+
+def test_sparse_glm_matches_the_dense_glm(fitted_pipeline):
+    import statsmodels.api as sm
+
+    full_data, _, _ = fitted_pipeline
+    design = DesignMatrixBuilder(full_data)
+    result = full_data["result"].to_numpy(dtype=float)
+    names = final_model.post_draft_columns(full_data, matchup_columns(full_data))
+    # team_comp{j}_v_opp_comp{i} is the negation of team_comp{i}_v_opp_comp{j}, the
+    # dense solver is only well posed without those
+    full_rank = [name for name in names if not any(
+        int(factor[9]) > int(factor[-1]) for factor in name.split(":") if "_v_opp_comp" in factor)]
+
+    dense = sm.GLM(result, design.frame(full_rank), family=sm.families.Binomial()).fit()
+    sparse = final_model.fit_sparse_binomial_glm(result, design.sparse_matrix(full_rank), full_rank)
+    assert len(full_rank) < len(names)
+    assert sparse.converged and sparse.rank == len(full_rank)
+    assert np.allclose(sparse.params.to_numpy(), dense.params.to_numpy(), atol=1e-6)
+
+    # The negated columns add no fit, the minimum norm solution predicts the same
+    sparse = final_model.fit_sparse_binomial_glm(result, design.sparse_matrix(names), names)
+    assert sparse.rank == len(full_rank)
+    assert np.allclose(sparse.predict(full_data), dense.predict(design.frame(full_rank)), atol=1e-6)
+    assert np.isclose(sparse.deviance, dense.deviance)
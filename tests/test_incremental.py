@@ -0,0 +1,81 @@
+import contextlib
+import io
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import incremental
+import model_store
+from draft_model import ROLES
+from match_store import MatchStore
+from synthetic_data import random_games
+
+@pytest.fixture(scope="module")
+def stored(champion_mapping, tmp_path_factory):
+    """A store refit on 1000 games, then appended with 200 more. Returns the
+    store and bundle paths, every generated game and the appended rows"""
+    path = tmp_path_factory.mktemp("incremental")
+    store_path, bundle_path = str(path / "store"), str(path / "bundle")
+    match_data = random_games(1_400, champion_mapping, seed=3)
+    games = match_data["gameid"].astype(int)
+    with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+        warnings.simplefilter("ignore")
+        refit = incremental.update_match_store(match_data[games < 1_000], store_path,
+                                               bundle_path, refit=True, n_clusters=4)
+        appended = incremental.update_match_store(match_data[(games >= 1_000) & (games < 1_200)],
+                                                  store_path, bundle_path)
+    assert len(refit) == 2_000
+    return store_path, bundle_path, match_data, appended
+
+def test_refit_then_append_stores_every_row_once(stored):
+    store_path, bundle_path, match_data, appended = stored
+    store = MatchStore(store_path)
+    assert len(appended) == 400 and len(store) == 2_400
+    assert sorted(store.ids()) == sorted(match_data["id"].iloc[:2_400])
+    assert model_store.load_bundle(bundle_path).n_clusters == 4
+    loaded = store.load(incremental.SCORED_COLUMNS)
+    assert not loaded[[column for column in incremental.SCORED_COLUMNS
+                       if column.endswith("lead_prob")] + ["team_comp"]].isna().any().any()
+
+def test_stored_ids_are_not_added_again(stored):
+    store_path, bundle_path, match_data, _ = stored
+    games = match_data["gameid"].astype(int)
+    again = incremental.update_match_store(match_data[(games >= 900) & (games < 1_200)],
+                                           store_path, bundle_path)
+    assert len(again) == 0
+    assert len(MatchStore(store_path)) == 2_400
+
+def test_appended_rows_score_like_the_bundle_scorer(stored):
+    _, bundle_path, _, appended = stored
+    scorer = model_store.load_bundle(bundle_path).scorer()
+    games = appended.sort_values(["gameid", "side"])
+    blue, red = games[games["side"] == "Blue"], games[games["side"] == "Red"]
+    champions = [f"{role}_champion" for role in ROLES]
+    scores = scorer.score_batch(blue[champions].to_numpy(), red[champions].to_numpy(),
+                                {role: blue[f"{role}_dif"].to_numpy() for role in ROLES},
+                                {role: red[f"{role}_dif"].to_numpy() for role in ROLES})
+    for s, rows in enumerate([blue, red]):
+        assert (scores["team_comp"][:, s] == rows["team_comp"].to_numpy()).all()
+        for column in ["post_draft_mid_lead_prob", "draft_agnostic_win_prob",
+                       "post_draft_win_prob", "draft_diff"]:
+            assert np.allclose(scores[column][:, s], rows[column].to_numpy(), equal_nan=True), column
+    assert not np.isnan(scores["draft_agnostic_win_prob"]).any()
+
+def test_sides_in_different_batches_get_nan_win_probs(stored):
+    store_path, bundle_path, match_data, _ = stored
+    games = match_data["gameid"].astype(int)
+    split_game = match_data[games == 1_200]
+    first = incremental.update_match_store(
+        pd.concat([match_data[(games > 1_200) & (games < 1_210)], split_game.iloc[:1]]),
+        store_path, bundle_path)
+    second = incremental.update_match_store(split_game, store_path, bundle_path)
+
+    assert len(second) == 1
+    for rows in [first[first["gameid"] == split_game["gameid"].iloc[0]], second]:
+        assert rows[["draft_agnostic_win_prob", "post_draft_win_prob", "draft_diff"]].isna().all().all()
+        assert not rows["post_draft_mid_lead_prob"].isna().any()
+    # The games complete in the batch are scored
+    paired = first[first["gameid"] != split_game["gameid"].iloc[0]]
+    assert len(paired) == 18 and not paired["draft_agnostic_win_prob"].isna().any()
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+import instrument
+
+@instrument.stage
+def allocate(n_values):
+    return np.ones(n_values)
+
+@instrument.stage
+def pipeline_step():
+    allocate(1000)
+    return allocate(10)
+
+def test_records_have_stage_fields():
+    with instrument.recording() as recorder:
+        pipeline_step()
+    assert [record["stage"].rsplit(".", 1)[1] for record in recorder.records] == \
+        ["allocate", "allocate", "pipeline_step"]
+    assert [record["rows_out"] for record in recorder.records] == [1000, 10, 10]
+    assert recorder.records[0]["parent"].endswith("pipeline_step")
+
+def test_peaks_are_none_when_the_high_water_mark_cant_be_reset(monkeypatch):
+    monkeypatch.setattr(instrument, "_peak_resettable", None)
+    # clear_refs ignored: the high-water mark stays above the current RSS
+    monkeypatch.setattr(instrument, "memory_status", lambda: {"VmHWM": 900.0, "VmRSS": 200.0})
+    with pytest.warns(RuntimeWarning):
+        with instrument.recording() as recorder:
+            pipeline_step()
+    assert [record["peak_rss_mb"] for record in recorder.records] == [None, None, None]
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import util
+from match_store import MatchStore
+from synthetic_data import write_match_csvs
+
+def test_round_trip_keeps_values_with_store_types(match_data, tmp_path):
+    store = MatchStore(str(tmp_path))
+    store.append(match_data.iloc[:1000])
+    store.append(match_data.iloc[1000:])
+
+    loaded = MatchStore(str(tmp_path)).load()
+    assert len(loaded) == len(match_data)
+    assert list(loaded.columns) == list(match_data.columns)
+    for column in match_data.columns:
+        expected, values = match_data[column], loaded[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            assert (values.astype(str).to_numpy() == expected.astype(str).to_numpy()).all(), column
+        elif column == "date":
+            assert (values.to_numpy() == pd.to_datetime(expected).to_numpy()).all()
+        else:
+            assert np.allclose(values.to_numpy(dtype=float), expected.to_numpy(dtype=float),
+                               equal_nan=True), column
+
+def test_filters_match_the_frame(match_data, tmp_path):
+    store = MatchStore(str(tmp_path))
+    for start in range(0, len(match_data), 1000):
+        store.append(match_data.iloc[start:start + 1000])
+
+    dates = pd.to_datetime(match_data["date"])
+    expected = match_data[match_data["league"].isin(["LCS", "LEC"])
+                          & (dates >= "2021-06-01") & (dates < "2022-03-01")]
+    loaded = store.load(["id", "league"], equals={"league": ["LCS", "LEC"]},
+                        between={"date": ("2021-06-01", "2022-03-01")})
+    assert sorted(loaded["id"].tolist()) == sorted(expected["id"].tolist())
+
+def test_dates_given_as_strings_filter_by_date(match_data, tmp_path):
+    # The incremental path appends dates as they come from the CSVs
+    store = MatchStore(str(tmp_path))
+    store.append(match_data.assign(date=match_data["date"].astype(str)))
+    loaded = store.load(["date"], between={"date": ("2022-01-01", None)})
+    assert loaded["date"].dtype.kind == "M"
+    assert len(loaded) == (pd.to_datetime(match_data["date"]) >= "2022-01-01").sum()
+
+def test_reading_a_missing_store_creates_nothing(tmp_path):
+    path = str(tmp_path / "store")
+    assert len(MatchStore(path).load()) == 0
+    assert not os.path.exists(path)
+
+def test_load_match_data_types_match_with_and_without_the_store(match_data, tmp_path,
+                                                                monkeypatch):
+    os.makedirs(tmp_path / "data")
+    write_match_csvs(match_data, str(tmp_path / "data"))
+    monkeypatch.chdir(tmp_path)
+    filters = {"league": ["LCS", "LEC"], "start_date": "2021-06-01"}
+
+    from_csvs = util.load_match_data(store_path=str(tmp_path / "none"), **filters)
+    util.ingest_match_data(str(tmp_path / "store"))
+    from_store = util.load_match_data(store_path=str(tmp_path / "store"), **filters)
+    pd.testing.assert_frame_equal(from_csvs, from_store, check_categorical=False)
+
+def test_ids_come_from_the_side_file(match_data, tmp_path):
+    store = MatchStore(str(tmp_path))
+    store.append(match_data.iloc[:1000])
+    store.append(match_data.iloc[1000:])
+    assert sorted(os.listdir(tmp_path)) == ["ids-00001.npy", "manifest.json",
+                                            "part-00000", "part-00001"]
+    assert (MatchStore(str(tmp_path)).ids() == match_data["id"].to_numpy()).all()
+
+    store.replace(match_data.iloc[:10])
+    assert sorted(os.listdir(tmp_path)) == ["ids-00002.npy", "manifest.json", "part-00002"]
+    assert (MatchStore(str(tmp_path)).ids() == match_data["id"].to_numpy()[:10]).all()
@@ -0,0 +1,39 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import model_store
+from draft_model import ROLES
+
+def test_reloaded_bundle_scores_exactly_like_the_fitted_models(fitted_pipeline, tmp_path):
+    _, scorer, match_data = fitted_pipeline
+    model_store.save_bundle(str(tmp_path), scorer)
+
+    bundle = model_store.load_bundle(str(tmp_path))
+    assert bundle.n_clusters == scorer.clusters.n_clusters
+    # Only the manifest is read until a component is used
+    assert bundle._components == {}
+    bundle.clusters
+    assert list(bundle._components) == ["clusters"]
+
+    champions = match_data[[f"{role}_champion" for role in ROLES]].to_numpy()
+    blue, red = champions[0:400:2], champions[1:400:2]
+    difs = {role: np.linspace(-1, 1, len(blue)) for role in ROLES}
+    expected = scorer.score_batch(blue, red, difs)
+    actual = bundle.scorer().score_batch(blue, red, difs)
+    assert set(actual) == set(expected)
+    for key in expected:
+        assert np.array_equal(actual[key], expected[key], equal_nan=True), key
+
+def test_other_bundle_versions_are_refused(fitted_pipeline, tmp_path):
+    _, scorer, _ = fitted_pipeline
+    model_store.save_bundle(str(tmp_path), scorer)
+    manifest_path = os.path.join(str(tmp_path), "manifest.json")
+    with open(manifest_path) as manifest_file:
+        manifest = json.load(manifest_file)
+    with open(manifest_path, "w") as manifest_file:
+        json.dump(dict(manifest, version=model_store.BUNDLE_VERSION + 1), manifest_file)
+    with pytest.raises(ValueError, match="Unsupported bundle version"):
+        model_store.load_bundle(str(tmp_path))
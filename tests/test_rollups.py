@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+import model_analysis
+from rollups import DraftRollups
+
+@pytest.fixture(scope="module")
+def scored(fitted_pipeline):
+    full_data, _, _ = fitted_pipeline
+    return full_data.sort_values("date", kind="stable").reset_index(drop=True)
+
+def test_incremental_updates_match_one_update(scored, tmp_path):
+    half = len(scored) // 2
+    rollups = DraftRollups(str(tmp_path), n_clusters=4)
+    rollups.update(scored.iloc[:half])
+    # Overlapping rows are skipped
+    assert rollups.update(scored.iloc[half - 50:]) == len(scored) - half
+    once = DraftRollups(None, n_clusters=4)
+    once.update(scored)
+
+    reloaded = DraftRollups(str(tmp_path))
+    assert len(reloaded) == len(scored)
+    assert (reloaded.keys.to_numpy() == once.keys.to_numpy()).all()
+    assert np.allclose(reloaded.totals_values, once.totals_values)
+
+def test_cumulative_draft_diff_matches_groupby(scored):
+    rollups = DraftRollups(None, n_clusters=4)
+    rollups.update(scored)
+    league = scored["league"].iloc[0]
+
+    games = scored[(scored["league"] == league) & (scored["date"] >= "2022-01-01")].copy()
+    games["gamecount"] = games.groupby("teamname")["draft_diff"].cumcount()
+    games["wpa"] = games.groupby("teamname")["draft_diff"].cumsum()
+    games = games.sort_values(["teamname", "date"], kind="stable")
+
+    cumulative = rollups.cumulative_draft_diff(league, start_date="2022-01-01")
+    assert (cumulative["teamname"].to_numpy() == games["teamname"].to_numpy()).all()
+    assert (cumulative["gamecount"].to_numpy() == games["gamecount"].to_numpy()).all()
+    assert np.allclose(cumulative["wpa"].to_numpy(), games["wpa"].to_numpy(), equal_nan=True)
+
+def test_totals_and_histogram_match_groupby(scored):
+    rollups = DraftRollups(None, n_clusters=4)
+    rollups.update(scored)
+    league = scored["league"].iloc[0]
+    games = scored[scored["league"] == league]
+
+    totals = rollups.totals(league).groupby("teamname")[["games", "draft_diff"]].sum()
+    expected = games.groupby("teamname")["draft_diff"].agg(["size", "sum"])
+    assert np.allclose(totals.loc[expected.index].to_numpy(), expected.to_numpy())
+
+    histogram = rollups.cluster_histogram(league)
+    teamcomps = model_analysis.get_teamcomps_for_lcs(games.copy())
+    assert np.allclose(histogram.loc[teamcomps.index, [f"cluster_{i}" for i in teamcomps.columns]],
+                       teamcomps.to_numpy())
+
+def test_loaded_rollups_check_the_cluster_count(scored, tmp_path):
+    DraftRollups(str(tmp_path), n_clusters=4).update(scored)
+    with pytest.raises(ValueError):
+        DraftRollups(str(tmp_path), n_clusters=7)
+    with pytest.raises(ValueError):
+        DraftRollups(None, n_clusters=3).update(scored.assign(team_comp=3))
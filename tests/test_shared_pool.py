@@ -0,0 +1,62 @@
+import contextlib
+import io
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import draft_model
+import evaluation
+import player_model
+import shared_pool
+from synthetic_data import random_games
+
+def column_sums(columns):
+    return shared_pool.worker_state()[list(columns)].sum(axis=0)
+
+def as_frame(values, columns):
+    return pd.DataFrame(values, columns=columns, copy=False)
+
+def test_workers_see_the_shared_array():
+    with shared_pool.SharedArray((100, 3), order="F") as shared:
+        shared.values[:] = np.arange(300).reshape(100, 3)
+        with shared.pool(2, as_frame, ["a", "b", "c"]) as pool:
+            sums = pool.submit(column_sums, ["c", "a"]).result()
+        expected = shared.values.sum(axis=0)[[2, 0]]
+    assert np.array_equal(sums, expected)
+
+@pytest.fixture(scope="module")
+def games(champion_mapping):
+    match_data = random_games(1_000, champion_mapping, seed=4)
+    player_model.calculate_positional_differences(match_data)
+    return match_data
+
+def test_pooled_lane_models_equal_the_serial_fits(games):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        serial = {}
+        for use_draft in [False, True]:
+            _, serial[player_model.model_name(use_draft)] = player_model.fit_player_model(
+                games.copy(), use_draft, return_models=True)
+        pooled = player_model.fit_player_models(games.copy(), n_jobs=2)
+    for name, models in serial.items():
+        for lane, model in models.items():
+            assert np.array_equal(model.params.to_numpy(), pooled[name][lane].params), (name, lane)
+
+def test_pooled_cluster_sweep_equals_the_serial_sweep(games, champion_mapping):
+    drafts = draft_model.reduce_team_drafts(games, champion_mapping)
+    serial, serial_candidates = draft_model.sweep_draft_clusters(drafts, [3, 4], [0, 1], n_jobs=1)
+    pooled, candidates = draft_model.sweep_draft_clusters(drafts, [3, 4], [0, 1], n_jobs=2)
+    pd.testing.assert_frame_equal(serial, pooled)
+    for task, candidate in candidates.items():
+        assert np.array_equal(serial_candidates[task].centroids, candidate.centroids), task
+
+def test_pooled_evaluation_equals_the_serial_evaluation(games, champion_mapping):
+    def evaluate(n_jobs):
+        with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+            warnings.simplefilter("ignore")
+            return evaluation.evaluate_models(games.copy(), n_splits=2, n_clusters=3, n_jobs=n_jobs,
+                                              sparse=True, champion_mapping=champion_mapping,
+                                              bookie_path=None)
+    pd.testing.assert_frame_equal(evaluate(1), evaluate(2))
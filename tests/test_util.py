@@ -0,0 +1,65 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import util
+
+def games_frame(sides):
+    """Match rows and their team_comp from (gameid, teamname, opponent, team_comp) rows"""
+    gameids, teamnames, opponents, team_comps = zip(*sides)
+    match_data = pd.DataFrame({"id": np.arange(len(sides)), "gameid": gameids,
+                               "teamname": teamnames, "opponent": opponents,
+                               "date": "2022-01-01", "league": "LCS", "side": "Blue"})
+    for column in ["result", "bot_lead_at_15", "mid_lead_at_15", "top_lead_at_15", "elo_diff"] + \
+            [f"{name}_{lane}_lead_prob" for name in ["draft_agnostic", "post_draft"]
+             for lane in ["bot", "mid", "top"]]:
+        match_data[column] = 0.0
+    return match_data, pd.DataFrame({"id": np.arange(len(sides)), "team_comp": team_comps})
+
+def test_sides_are_paired_by_gameid_in_any_order():
+    match_data, drafts = games_frame([
+        ("g1", "A", "B", 0), ("g2", "C", "D", 2), ("g1", "B", "A", 1), ("g2", "D", "C", 2)])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        merged, columns, dropped = util.merge_team_and_draft(match_data, drafts, n_clusters=3,
+                                                             return_report=True)
+    assert len(dropped) == 0
+    merged = merged.set_index("teamname")
+    # A, comp 0, faced B, comp 1: +1 in (0, 1) and -1 in (1, 0)
+    assert merged.loc["A", "team_comp0_v_opp_comp1"] == 1
+    assert merged.loc["A", "team_comp1_v_opp_comp0"] == -1
+    assert merged.loc["B", "team_comp1_v_opp_comp0"] == 1
+    assert merged.loc["B", "team_comp0_v_opp_comp1"] == -1
+    # A mirror matchup scores +1 on the diagonal for both sides
+    assert (merged.loc[["C", "D"], "team_comp2_v_opp_comp2"] == 1).all()
+    assert (merged[columns].abs().sum(axis=1) == [2, 1, 2, 1]).all()
+
+def test_malformed_games_are_dropped_with_their_reasons():
+    match_data, drafts = games_frame([
+        ("ok", "A", "B", 0), ("ok", "B", "A", 1),
+        ("single", "C", "D", 0),
+        ("duplicate", "E", "F", 0), ("duplicate", "E", "F", 1),
+        ("itself", "G", "G", 0), ("itself", "G", "G", 1),
+        ("stranger", "H", "I", 0), ("stranger", "I", "J", 1)])
+    with pytest.warns(UserWarning, match="Dropped 4 malformed games out of 5"):
+        merged, _, dropped = util.merge_team_and_draft(match_data, drafts, n_clusters=2,
+                                                       return_report=True)
+    assert merged["gameid"].tolist() == ["ok", "ok"]
+    reasons = dropped.set_index("gameid")["reason"]
+    assert "expected 2 rows" in reasons["single"]
+    assert "duplicate teamname" in reasons["duplicate"]
+    assert "teamname equals opponent" in reasons["itself"]
+    assert "opponent not paired" in reasons["stranger"]
+
+def test_bad_games_are_the_ones_whose_matchups_dont_add_up():
+    from design import matchup_matrix
+
+    # g1 is well formed, g2 a mirror, g3 has a side with the wrong opponent comp
+    gameids = pd.Series(["g1", "g1", "g2", "g2", "g3", "g3", None])
+    team_comp = np.array([0, 1, 2, 2, 0, 1, 0])
+    opp_comp = np.array([1, 0, 2, 2, 1, 2, 1])
+    bad = util.find_bad_games(gameids, matchup_matrix(team_comp, opp_comp, 3))
+    # Rows without a gameid are never grouped, so never flagged
+    assert bad.tolist() == [False, False, False, False, True, True, False]
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import what_if
+from draft_model import ROLES
+
+DIFS = {role: 0.1 for role in ROLES}
+
+@pytest.fixture(scope="module")
+def engine(fitted_pipeline):
+    _, scorer, _ = fitted_pipeline
+    return what_if.WhatIfEngine(scorer)
+
+def brute_force(scorer, blue, red, candidates, slot):
+    """post_draft_win_prob of blue with each candidate in the blue slot"""
+    blues = np.array([blue[:slot] + [champion] + blue[slot + 1:] for champion in candidates])
+    reds = np.array([red] * len(candidates))
+    return scorer.score_batch(blues, reds, DIFS)["post_draft_win_prob"][:, 0]
+
+def test_last_pick_matches_brute_force(fitted_pipeline, engine):
+    _, scorer, _ = fitted_pipeline
+    names = list(scorer.champion_table.names)
+    blue, red = names[10:14] + [None], names[14:19]
+    picks = engine.recommend(blue, red, "blue", DIFS, top_k=1000, lookahead=False)
+
+    candidates = names[:10] + names[19:]
+    expected = dict(zip(candidates, brute_force(scorer, blue, red, candidates, 4)))
+    # Every available champion is listed once, in the class of its pick
+    assert sorted(name for pick in picks for name in pick["champions"]) == sorted(candidates)
+    for pick in picks:
+        assert pick["role"] == "sup" and pick["champion"] == pick["champions"][0]
+        assert np.allclose([expected[name] for name in pick["champions"]], pick["win_prob"])
+    assert np.isclose(picks[0]["win_prob"], max(expected.values()))
+    assert [pick["win_prob"] for pick in picks] == sorted((pick["win_prob"] for pick in picks),
+                                                         reverse=True)
+
+def test_lookahead_matches_brute_force(fitted_pipeline, engine):
+    _, scorer, _ = fitted_pipeline
+    names = list(scorer.champion_table.names)
+    blue, red = names[10:14] + [None], names[14:18] + [None]
+    picks = engine.recommend(blue, red, "blue", DIFS, top_k=1000)
+
+    available = names[:10] + names[18:]
+    after_reply = {}
+    for champion in available:
+        replies = [reply for reply in available if reply != champion]
+        blues = np.array([blue[:4] + [champion]] * len(replies))
+        reds = np.array([red[:4] + [reply] for reply in replies])
+        after_reply[champion] = scorer.score_batch(blues, reds, DIFS)["post_draft_win_prob"][:, 0].min()
+    assert np.isclose(picks[0]["win_prob_after_reply"], max(after_reply.values()))
+    for pick in picks:
+        assert np.isclose(pick["win_prob_after_reply"], after_reply[pick["champion"]])
+        assert pick["reply_role"] == "sup" and pick["reply_champion"] != pick["champion"]
+
+def test_bans_picks_and_roles_are_respected(fitted_pipeline, engine):
+    _, scorer, _ = fitted_pipeline
+    names = list(scorer.champion_table.names)
+    blue, red, bans = {"jng": names[0]}, {"top": names[1], "mid": names[2]}, names[3:20]
+    picks = engine.recommend(blue, red, "red", DIFS, bans=bans, roles=["bot", "sup", "top"],
+                             top_k=20)
+    assert len(picks) == 20
+    unavailable = set(bans) | {names[0], names[1], names[2]}
+    for pick in picks:
+        assert pick["role"] in ("bot", "sup")
+        assert not unavailable & set(pick["champions"])
+        assert pick["reply_champion"] not in unavailable | {pick["champion"]}
+        assert pick["reply_role"] != "jng"
+    assert engine.recommend(blue, red, "red", DIFS, roles=["top", "mid"]) == []
@@ -1,18 +1,64 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+import os
 import warnings
 
-def load_match_data():
+import instrument
+from design import matchup_column_names, matchup_matrix
+from match_store import MatchStore, store_types
+
+MATCH_DATA_STORE = "data/match-data"
+
+@instrument.stage
+def read_match_csvs(oracles_path="data/oracles-data.csv", player_path="data/player-diffs.csv"):
     # Original data from https://oracleselixir.com 
     # We have transformed it slightly to pivot champions played by role to each game
-    oracles_data = pd.read_csv("data/oracles-data.csv")
+    oracles_data = pd.read_csv(oracles_path)
 
     #  Differences in player model scores. Also includes data on the champion played for convenience 
-    player_model_data = pd.read_csv("data/player-diffs.csv")
+    player_model_data = pd.read_csv(player_path)
 
     return oracles_data.merge(player_model_data, how='inner', on="id")
 
+def ingest_match_data(store_path=MATCH_DATA_STORE, oracles_path="data/oracles-data.csv",
+                      player_path="data/player-diffs.csv"):
+    """Merge the two CSVs once and write the typed, columnar match store"""
+    match_data = read_match_csvs(oracles_path, player_path)
+    match_data['date'] = pd.to_datetime(match_data['date'])
+    store = MatchStore(store_path)
+    store.replace(match_data)
+    return store
+
+@instrument.stage
+def load_match_data(columns=None, league=None, start_date=None, end_date=None,
+                    store_path=MATCH_DATA_STORE):
+    """Load the merged match and player data, from the columnar store written by
+    ingest_match_data if there is one, otherwise from the two CSVs.
+
+    Only `columns` are read, and rows can be restricted to a league (or list of
+    leagues) and to start_date <= date < end_date. Both sources give the columns
+    the store's types: categorical strings, narrowed integers and datetime dates."""
+
+    equals = {} if league is None else {'league': league}
+    between = {} if start_date is None and end_date is None else {'date': (start_date, end_date)}
+
+    if os.path.exists(os.path.join(store_path, "manifest.json")):
+        return MatchStore(store_path).load(columns, equals=equals, between=between)
+
+    match_data = read_match_csvs()
+    if columns is not None:
+        match_data = match_data[list(dict.fromkeys(list(columns) + ['league', 'date']))]
+    match_data = store_types(match_data)
+    if league is not None:
+        match_data = match_data[match_data['league'].isin(np.atleast_1d(league))]
+    if start_date is not None:
+        match_data = match_data[match_data['date'] >= start_date]
+    if end_date is not None:
+        match_data = match_data[match_data['date'] < end_date]
+    if columns is not None:
+        match_data = match_data[list(columns)]
+    return match_data.reset_index(drop=True)
+
 def print_match_and_player_data(match_data):
     columns = ["teamname", "opponent", "date", "league", "result",
                "top_dif","jng_dif","mid_dif","bot_dif","sup_dif"]
@@ -42,55 +88,95 @@ def print_draft_centroids(match_drafts):
      "team_Splitpushs", "early_game", "mid_game",
      "late_game", 'no_damage_type']]
 
-def merge_team_and_draft(match_data, draft_data, n_clusters=7):
-    combined = match_data.merge(draft_data, how='inner', on='id')
+def find_bad_games(gameids, matchups):
+    """Mask of rows whose game's summed matchup columns are not all 0 or 2"""
+    from scipy import sparse
+
+    codes, uniques = pd.factorize(gameids)
+    grouped = codes >= 0
+
+    # Sum the rows of each game by multiplying with a sparse (games x rows) indicator
+    rows = np.flatnonzero(grouped)
+    game_rows = sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (codes[rows], rows)),
+                                  shape=(len(uniques), len(codes)))
+    game_sums = game_rows @ matchups.astype(np.int64)
+    bad = ((game_sums != 0) & (game_sums != 2)).any(axis=1)
+
+    # Rows without a gameid are never grouped, so never dropped
+    return grouped & bad[np.where(grouped, codes, 0)]
+
+def pair_opponents(games):
+    """Opponent composition of each row, found by joining the two sides of each
+    game on (gameid, opponent) == (gameid, teamname), so rows can be in any order.
+
+    Returns the opp_comp array, -1 where no opponent could be paired, and a frame
+    of the malformed games with the reasons they could not be paired"""
+
+    gameids = games['gameid'].to_numpy()
+    team_comp = games['team_comp'].to_numpy()
+    n_rows = len(games)
+
+    # Key each side by integer (game, team) codes and look the opponent's key up
+    game_codes, _ = pd.factorize(gameids, use_na_sentinel=False)
+    team_codes, teams = pd.factorize(np.concatenate([games['teamname'].to_numpy(),
+                                                     games['opponent'].to_numpy()]),
+                                     use_na_sentinel=False)
+    team_keys = game_codes.astype(np.int64) * len(teams) + team_codes[:n_rows]
+    opp_keys = game_codes.astype(np.int64) * len(teams) + team_codes[n_rows:]
+
+    duplicated = pd.Index(team_keys).duplicated(keep=False)
+    plays_itself = team_keys == opp_keys
+    opponent_rows = pd.Index(team_keys[~duplicated]).get_indexer(opp_keys)
+    unmatched = opponent_rows < 0
+    opp_comp = np.where(unmatched | plays_itself, -1,
+                        team_comp[~duplicated][opponent_rows]).astype(int)
+
+    game_rows = np.bincount(game_codes)[game_codes]
+    reasons = [(game_rows != 2, 'expected 2 rows'),
+               (duplicated, 'duplicate teamname'),
+               (plays_itself, 'teamname equals opponent'),
+               (unmatched, 'opponent not paired')]
+    malformed = pd.concat([pd.DataFrame({'gameid': gameids[flags], 'reason': reason})
+                           for flags, reason in reasons], ignore_index=True)
+    return opp_comp, summarise_game_reasons(malformed)
+
+def summarise_game_reasons(game_reasons):
+    """One row per gameid, joining every distinct reason it was flagged for"""
+    return game_reasons.drop_duplicates().groupby('gameid', sort=False)['reason'].agg(
+        '; '.join).reset_index()
+
+def shard_by_game(match_data, n_shards):
+    """Split match data into shards that keep both sides of every game together"""
+    shard = pd.util.hash_array(match_data['gameid'].to_numpy()) % n_shards
+    return [match_data[shard == i] for i in range(n_shards)]
+
+@instrument.stage
+def merge_team_and_draft(match_data, draft_data, n_clusters=7, return_report=False):
+    """Join the match data and team compositions, adding the signed
+    team_comp{i}_v_opp_comp{j} matchup columns. Games whose sides can't be paired
+    or whose matchups don't add up are dropped with a warning; return_report
+    also returns a frame of the dropped gameids and reasons"""
 
-    # Games are laid out as 
-    # teamname   opp
-    # team1      team2
-    # team2      team1
-    # This is a slighly hacky way to exploit this to generate a column for the 
-    # opponent composition per game 
-    combined['opp_comp_poss_1'] = combined['team_comp'].shift(1)
-    combined['opp_comp_poss_2'] = combined['team_comp'].shift(-1)
-    combined['opp_poss_1'] = combined['teamname'].shift(1)
-    combined['opp_poss_2'] = combined['teamname'].shift(-1)
-    combined['opp_comp'] = np.where(
-    combined['opp_poss_1'] == combined['opponent'],
-    combined['opp_comp_poss_1'], -1)
-    combined['opp_comp'] = np.where(
-    combined['opp_poss_2'] == combined['opponent'],
-    combined['opp_comp_poss_2'], combined['opp_comp']).astype(int)
-    
-    combined = pd.get_dummies(combined,
-                                columns=['team_comp', 'opp_comp'])
-
-    list_of_comp_diffs = []
-    for i in range(n_clusters):
-        for j in range(n_clusters):
-            list_of_comp_diffs.append(f'team_comp{i}_v_opp_comp{j}')
-            combined[f'team_comp{i}_v_opp_comp{j}'] = np.where(
-                (combined[f'team_comp_{i}'] == 1) & (
-                        combined[f'opp_comp_{j}'] == 1), 1, 0)
-            if i != j:
-                combined[f'team_comp{i}_v_opp_comp{j}'] = np.where(
-                    (combined[f'opp_comp_{i}'] == 1) & (
-                            combined[f'team_comp_{j}'] == 1), -1,
-                    combined[f'team_comp{i}_v_opp_comp{j}'])
-
-    # Cleaning some bad data in the original Oracles dataset
-
-    with warnings.catch_warnings():
-        warnings.simplefilter(action='ignore', category=FutureWarning)
-        bad_games = combined.groupby('gameid').sum()
-
-    list_of_bad_games = []
-    for i in list_of_comp_diffs:
-        for j in bad_games.index:
-            if bad_games.at[j, i] not in [0, 2]:
-                list_of_bad_games.append(j)
-    combined = combined[
-        ~combined['gameid'].isin(list_of_bad_games)]
+    combined = match_data.merge(draft_data, how='inner', on='id')
+    combined['opp_comp'], malformed = pair_opponents(combined)
+
+    list_of_comp_diffs = matchup_column_names(n_clusters)
+    matchups = matchup_matrix(combined['team_comp'].to_numpy(),
+                              combined['opp_comp'].to_numpy(), n_clusters)
+
+    # Cleaning some bad data in the original Oracles dataset.
+    # Both rows of a game should sum to 0 in every matchup column, or 2 for a mirror
+    bad_games = find_bad_games(combined['gameid'], matchups)
+    dropped = summarise_game_reasons(pd.concat([malformed, pd.DataFrame({
+        'gameid': combined['gameid'][bad_games].to_numpy(),
+        'reason': 'matchup columns do not sum to 0 or 2'})], ignore_index=True))
+    if len(dropped):
+        warnings.warn(f"Dropped {len(dropped)} malformed games out of "
+                      f"{combined['gameid'].nunique()}", stacklevel=2)
+
+    combined = pd.concat([combined, pd.DataFrame(matchups.astype(np.int64), index=combined.index,
+                                                 columns=list_of_comp_diffs)], axis=1)
+    combined = combined[~combined['gameid'].isin(dropped['gameid'])]
 
     required_columns = ["gameid", "teamname", "opponent", "date", "league", "result",
     "bot_lead_at_15", "mid_lead_at_15", "top_lead_at_15",
@@ -101,6 +187,8 @@ def merge_team_and_draft(match_data, draft_data, n_clusters=7):
         for j in range(n_clusters):
             required_columns.append(f'team_comp{i}_v_opp_comp{j}')
 
+    if return_report:
+        return combined[required_columns], list_of_comp_diffs, dropped
     return combined[required_columns], list_of_comp_diffs
 
 def print_win_prob_model_outputs(match_data):
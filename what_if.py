@@ -0,0 +1,132 @@
+import numpy as np
+
+from draft_model import ROLES, ChampionTable
+from draft_scorer import DraftScorer
+
+OPEN = None
+SIDES = ["blue", "red"]
+
+class WhatIfEngine:
+    """Ranks the champions left in champion select by how much each one moves the
+    picking side's post_draft_win_prob.
+
+    Every (champion, open role) candidate is scored in one batch through the
+    fitted lane and win models of a DraftScorer. Roles not picked yet contribute
+    nothing to the reduced draft or the champion diffs. With lookahead, the
+    top_k candidates are expanded with every reply of the other side, also in
+    one batch, and re-ranked by the win probability after the other side's best
+    reply. Champions with the same feature row are interchangeable, so candidates
+    and replies are (class, role) pairs until the output lists each class's champions.
+    """
+    def __init__(self, scorer):
+        # Roles not picked yet are the table's open code, which adds nothing to a draft
+        self.champion_table = ChampionTable(scorer.champion_table.champions, open_slot=True)
+        self.open_code = self.champion_table.open_code
+        self.scorer = DraftScorer(self.champion_table, scorer.lane_models, scorer.clusters,
+                                  scorer.win_models)
+
+    def encode_lineup(self, lineup):
+        """Codes of a lineup given as {role: champion} or a list in ROLES order,
+        with None (or a missing role) for roles not picked yet"""
+        if isinstance(lineup, dict):
+            lineup = [lineup.get(role, OPEN) for role in ROLES]
+        codes = np.full(len(ROLES), self.open_code)
+        picked = [slot for slot, champion in enumerate(lineup) if champion is not OPEN]
+        if picked:
+            codes[picked] = self.champion_table.encode([lineup[slot] for slot in picked])
+        return codes
+
+    def champion_classes(self, available):
+        """Champions with the same feature row score the same, so candidates are
+        scored once per class. Returns a representative of each class and the
+        class of every available champion"""
+        _, first, classes = np.unique(self.champion_table.features[available], axis=0,
+                                      return_index=True, return_inverse=True)
+        return available[first], classes.ravel()
+
+    def open_roles(self, lineup, roles=None):
+        return [slot for slot, code in enumerate(lineup) if code == self.open_code
+                and (roles is None or ROLES[slot] in roles)]
+
+    def candidates(self, lineup, champions, slots):
+        """The lineup with each of the slots filled by each of the champions,
+        champion-major"""
+        lineups = np.tile(lineup, (len(champions) * len(slots), 1))
+        lineups[np.arange(len(lineups)), np.tile(slots, len(champions))] = \
+            np.repeat(champions, len(slots))
+        return lineups
+
+    def win_prob(self, side, team, opp, difs):
+        """post_draft_win_prob of `side` for each row of team (that side) and opp"""
+        blue, red = (team, opp) if side == "blue" else (opp, team)
+        scores = self.scorer.score_batch(blue, red, difs["blue"], difs["red"])
+        return scores["post_draft_win_prob"][:, SIDES.index(side)]
+
+    def recommend(self, blue, red, side, blue_difs, red_difs=None, bans=(), roles=None,
+                  top_k=10, lookahead=True):
+        """Rank the picks available to `side`.
+
+        blue, red: the picks so far, {role: champion} or lists in ROLES order with None
+        blue_difs, red_difs: the player *_dif values of each role, red defaults to -blue
+        roles: only fill these open roles of the picking side
+        Returns the top_k picks as dictionaries, best first, with the win probability
+        and its change from the current draft and, with lookahead, the other side's
+        best reply and the win probability after it. Each pick is a class of
+        interchangeable champions: champion is the first of them and champions
+        lists them all."""
+        codes = {"blue": self.encode_lineup(blue), "red": self.encode_lineup(red)}
+        difs = {"blue": {pos: float(blue_difs[pos]) for pos in ROLES}}
+        difs["red"] = {pos: -difs["blue"][pos] for pos in ROLES} if red_difs is None else \
+            {pos: float(red_difs[pos]) for pos in ROLES}
+        other = SIDES[1 - SIDES.index(side)]
+
+        taken = np.concatenate([codes["blue"], codes["red"],
+                                self.champion_table.encode(list(bans)) if bans else []])
+        available = np.setdiff1d(np.arange(self.open_code), taken)
+        slots = self.open_roles(codes[side], roles)
+        if not slots or not len(available):
+            return []
+
+        # One row per (class, open role), with the current draft as row 0 of the batch
+        representatives, classes = self.champion_classes(available)
+        team = np.vstack([codes[side], self.candidates(codes[side], representatives, slots)])
+        win_probs = self.win_prob(side, team, np.tile(codes[other], (len(team), 1)), difs)
+        current, win_probs = win_probs[0], win_probs[1:]
+
+        # Ranked and pruned over (class, role) candidates, row k being class
+        # k // len(slots) in role k % len(slots)
+        best = np.argsort(-win_probs, kind="stable")[:top_k]
+        names = self.champion_table.names
+        picks = [{"champion": names[representatives[k // len(slots)]],
+                  "champions": [names[code] for code in available[classes == k // len(slots)]],
+                  "role": ROLES[slots[k % len(slots)]],
+                  "win_prob": float(win_probs[k]), "delta": float(win_probs[k] - current)}
+                 for k in best]
+        reply_slots = self.open_roles(codes[other])
+        if not lookahead or not reply_slots or len(available) < 2:
+            return picks
+
+        # Every reply class of the other side to each of the top_k picks, in one batch
+        teams, replies, reply_champions, parents = [], [], [], []
+        for pick, k in enumerate(best):
+            champion = representatives[k // len(slots)]
+            team = codes[side].copy()
+            team[slots[k % len(slots)]] = champion
+            reply_classes, _ = self.champion_classes(available[available != champion])
+            replies.append(self.candidates(codes[other], reply_classes, reply_slots))
+            reply_champions.append(np.repeat(reply_classes, len(reply_slots)))
+            teams.append(np.tile(team, (len(replies[-1]), 1)))
+            parents.append(np.full(len(replies[-1]), pick))
+        parents = np.concatenate(parents)
+        reply_champions = np.concatenate(reply_champions)
+        reply_roles = np.tile(reply_slots, len(reply_champions) // len(reply_slots))
+
+        after_reply = self.win_prob(side, np.vstack(teams), np.vstack(replies), difs)
+        for pick in range(len(picks)):
+            rows = np.flatnonzero(parents == pick)
+            worst = rows[after_reply[rows].argmin()]
+            picks[pick].update({
+                "reply_champion": names[reply_champions[worst]],
+                "reply_role": ROLES[reply_roles[worst]],
+                "win_prob_after_reply": float(after_reply[worst])})
+        return sorted(picks, key=lambda pick: -pick["win_prob_after_reply"])